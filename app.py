@@ -1,13 +1,17 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, send_file, abort, jsonify
 from werkzeug.utils import secure_filename
-from openpyxl import load_workbook
-import os, time, base64, re
+import os, stat, time, base64, json
+import click
 
 from db import (
     sp_equipo_upsert,
     sp_equipo_agregar_cambio,
-    sp_historial_por_persona,
     query_dispositivos,
+    query_dispositivos_pagina,
+    query_bajas_pagina,
+    iter_bajas,
+    iter_dispositivos,
+    iter_historial,
     historial_por_equipo,
     sp_equipo_reasignar,
     sp_equipo_dar_baja,
@@ -15,19 +19,184 @@ from db import (
     obtener_equipo_por_tag,
     archivo_principal_get,
     archivo_principal_set,
+    equipo_completo,
+    pool_stats,
+    cache_stats,
+    al_escribir,
+    equipos_para_busqueda,
+    personas_para_busqueda,
+    equipos_por_persona,
+    resumen_historial_personas,
+    equipo_agregar_cambios_lote,
+    equipos_reasignar_lote,
+    equipos_dar_baja_lote,
 )
+from share_index import ShareIndex, ShareNoDisponible
+from search_index import SearchIndex
+from personas import VistaPersonas
+from autofill import xlsx_to_grid, extraer_datos
+from autofill_cache import AutofillCache
+from espejo import EspejoLocal
+from miniaturas import Miniaturas
+from subidas import Subidas, SubidaError, SubidaDesconocida, DemasiadoGrande, OffsetIncorrecto
+import miniaturas as vistas_previas
+import importer
+from share_watcher import ShareWatcher
+from share_io import ShareIO, ShareIOError, CircuitBreaker
+import registro
+import metricas
+import exportar
+import condicional
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'cambia_esto_mel'
 app.url_map.strict_slashes = False
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
 app.config['ENABLE_UPLOAD'] = False
+app.config['PAGE_SIZE'] = 50       # filas por página en el listado de equipos
+app.config['PAGE_SIZE_MAX'] = 200
+app.config['EXPORT_CHUNK'] = int(os.getenv('EXPORT_CHUNK', '1000'))  # filas por fetchmany al exportar
+app.config['BULK_MAX'] = 5000      # registros por petición en las APIs masivas
+app.config['BULK_BATCH'] = 100     # equipos por transacción en reasignación/baja masiva
+app.config['IMPORT_MAX_WORKERS'] = os.cpu_count() or 1   # procesos máximos de /admin/import
+
+# Cache-Control por endpoint (ver condicional.py). 'no-cache' = revalidar siempre con el ETag.
+app.config['CACHE_CONTROL'] = {
+    'index': 'private, no-cache',
+    'device_view': 'private, no-cache',
+    'device_files': 'private, no-cache',
+    'device_principal_download': 'private, no-cache',
+    # la URL incluye el nombre del archivo: puede reusarse un rato sin preguntar
+    'device_download': 'private, max-age=60, must-revalidate',
+    # /preview/<token>?v=<tamaño-mtime>: la versión va en la URL
+    'preview': 'private, max-age=86400, immutable',
+}
+
+# Logging: nivel, JSON por línea y muestreo de DEBUG por petición (ver registro.py)
+app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO')
+app.config['LOG_JSON'] = os.getenv('LOG_JSON', '1') == '1'
+app.config['LOG_DEBUG_SAMPLE'] = float(os.getenv('LOG_DEBUG_SAMPLE', '1.0'))
+app.config['LOG_ACCESS'] = os.getenv('LOG_ACCESS', '1') == '1'
+registro.instalar(app, debug_sample=app.config['LOG_DEBUG_SAMPLE'], access_log=app.config['LOG_ACCESS'])
+
+
+def configurar_registro():
+    """
+    Handler del logger raíz (ver registro.configurar). No se llama al
+    importar: importar app desde una prueba o un comando no cambia el logging
+    del proceso. Lo llaman __main__ y la primera petición, si nadie lo
+    configuró antes.
+    """
+    registro.configurar(app.config['LOG_LEVEL'], json_lines=app.config['LOG_JSON'])
+
+# Tiempos por ruta, SQL y share: /metrics (Prometheus), Server-Timing y /_lentas (ver metricas.py)
+app.config['METRICS_SLOW_MS'] = float(os.getenv('METRICS_SLOW_MS', '500'))
+app.config['METRICS_SERVER_TIMING'] = os.getenv('METRICS_SERVER_TIMING', '1') == '1'
+peticiones_lentas = metricas.instalar(app, lenta_ms=app.config['METRICS_SLOW_MS'],
+                                      server_timing=app.config['METRICS_SERVER_TIMING'])
 
 SHARE_ROOT = r'\\itzamna\DATAUSERS\ADM Y SISTEMAS\Entrega Equipos'
 UPLOAD_ROOT = r'\\itzamna\DATAUSERS\ADM Y SISTEMAS\Entrega Equipos'
 
 ALLOWED_EXTS = {'pdf', 'jpg', 'jpeg', 'png', 'xlsx', 'xls'}
 
+# Índice local de archivos del share (ver share_index.py)
+app.config['SHARE_INDEX_PATH'] = os.getenv(
+    'SHARE_INDEX_PATH', os.path.join(app.instance_path, 'share_index.sqlite3'))
+share_index = ShareIndex(SHARE_ROOT, app.config['SHARE_INDEX_PATH'], exts=ALLOWED_EXTS)
+
+# Barrido periódico del share en segundo plano (0 = desactivado)
+app.config['SHARE_WATCH_INTERVAL'] = float(os.getenv('SHARE_WATCH_INTERVAL', '300'))
+app.config['SHARE_WATCH_WORKERS'] = int(os.getenv('SHARE_WATCH_WORKERS', '8'))
+# cada cuántos barridos uno completo (ediciones en sitio de archivos); 0 = nunca
+app.config['SHARE_WATCH_FULL_EVERY'] = int(os.getenv('SHARE_WATCH_FULL_EVERY', '12'))
+share_watcher = ShareWatcher(share_index,
+                             interval=app.config['SHARE_WATCH_INTERVAL'],
+                             workers=app.config['SHARE_WATCH_WORKERS'],
+                             full_every=app.config['SHARE_WATCH_FULL_EVERY'],
+                             logger=app.logger)
+
+# Buscador/typeahead en memoria; las escrituras de db.py marcan los tags a releer
+search_index = SearchIndex(equipos_para_busqueda, personas_para_busqueda)
+al_escribir(search_index.marcar)
+
+# Persona -> equipos actuales y resumen de historial, en memoria (ver personas.py)
+vista_personas = VistaPersonas(equipos_por_persona, resumen_historial_personas)
+al_escribir(vista_personas.marcar)
+
+# I/O contra el share fuera del hilo de la petición, con plazo y circuito (ver share_io.py)
+app.config['SHARE_IO_WORKERS'] = int(os.getenv('SHARE_IO_WORKERS', '16'))
+app.config['SHARE_IO_TIMEOUT'] = float(os.getenv('SHARE_IO_TIMEOUT', '5'))
+app.config['SHARE_IO_FAILURES'] = int(os.getenv('SHARE_IO_FAILURES', '5'))
+app.config['SHARE_IO_RESET'] = float(os.getenv('SHARE_IO_RESET', '30'))
+share_io = ShareIO(workers=app.config['SHARE_IO_WORKERS'],
+                   timeout=app.config['SHARE_IO_TIMEOUT'],
+                   breaker=CircuitBreaker(threshold=app.config['SHARE_IO_FAILURES'],
+                                          reset_timeout=app.config['SHARE_IO_RESET']),
+                   logger=app.logger)
+metricas.REGISTRO.medidor("share_io_pending", "Operaciones contra el share en curso.",
+                          lambda: share_io.stats()["pending"])
+metricas.REGISTRO.medidor("share_io_circuit_open", "1 si el circuito del share está abierto.",
+                          lambda: int(share_io.breaker.state != "closed"))
+
+# Resultados del autollenado ya extraídos, por (ruta, tamaño, mtime) (ver autofill_cache.py)
+app.config['AUTOFILL_CACHE_PATH'] = os.getenv(
+    'AUTOFILL_CACHE_PATH', os.path.join(app.instance_path, 'autofill_cache.sqlite3'))
+app.config['AUTOFILL_CACHE_MAX'] = int(os.getenv('AUTOFILL_CACHE_MAX', '5000'))
+app.config['AUTOFILL_CACHE_HASH'] = os.getenv('AUTOFILL_CACHE_HASH', '0') == '1'
+autofill_cache = AutofillCache(app.config['AUTOFILL_CACHE_PATH'],
+                               max_entries=app.config['AUTOFILL_CACHE_MAX'],
+                               use_hash=app.config['AUTOFILL_CACHE_HASH'],
+                               share_io=share_io)
+
+
+# Copia local de los archivos principales, por (ruta, tamaño, mtime) (ver espejo.py)
+app.config['MIRROR_ENABLED'] = os.getenv('MIRROR_ENABLED', '1') == '1'
+app.config['MIRROR_DIR'] = os.getenv('MIRROR_DIR', os.path.join(app.instance_path, 'espejo'))
+app.config['MIRROR_MAX_MB'] = float(os.getenv('MIRROR_MAX_MB', '1024'))
+espejo = None
+if app.config['MIRROR_ENABLED']:
+    espejo = EspejoLocal(app.config['MIRROR_DIR'], max_bytes=int(app.config['MIRROR_MAX_MB'] * 1024 * 1024),
+                         share_io=share_io)
+    metricas.REGISTRO.medidor("mirror_bytes", "Bytes en el espejo local de archivos principales.",
+                              lambda: espejo.stats()["bytes"])
+    metricas.REGISTRO.medidor("mirror_bytes_saved", "Bytes servidos desde el espejo en lugar del share.",
+                              lambda: espejo.stats()["bytes_saved"])
+
+    @al_escribir
+    def _espejar_principal(tag, *grupos):
+        # Archivo principal recién vinculado: copiarlo antes de que lo pidan.
+        # La ruta se resuelve en el hilo del espejo (la caché ya se invalidó).
+        if 'principal' in grupos:
+            espejo.prefetch(lambda: (archivo_principal_get(tag) or {}).get('ruta'))
+
+
+# Vistas previas de los archivos vinculados, por (ruta, tamaño, mtime) (ver miniaturas.py)
+app.config['PREVIEW_ENABLED'] = os.getenv('PREVIEW_ENABLED', '1') == '1'
+app.config['PREVIEW_DIR'] = os.getenv('PREVIEW_DIR', os.path.join(app.instance_path, 'previews'))
+app.config['PREVIEW_MAX_MB'] = float(os.getenv('PREVIEW_MAX_MB', '64'))
+app.config['PREVIEW_WORKERS'] = int(os.getenv('PREVIEW_WORKERS', '2'))
+miniaturas = None
+if app.config['PREVIEW_ENABLED']:
+    miniaturas = Miniaturas(app.config['PREVIEW_DIR'], share_io=share_io, espejo=espejo,
+                            max_bytes=int(app.config['PREVIEW_MAX_MB'] * 1024 * 1024),
+                            workers=app.config['PREVIEW_WORKERS'])
+    metricas.REGISTRO.medidor("preview_in_flight", "Vistas previas en cola o generándose.",
+                              lambda: miniaturas.stats()["in_flight"])
+
+
+# Subidas: staging local + copia al share en segundo plano (ver subidas.py)
+app.config['UPLOAD_STAGING_DIR'] = os.getenv('UPLOAD_STAGING_DIR', os.path.join(app.instance_path, 'subidas'))
+app.config['UPLOAD_DB_PATH'] = os.getenv('UPLOAD_DB_PATH', os.path.join(app.instance_path, 'subidas.sqlite3'))
+app.config['UPLOAD_MAX_MB'] = float(os.getenv('UPLOAD_MAX_MB', '5'))              # formulario
+app.config['UPLOAD_CHUNKED_MAX_MB'] = float(os.getenv('UPLOAD_CHUNKED_MAX_MB', '200'))  # reanudable
+app.config['UPLOAD_CHUNK_MB'] = float(os.getenv('UPLOAD_CHUNK_MB', '8'))          # tramo sugerido (< MAX_CONTENT_LENGTH)
+app.config['UPLOAD_RETRIES'] = int(os.getenv('UPLOAD_RETRIES', '5'))
+subidas = Subidas(app.config['UPLOAD_STAGING_DIR'], UPLOAD_ROOT, app.config['UPLOAD_DB_PATH'],
+                  fs=share_io.fs, al_terminar=archivo_principal_set,
+                  max_bytes=int(app.config['UPLOAD_CHUNKED_MAX_MB'] * 1024 * 1024),
+                  reintentos=app.config['UPLOAD_RETRIES'])
+
 
 def _allowed(name: str) -> bool:
     return '.' in name and name.rsplit('.', 1)[-1].lower() in ALLOWED_EXTS
@@ -52,104 +221,235 @@ def _decode_path(tok: str) -> str:
     return base64.urlsafe_b64decode(tok.encode('ascii')).decode('utf-8')
 
 
+def _encode_cursor(pos):
+    if not pos:
+        return ''
+    return base64.urlsafe_b64encode(json.dumps(list(pos)).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(tok: str):
+    if not tok:
+        return None
+    try:
+        tag, eid = json.loads(base64.urlsafe_b64decode(tok.encode('ascii')).decode('utf-8'))
+        return (str(tag), int(eid))
+    except Exception:
+        return None
+
+
+def _page_size():
+    try:
+        n = int(request.args.get('page_size') or app.config['PAGE_SIZE'])
+    except ValueError:
+        n = app.config['PAGE_SIZE']
+    return max(1, min(n, app.config['PAGE_SIZE_MAX']))
+
+
+def _pagina_dispositivos():
+    """Lee filtros y cursores (after/before) del query string y trae una página."""
+    q = request.args.get('q', '').strip()
+    person = request.args.get('person', '').strip()
+    pagina = query_dispositivos_pagina(
+        filtro_tag=q or None,
+        filtro_persona=person or None,
+        solo_activos=True,
+        despues=_decode_cursor(request.args.get('after', '')),
+        antes=_decode_cursor(request.args.get('before', '')),
+        limite=_page_size(),
+    )
+    return q, person, pagina
+
+
+def _vista_previa(path, size=None, mtime=None):
+    """
+    Datos para mostrar la vista previa de `path` en un template: ícono y,
+    si se genera vista previa para ese tipo, la URL (con la versión si se
+    conocen tamaño y mtime). No toca el share.
+    """
+    tipo = vistas_previas.tipo(path) if miniaturas else None
+    url = None
+    if tipo:
+        v = vistas_previas.version(size, mtime) if size is not None and mtime is not None else None
+        url = url_for('preview', token=_encode_path(path), v=v)
+    return {'url': url, 'tipo': tipo, 'icono': vistas_previas.icono(path)}
+
+
+def _candidatos_por_nombre(tag: str):
+    """
+    Sin índice todavía: stat en paralelo de los nombres que usa la subida
+    (<TAG>.<ext> en SHARE_ROOT y UPLOAD_ROOT). Acotado por share_io; el
+    índice completo lo arma el watcher (o /admin/import), nunca la petición.
+    """
+    if not tag or os.path.basename(tag) != tag:
+        return []
+    rutas = [os.path.join(raiz, f"{tag}.{ext}") for raiz in (SHARE_ROOT, UPLOAD_ROOT) for ext in sorted(ALLOWED_EXTS)]
+    try:
+        vivos = share_io.stat_many(rutas)
+    except ShareIOError:
+        return []
+    return [{"name": os.path.basename(p), "path": p, "size": st.st_size, "mtime": st.st_mtime}
+            for p, st in vivos.items() if st is not None]
+
+
+def _indexados_por_tag(tag: str):
+    """Entradas del índice del share cuyo nombre contiene el tag. Solo memoria."""
+    return [f for f in share_index.search((tag or '').lower()) if _allowed(f["name"])]
+
+
 def _scan_files_for_tag(tag: str):
+    """Busca archivos del share cuyo nombre contiene el tag, usando el índice local."""
     out = []
     tag_l = (tag or '').lower()
-    if not tag_l or not os.path.isdir(SHARE_ROOT):
+    if not tag_l:
         return out
-    for root, _, files in os.walk(SHARE_ROOT):
-        for nm in files:
-            if tag_l in nm.lower() and _allowed(nm):
-                full = os.path.join(root, nm)
-                try:
-                    size = os.path.getsize(full)
-                    mtime = time.strftime('%Y-%m-%d %H:%M', time.localtime(os.path.getmtime(full)))
-                except OSError:
-                    continue
-                out.append({"name": nm, "path": full, "size": size, "mtime": mtime, "token": _encode_path(full)})
+    if not share_index.built:
+        encontrados, vivos = _candidatos_por_nombre(tag.strip()), {}
+    else:
+        encontrados = _indexados_por_tag(tag_l)
+        # El índice puede tener hasta un barrido de atraso: confirmar con un stat
+        # en paralelo; lo que no responde a tiempo se muestra con el dato del índice
+        try:
+            vivos = share_io.stat_many([f["path"] for f in encontrados])
+        except ShareIOError:
+            vivos = {}
+    for f in encontrados:
+        if f["path"] in vivos:
+            st = vivos[f["path"]]
+            if st is None:
+                continue
+            f = dict(f, size=st.st_size, mtime=st.st_mtime)
+        mtime = time.strftime('%Y-%m-%d %H:%M', time.localtime(f["mtime"]))
+        out.append({"name": f["name"], "path": f["path"], "size": f["size"], "mtime": mtime,
+                    "token": _encode_path(f["path"]),
+                    "preview": _vista_previa(f["path"], f["size"], f["mtime"])})
     out.sort(key=lambda x: (x["mtime"], x["name"]), reverse=True)
     return out
 
 
+def _send_share_file(path, download_name):
+    """
+    send_file de un archivo del share: stat y open en share_io, con plazo.
+    Con el ETag del stat, si el navegador ya lo tiene se responde 304 sin
+    abrirlo; un Range (visor de PDF, descarga reanudada) lee solo ese tramo.
+    Si hay copia vigente en el espejo local se entrega esa (ver espejo.py).
+    """
+    st = share_io.stat(path) if path else None
+    if st is None or not stat.S_ISREG(st.st_mode):
+        abort(404)
+    etag = condicional.etag_archivo(path, st)
+    if condicional.ya_lo_tiene(etag):
+        return condicional.no_modificado(etag, st.st_mtime)
+    rv = None
+    local = espejo.local(path, st) if espejo else None
+    if local:
+        try:
+            rv = send_file(local, as_attachment=True, download_name=download_name, last_modified=st.st_mtime,
+                           etag=etag, conditional=False)
+        except FileNotFoundError:
+            pass   # el LRU la descartó recién: se lee del share
+        else:
+            rango = request.range.range_for_length(st.st_size) if request.range else None
+            espejo.servido(rango[1] - rango[0] if rango else st.st_size)
+    if rv is None:
+        f = share_io.open(path)
+        if espejo:
+            if request.range:
+                espejo.prefetch(path)
+            else:
+                f = espejo.tee(path, st, f)
+        # send_file no sabe el tamaño de un archivo abierto: ETag, Range e
+        # If-Modified-Since se resuelven aquí con el del stat
+        rv = send_file(f, as_attachment=True, download_name=download_name, last_modified=st.st_mtime,
+                       etag=etag, conditional=False)
+    rv.content_length = st.st_size
+    rv.headers['Cache-Control'] = condicional.politica()
+    return rv.make_conditional(request, accept_ranges=True, complete_length=st.st_size)
+
+
 def save_equipo_file_principal(tag: str, file_storage):
+    """
+    Recibe el archivo al staging local (hash y límite mientras se lee) y
+    encola la copia al share; se vincula como principal cuando la copia
+    termina. Devuelve (id de la subida, None) o (None, error).
+    """
     if not file_storage or not file_storage.filename:
         return None, "Archivo vacío."
     fname = secure_filename(file_storage.filename)
     if not _allowed(fname):
         return None, "Tipo de archivo no permitido."
-
-    _ensure_dir(UPLOAD_ROOT)
-    ext = os.path.splitext(fname)[1].lower()
-    stored = f"{tag}{ext}"
-    path = os.path.join(UPLOAD_ROOT, stored)
-
     try:
-        file_storage.stream.seek(0, os.SEEK_END)
-        size = file_storage.stream.tell()
-        file_storage.stream.seek(0)
-    except Exception:
-        size = None
-    if size is not None and size > 5 * 1024 * 1024:
-        return None, "Máximo 5MB por archivo."
-
-    file_storage.save(path)
-    archivo_principal_set(tag, path, stored)
-    return stored, None
-
-
-# ---------- Helpers para autollenado desde Excel ----------
-def _xlsx_to_grid(path):
-    wb = load_workbook(path, data_only=True)
-    ws = wb.active
-    grid = []
-    for r in ws.iter_rows(values_only=True):
-        row = []
-        for v in r:
-            s = '' if v is None else str(v).strip()
-            row.append(s)
-        grid.append(row)
-    return grid
-
-
-def _find_cell(grid, needle):
-    n = (needle or '').lower()
-    for r, row in enumerate(grid):
-        for c, val in enumerate(row):
-            if n in (val or '').lower():
-                return (r, c)
-    return None
-
-
-def _safe_get(grid, r, c):
-    try:
-        return grid[r][c]
-    except Exception:
-        return ''
+        res = subidas.subir(tag, fname, file_storage.stream,
+                            max_bytes=int(app.config['UPLOAD_MAX_MB'] * 1024 * 1024))
+    except SubidaError as e:
+        return None, str(e)
+    return res['id'], None
 
 
-def _truthy(s):
-    s = (s or '').strip().lower()
-    return s in {'✔', 'si', 'sí', 'true', '1', 'x'}
+# =========================
+# RUTAS
+# =========================
+_subidas_reanudadas = False
 
 
-def _extract_tag_from_text(text):
-    m = re.search(r'(?i)\bactivo\b\s*[:#-]?\s*([A-Za-z0-9\-]+)', text or '')
-    return m.group(1).strip() if m else ''
+@app.before_request
+def _start_background_workers():
+    # Se arranca con la primera petición (no al importar) para que los comandos
+    # CLI y el proceso padre del reloader no lancen hilos.
+    if not registro.configurado():   # salvo que ya lo haya hecho quien nos corre (carga.py)
+        configurar_registro()
+    if app.config['SHARE_WATCH_INTERVAL'] > 0 and not share_watcher.running:
+        share_watcher.start()
+    global _subidas_reanudadas
+    if not _subidas_reanudadas:
+        _subidas_reanudadas = True
+        subidas.reanudar()
 
 
-# =========================
-# RUTAS
-# =========================
 @app.route('/')
 def index():
+    q, person, pagina = _pagina_dispositivos()
+    version = (q, person, _page_size(), tuple(map(tuple, pagina['rows'])), pagina['siguiente'], pagina['anterior'])
+    return condicional.pagina(version, lambda: render_template(
+        'index.html',
+        dispositivos=pagina['rows'],
+        q=q,
+        person=person,
+        page_size=_page_size(),
+        next_cursor=_encode_cursor(pagina['siguiente']),
+        prev_cursor=_encode_cursor(pagina['anterior']),
+    ))
+
+
+@app.get('/api/dispositivos')
+def api_dispositivos():
+    """Misma página que index en JSON, para cargar más filas sin recargar."""
+    q, person, pagina = _pagina_dispositivos()
+    campos = ('tag', 'modelo', 'serial', 'ubicacion', 'personaasignada', 'estado')
+    return jsonify({
+        "ok": True,
+        "rows": [{k: r.get(k) for k in campos} for r in pagina['rows']],
+        "next": _encode_cursor(pagina['siguiente']) or None,
+        "prev": _encode_cursor(pagina['anterior']) or None,
+    })
+
+
+# --- Búsqueda (typeahead sobre el índice en memoria, ver search_index.py) ---
+@app.get('/api/buscar')
+def api_buscar():
+    """Typeahead: ?q=texto[&tipo=equipo|persona][&limit=10]"""
     q = request.args.get('q', '').strip()
-    person = request.args.get('person', '').strip()
-    dispositivos = query_dispositivos(
-        filtro_tag=q or None,
-        filtro_persona=person or None,
-        solo_activos=True
-    )
-    return render_template('index.html', dispositivos=dispositivos, q=q, person=person)
+    tipo = request.args.get('tipo') or None
+    try:
+        limit = max(1, min(int(request.args.get('limit') or 10), 50))
+    except ValueError:
+        limit = 10
+    t0 = time.perf_counter()
+    resultados = search_index.search(q, limit=limit, tipo=tipo) if q else []
+    for r in resultados:
+        if r['tipo'] == 'equipo':
+            r['url'] = url_for('device_view', tag=r['tag'])
+    return jsonify({"ok": True, "q": q, "resultados": resultados,
+                    "ms": round((time.perf_counter() - t0) * 1000, 2)})
 
 
 # --- Nuevo equipo (con vínculo/subida del archivo principal opcional) ---
@@ -195,7 +495,7 @@ def new_device():
         if ruta_manual:
             if not _is_inside(ruta_manual, SHARE_ROOT):
                 flash('La ruta pegada no pertenece a la carpeta de red configurada.', 'danger')
-            elif not os.path.isfile(ruta_manual):
+            elif not share_io.isfile(ruta_manual):
                 flash('La ruta pegada no existe como archivo.', 'danger')
             elif not _allowed(os.path.basename(ruta_manual)):
                 flash('Extensión de archivo no permitida.', 'danger')
@@ -207,7 +507,7 @@ def new_device():
             if err:
                 flash(f'Archivo no subido: {err}', 'danger')
             else:
-                flash('Archivo principal subido y vinculado.', 'success')
+                flash('Archivo recibido; se vinculará como principal al terminar de copiarse a la red.', 'success')
 
         flash('Equipo registrado/actualizado', 'success')
         return redirect(url_for('index'))
@@ -223,178 +523,22 @@ def new_autofill_from_path():
         return {"ok": False, "error": "No enviaste la ruta."}, 400
     if not _is_inside(ruta, SHARE_ROOT):
         return {"ok": False, "error": "La ruta no pertenece a la carpeta de red configurada."}, 400
-    if not os.path.isfile(ruta):
+    # un solo stat (con plazo, vía share_io) que también valida la caché
+    st = share_io.stat(ruta)
+    if st is None or not stat.S_ISREG(st.st_mode):
         return {"ok": False, "error": "La ruta no existe como archivo."}, 404
     if not ruta.lower().endswith(('.xlsx', '.xls')):
         return {"ok": False, "error": "Solo se admite Excel (.xlsx/.xls) para autollenar."}, 400
 
+    t0 = time.perf_counter()
     try:
-        grid = _xlsx_to_grid(ruta)
+        data, cached = autofill_cache.get_or_extract(
+            ruta, lambda p: extraer_datos(xlsx_to_grid(p)), st=st)
     except Exception as e:
         return {"ok": False, "error": f"No pude leer el Excel: {e}"}, 400
 
-    # debug en servidor para ver el contenido (opcional)
-    print("\n=== CONTENIDO DEL EXCEL (primeras 30 filas) ===")
-    for i, row in enumerate(grid[:30]):
-        print(f"Fila {i}: {row}")
-    print("=" * 50 + "\n")
-
-    def find_cell(needle):
-        pos = _find_cell(grid, needle)
-        print(f"[DEBUG] Buscando '{needle}': {pos}")
-        return pos
-
-    def get(r, c):
-        return _safe_get(grid, r, c)
-
-    def col_of(header, header_row):
-        h = header.lower()
-        for c, val in enumerate(grid[header_row]):
-            if h in (val or '').lower():
-                return c
-        return None
-
-    def first_below(col, header_row, max_down=6):
-        for r in range(header_row + 1, min(header_row + 1 + max_down, len(grid))):
-            txt = get(r, col)
-            if txt:
-                return txt
-        return ''
-
-    def first_right(row, start_c, max_right=10):
-        if row < 0 or row >= len(grid):
-            return ''
-        for cc in range(start_c + 1, min(start_c + 1 + max_right, len(grid[row]))):
-            txt = get(row, cc)
-            if txt:
-                return txt
-        return ''
-
-    data = {
-        "tipo_equipo": "",
-        "marca": "",
-        "modelo": "",
-        "serial": "",
-        "ubicacion": "",
-        "persona_asignada": "",
-        "observaciones": "",
-        "cargador": 0,
-        "maletin": 0,
-        "mouse": 0,
-        "teclado": 0,
-        "tag": "",
-        "area": "",
-        "cargo": ""
-    }
-
-    # Buscar encabezado "Equipo Entregado" para columnas
-    pos_eq = find_cell('Equipo Entregado')
-    if pos_eq:
-        r_head, _ = pos_eq
-        c_tipo = col_of('Equipo Entregado', r_head)
-        c_marca = col_of('Marca', r_head)
-        c_modelo = col_of('Modelo', r_head)
-        c_serial = col_of('Serial', r_head)
-
-        if c_tipo is not None:
-            data["tipo_equipo"] = first_below(c_tipo, r_head)
-        if c_marca is not None:
-            data["marca"] = first_below(c_marca, r_head)
-        if c_modelo is not None:
-            data["modelo"] = first_below(c_modelo, r_head)
-        if c_serial is not None:
-            data["serial"] = first_below(c_serial, r_head)
-
-    # Ubicación (derecha de "Lugar")
-    pos_lugar = find_cell('Lugar')
-    if pos_lugar:
-        r, c = pos_lugar
-        data["ubicacion"] = get(r, c + 1)
-
-    # Persona asignada (buscar 'Entregado a' y luego 'Nombre' cercano)
-    pos_entregado_a = find_cell('Entregado a')
-    if pos_entregado_a:
-        rA, cA = pos_entregado_a
-        nombre_rc = None
-        for rr in range(rA, min(rA + 12, len(grid))):
-            for cc, val in enumerate(grid[rr]):
-                if 'nombre' in (val or '').lower():
-                    nombre_rc = (rr, cc)
-                    break
-            if nombre_rc:
-                break
-        if nombre_rc:
-            rn, cn = nombre_rc
-            nombre_val = get(rn, cn + 1)
-            print(f"[DEBUG] Nombre encontrado en ({rn},{cn}): '{nombre_val}'")
-            data["persona_asignada"] = nombre_val
-
-    # si no lo encontramos con la búsqueda anterior, intentar 'Nombre' suelto
-    if not data["persona_asignada"]:
-        pos_nombre = find_cell('Nombre:') or find_cell('Nombre')
-        if pos_nombre:
-            r, c = pos_nombre
-            nombre_val = first_right(r, c, max_right=8)
-            if not nombre_val:
-                nombre_val = first_below(c, r, max_down=3)
-            print(f"[DEBUG] Nombre (directo) en ({r},{c}): '{nombre_val}'")
-            data["persona_asignada"] = nombre_val
-
-    # Área
-    pos_area = find_cell('Área:') or find_cell('Área') or find_cell('Area:') or find_cell('Area')
-    if pos_area:
-        r, c = pos_area
-        area_val = first_right(r, c, max_right=8)
-        if not area_val:
-            area_val = first_below(c, r, max_down=3)
-        print(f"[DEBUG] Área encontrada en ({r},{c}): '{area_val}'")
-        data["area"] = area_val
-    else:
-        print("[DEBUG] No se encontró 'Área' en el documento")
-
-    # Cargo
-    pos_cargo = find_cell('Cargo:') or find_cell('Cargo')
-    if pos_cargo:
-        r, c = pos_cargo
-        cargo_val = first_right(r, c, max_right=8)
-        if not cargo_val:
-            cargo_val = first_below(c, r, max_down=3)
-        print(f"[DEBUG] Cargo encontrado en ({r},{c}): '{cargo_val}'")
-        data["cargo"] = cargo_val
-    else:
-        print("[DEBUG] No se encontró 'Cargo' en el documento")
-
-    # Observaciones y extracción de tag
-    pos_obs = find_cell('Observaciones')
-    if pos_obs:
-        r, c = pos_obs
-        obs = first_right(r, c, max_right=12)
-        if not obs:
-            obs = first_below(c, r, max_down=6)
-        data["observaciones"] = obs
-        tag_from_obs = _extract_tag_from_text(obs)
-        if tag_from_obs and not data.get("tag"):
-            data["tag"] = tag_from_obs
-
-    # Accesorios
-    pos_cargador = find_cell('Cargador')
-    pos_maletin = find_cell('Maletín') or find_cell('Maletin')
-    pos_mouse = find_cell('Mouse')
-    pos_teclado = find_cell('Teclado')
-
-    if pos_cargador:
-        r, c = pos_cargador
-        data["cargador"] = 1 if _truthy(get(r + 1, c)) else 0
-    if pos_maletin:
-        r, c = pos_maletin
-        data["maletin"] = 1 if _truthy(get(r + 1, c)) else 0
-    if pos_mouse:
-        data["mouse"] = 1
-    if pos_teclado:
-        data["teclado"] = 1
-
-    print(f"[DEBUG] Datos finales: {data}")
-    return {"ok": True, "data": data}
+    ms = round((time.perf_counter() - t0) * 1000, 1)
+    return {"ok": True, "data": data, "cached": cached, "ms": ms}
 
 
 # --- Vista dispositivo ---
@@ -410,24 +554,43 @@ def device_view(tag):
         flash('Cambio registrado', 'success')
         return redirect(url_for('device_view', tag=tag))
 
-    historial = historial_por_equipo(tag)
-    equipo = obtener_equipo_por_tag(tag)
-    principal = archivo_principal_get(tag)
+    datos = equipo_completo(tag)
+    historial = datos['historial']
+    equipo = datos['equipo']
+    principal = datos['principal']
 
     if principal:
         files_preview = []
+        # tamaño y mtime del índice (memoria) para versionar la vista previa
+        indexado = share_index.get(principal['ruta']) or {}
+        principal = dict(principal, preview=_vista_previa(principal['ruta'], indexado.get('size'),
+                                                          indexado.get('mtime')))
+        archivos = ()
+    elif share_index.built:
+        # Validador con las entradas del índice (memoria, tamaño y mtime del
+        # último barrido): un 304 no toca el share. El stat de confirmación
+        # de _scan_files_for_tag solo corre si hay que renderizar.
+        files_preview = None
+        archivos = tuple(sorted((f['path'], f['size'], f['mtime']) for f in _indexados_por_tag(tag)))
     else:
+        # sin índice todavía: la búsqueda acotada por nombre es el dato
         files_preview = _scan_files_for_tag(tag)[:5]
-
-    return render_template(
+        archivos = tuple((f['path'], f['size'], f['mtime']) for f in files_preview)
+
+    # Versión de la página: la fila del equipo y el último cambio registrado
+    ultimo_cambio = max((h.get('CambioId') or 0 for h in historial), default=0)
+    version = (tag, tuple(equipo.values()), ultimo_cambio, len(historial),
+               principal and (principal['ruta'], principal['nombre'], principal['preview']['url']),
+               archivos, app.config['ENABLE_UPLOAD'])
+    return condicional.pagina(version, lambda: render_template(
         'device.html',
         tag=tag,
         historial=historial,
         equipo=equipo,
         principal=principal,
-        files_preview=files_preview,
+        files_preview=files_preview if files_preview is not None else _scan_files_for_tag(tag)[:5],
         enable_upload=app.config['ENABLE_UPLOAD']
-    )
+    ))
 
 
 # --- Vincular archivo existente de la red ---
@@ -456,7 +619,7 @@ def device_link_save(tag):
         flash('La ruta no pertenece a la carpeta de red configurada.', 'danger')
         return redirect(url_for('device_link', tag=tag))
 
-    if not os.path.isfile(full):
+    if not share_io.isfile(full):
         flash('La ruta no existe como archivo.', 'danger')
         return redirect(url_for('device_link', tag=tag))
 
@@ -477,9 +640,7 @@ def device_principal_download(tag):
         abort(404)
     path = principal.get('ruta')
     name = principal.get('nombre') or os.path.basename(path)
-    if not (path and os.path.isfile(path)):
-        abort(404)
-    return send_file(path, as_attachment=True, download_name=name)
+    return _send_share_file(path, name)
 
 
 @app.post('/device/<tag>/upload')
@@ -493,10 +654,64 @@ def device_upload(tag):
     if err:
         flash(err, 'danger')
     else:
-        flash('Archivo principal subido y vinculado.', 'success')
+        flash('Archivo recibido; se vinculará como principal al terminar de copiarse a la red.', 'success')
     return redirect(url_for('device_view', tag=tag))
 
 
+# --- Subidas reanudables (escaneos grandes) ---
+# POST /device/<tag>/uploads {nombre, size} -> {id, offset, chunk, url}
+# PATCH <url> con Upload-Offset y el tramo crudo en el cuerpo -> {offset, estado}
+# GET <url> -> estado (para reanudar tras un corte o esperar el traslado)
+def _estado_subida(res):
+    return dict(res, ok=True, url=url_for('upload_chunk', upload_id=res['id']))
+
+
+@app.post('/device/<tag>/uploads')
+def upload_start(tag):
+    if not app.config['ENABLE_UPLOAD']:
+        abort(404)
+    payload = request.get_json(silent=True) or {}
+    fname = secure_filename(payload.get('nombre') or '')
+    if not fname or not _allowed(fname):
+        return {"ok": False, "error": "Tipo de archivo no permitido."}, 400
+    try:
+        size = int(payload['size'])
+    except (KeyError, TypeError, ValueError):
+        return {"ok": False, "error": "Falta el tamaño (size) del archivo."}, 400
+    try:
+        res = subidas.iniciar(tag, fname, size)
+    except DemasiadoGrande as e:
+        return {"ok": False, "error": str(e)}, 413
+    return dict(_estado_subida(res), chunk=int(app.config['UPLOAD_CHUNK_MB'] * 1024 * 1024)), 201
+
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'PATCH'])
+def upload_chunk(upload_id):
+    if not app.config['ENABLE_UPLOAD']:
+        abort(404)
+    if request.method == 'GET':
+        res = subidas.estado(upload_id)
+        if res is None:
+            abort(404)
+        return _estado_subida(res)
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return {"ok": False, "error": "Falta el encabezado Upload-Offset."}, 400
+    try:
+        # request.stream: el tramo va del socket al staging, sin pasar por memoria
+        res = subidas.anexar(upload_id, offset, request.stream)
+    except SubidaDesconocida:
+        abort(404)
+    except OffsetIncorrecto as e:
+        return {"ok": False, "error": str(e), "offset": e.offset}, 409
+    except DemasiadoGrande as e:
+        return {"ok": False, "error": str(e)}, 413
+    except SubidaError as e:
+        return {"ok": False, "error": str(e)}, 400
+    return _estado_subida(res)
+
+
 @app.post('/device/<tag>/reasignar')
 def device_reassign(tag):
     nueva = (request.form.get('nueva_persona') or '').strip()
@@ -522,20 +737,95 @@ def device_baja(tag):
     return redirect(url_for('device_view', tag=tag))
 
 
+def _datos_masivos():
+    """
+    (datos, tags) de una acción masiva: form (tags=...) o JSON ({"tags": [...], ...}).
+    datos es None si el cuerpo JSON no es un objeto.
+    """
+    if request.is_json:
+        datos = request.get_json(silent=True)
+        if not isinstance(datos, dict):
+            return None, []
+        tags = datos.get('tags') or []
+        if not isinstance(tags, list):
+            tags = [tags]
+    else:
+        datos, tags = request.form, request.form.getlist('tags')
+    return datos, [str(t).strip() for t in tags if str(t).strip()]
+
+
+def _rechazo_masivo(msg):
+    if request.is_json:
+        return {"ok": False, "error": msg}, 400
+    flash(msg, 'danger')
+    return redirect(request.referrer or url_for('index'))
+
+
+def _responder_masivo(res, accion, t0):
+    res["segundos"] = round(time.perf_counter() - t0, 3)
+    fallidos = [l for l in res["lotes"] if not l["ok"]]
+    if request.is_json:
+        return jsonify(dict(res, ok=not fallidos and not res["no_existen"]))
+    flash(f'{accion}: {res["ok"]} de {res["total"]} equipos en {len(res["lotes"])} lote(s), '
+          f'{res["segundos"]}s.', 'success' if res["ok"] else 'danger')
+    for l in fallidos:
+        flash(f'Lote {l["lote"]} ({len(l["tags"])} equipos) no se aplicó: {l["error"]}', 'danger')
+    if res["no_existen"]:
+        flash('No existen: ' + ', '.join(res["no_existen"]), 'danger')
+    return redirect(request.referrer or url_for('index'))
+
+
+@app.post('/bulk/reasignar')
+def bulk_reassign():
+    datos, tags = _datos_masivos()
+    if datos is None:
+        return _rechazo_masivo('Se esperaba un objeto JSON.')
+    nueva = str(datos.get('nueva_persona') or '').strip()
+    if not tags or not nueva:
+        return _rechazo_masivo('Seleccione equipos e indique la nueva persona.')
+    if len(tags) > app.config['BULK_MAX']:
+        return _rechazo_masivo(f"Máximo {app.config['BULK_MAX']} equipos por petición.")
+    t0 = time.perf_counter()
+    res = equipos_reasignar_lote(tags, nueva, cargo=datos.get('cargo') or None, fecha=datos.get('fecha') or None,
+                                 registrado_por=datos.get('registrado_por') or '',
+                                 descripcion=datos.get('descripcion') or None,
+                                 batch_size=app.config['BULK_BATCH'])
+    return _responder_masivo(res, f'Reasignados a {nueva}', t0)
+
+
+@app.post('/bulk/baja')
+def bulk_baja():
+    datos, tags = _datos_masivos()
+    if datos is None:
+        return _rechazo_masivo('Se esperaba un objeto JSON.')
+    if not tags:
+        return _rechazo_masivo('Seleccione equipos.')
+    if len(tags) > app.config['BULK_MAX']:
+        return _rechazo_masivo(f"Máximo {app.config['BULK_MAX']} equipos por petición.")
+    t0 = time.perf_counter()
+    res = equipos_dar_baja_lote(tags, motivo=datos.get('motivo') or None, fecha_baja=datos.get('fecha') or None,
+                                registrado_por=datos.get('registrado_por') or '',
+                                batch_size=app.config['BULK_BATCH'])
+    return _responder_masivo(res, 'Dados de baja', t0)
+
+
 @app.get('/device/<tag>/files')
 def device_files(tag):
     principal = archivo_principal_get(tag)
     files = []
     if principal:
-        p = principal['ruta']
-        if os.path.isfile(p):
+        st = share_io.stat(principal['ruta'])
+        if st is not None and stat.S_ISREG(st.st_mode):
             files.append({
                 'name': principal['nombre'],
-                'size': os.path.getsize(p),
-                'mtime': time.strftime('%Y-%m-%d %H:%M', time.localtime(os.path.getmtime(p))),
-                'where': 'PRINCIPAL'
+                'size': st.st_size,
+                'mtime': time.strftime('%Y-%m-%d %H:%M', time.localtime(st.st_mtime)),
+                'where': 'PRINCIPAL',
+                'etag': condicional.etag_archivo(principal['ruta'], st),
+                'preview': _vista_previa(principal['ruta'], st.st_size, st.st_mtime),
             })
-    return render_template('device_files.html', tag=tag, files=files)
+    version = (tag, tuple((f['name'], f['etag']) for f in files))
+    return condicional.pagina(version, lambda: render_template('device_files.html', tag=tag, files=files))
 
 
 @app.get('/device/<tag>/files/PRINCIPAL/<path:fname>')
@@ -543,10 +833,54 @@ def device_download(tag, fname):
     principal = archivo_principal_get(tag)
     if not principal or principal['nombre'] != fname:
         abort(404)
-    path = principal['ruta']
-    if not os.path.isfile(path):
+    return _send_share_file(principal['ruta'], fname)
+
+
+@app.get('/preview/<token>')
+def preview(token):
+    """
+    Vista previa de un archivo del share (ver miniaturas.py): 200 si ya está
+    generada, 202 con Retry-After mientras se genera, 404 si no hay.
+    """
+    if miniaturas is None:
+        abort(404)
+    try:
+        path = _decode_path(token)
+    except Exception:
+        abort(404)
+    if not (_is_inside(path, SHARE_ROOT) or _is_inside(path, UPLOAD_ROOT)) or not vistas_previas.tipo(path):
         abort(404)
-    return send_file(path, as_attachment=True, download_name=fname)
+    v = request.args.get('v') or ''
+    if v:
+        politica = condicional.politica()
+    else:
+        # sin versión en la URL: stat para saber cuál es, y revalidar siempre
+        st = share_io.stat(path)
+        if st is None or not stat.S_ISREG(st.st_mode):
+            abort(404)
+        v = vistas_previas.version(st.st_size, st.st_mtime)
+        politica = condicional.POLITICA_DEFAULT
+    clave = miniaturas.clave(path, v)
+    if condicional.ya_lo_tiene(clave):
+        rv = condicional.no_modificado(clave)
+        rv.headers['Cache-Control'] = politica
+        return rv
+    estado, ruta, tipo = miniaturas.pedir(path, v)
+    if estado == 'lista':
+        try:
+            rv = send_file(ruta, mimetype=tipo, etag=clave, conditional=False)
+        except FileNotFoundError:
+            miniaturas.olvidar(clave)   # el LRU la borró recién
+            estado, _, _ = miniaturas.pedir(path, v)
+        else:
+            rv.headers['Cache-Control'] = politica
+            return rv
+    if estado == 'error':
+        abort(404)
+    rv = app.response_class(status=202)
+    rv.headers['Retry-After'] = '1' if estado == 'pendiente' else '5'
+    rv.headers['Cache-Control'] = 'no-store'
+    return rv
 
 
 # --- Editar equipo ---
@@ -596,15 +930,200 @@ def edit_device(tag):
 @app.route('/search/person', methods=['GET'])
 def search_person():
     nombre = request.args.get('nombre', '').strip()
-    resultados = sp_historial_por_persona(nombre) if nombre else []
-    return render_template('index.html', resultados_persona=resultados, q='', person=nombre, dispositivos=[])
+    limite = _page_size()
+    try:
+        equipos = vista_personas.equipos(nombre, request.args.get('after') or None, limite) if nombre else None
+        historial = vista_personas.historial(nombre, request.args.get('h_after') or None, limite) if nombre else None
+    except ValueError as e:
+        abort(400, str(e))
+    return render_template('index.html', persona_equipos=equipos, persona_historial=historial,
+                           page_size=limite, q='', person=nombre, dispositivos=[])
+
+
+def _persona_json(consulta, *args):
+    try:
+        res = consulta(*args)
+    except ValueError as e:   # cursor mal formado
+        return {"ok": False, "error": str(e)}, 400
+    if res is None:
+        return {"ok": False, "error": "Persona sin equipos ni historial."}, 404
+    return jsonify(dict(res, ok=True))
+
+
+@app.get('/api/personas/<path:nombre>/equipos')
+def api_persona_equipos(nombre):
+    """Equipos que la persona tiene hoy: ?after=<tag>&page_size=N"""
+    return _persona_json(vista_personas.equipos, nombre, request.args.get('after') or None, _page_size())
+
+
+@app.get('/api/personas/<path:nombre>/historial')
+def api_persona_historial(nombre):
+    """Resumen del historial (un renglón por equipo): ?after=<último|tag>&page_size=N"""
+    return _persona_json(vista_personas.historial, nombre, request.args.get('after') or None, _page_size())
+
+
+@app.get('/api/personas/<path:nombre>/offboarding')
+def api_persona_offboarding(nombre):
+    """Checklist de salida: equipos y accesorios a devolver, desde memoria."""
+    return _persona_json(vista_personas.checklist, nombre)
+
+
+_COLUMNAS_BAJAS = (
+    ('tag', 'Activo'), ('marca', 'Marca'), ('modelo', 'Modelo'), ('serial', 'Serial'),
+    ('personaasignada', 'Persona asignada'), ('ubicacion', 'Ubicación'),
+    ('fechabaja', 'Fecha de baja'), ('motivo', 'Motivo'), ('registradopor', 'Registrado por'),
+)
+
+
+def _filtros_bajas():
+    """Filtros de /bajas desde el query string (los mismos para la página y la exportación)."""
+    return {k: request.args.get(k, '').strip() or None for k in ('desde', 'hasta', 'motivo', 'q')}
 
 
 @app.route('/bajas')
 def bajas():
-    dispositivos = query_dispositivos(solo_activos=False)
-    dispositivos_baja = [d for d in dispositivos if (d.get('estado') or '').upper() == 'BAJA']
-    return render_template('bajas.html', dispositivos=dispositivos_baja)
+    f = _filtros_bajas()
+    pagina = query_bajas_pagina(
+        desde=f['desde'], hasta=f['hasta'], motivo=f['motivo'], filtro_tag=f['q'],
+        despues=_decode_cursor(request.args.get('after', '')),
+        antes=_decode_cursor(request.args.get('before', '')),
+        limite=_page_size(),
+    )
+    return render_template(
+        'bajas.html',
+        dispositivos=pagina['rows'],
+        filtros={k: v or '' for k, v in f.items()},
+        filtros_url={k: v for k, v in f.items() if v},
+        page_size=_page_size(),
+        next_cursor=_encode_cursor(pagina['siguiente']),
+        prev_cursor=_encode_cursor(pagina['anterior']),
+    )
+
+
+@app.get('/bajas/export/<fmt>')
+def bajas_export(fmt):
+    """Todas las bajas que cumplen los filtros de /bajas, en CSV o XLSX, fila a fila."""
+    if fmt not in exportar.FORMATOS:
+        abort(404)
+    f = _filtros_bajas()
+    filas = iter_bajas(desde=f['desde'], hasta=f['hasta'], motivo=f['motivo'], filtro_tag=f['q'],
+                       chunk=app.config['EXPORT_CHUNK'])
+    return exportar.respuesta(filas, _COLUMNAS_BAJAS, fmt, 'bajas_' + time.strftime('%Y%m%d'), hoja='Bajas')
+
+
+_COLUMNAS_EQUIPOS = (
+    ('tag', 'Activo'), ('modelo', 'Modelo'), ('serial', 'Serial'), ('ubicacion', 'Ubicación'),
+    ('personaasignada', 'Persona asignada'), ('estado', 'Estado'), ('fechabaja', 'Fecha de baja'),
+)
+_COLUMNAS_HISTORIAL = (
+    ('Tag', 'Activo'), ('Modelo', 'Modelo'), ('Serial', 'Serial'), ('Ubicacion', 'Ubicación'),
+    ('PersonaAsignada', 'Persona asignada'), ('CambioId', 'Cambio'), ('TipoCambio', 'Tipo'),
+    ('Descripcion', 'Descripción'), ('FechaCambio', 'Fecha del cambio'), ('PersonaCambio', 'Persona del cambio'),
+    ('RegistradoPor', 'Registrado por'), ('FechaRegistro', 'Fecha de registro'),
+)
+
+
+def _filtros_export():
+    """
+    Filtros de query_dispositivos desde el query string: q (tag), person,
+    incluir_bajas=1 para no limitarse a los activos.
+    """
+    return {
+        "filtro_tag": request.args.get('q', '').strip() or None,
+        "filtro_persona": request.args.get('person', '').strip() or None,
+        "solo_activos": request.args.get('incluir_bajas', '') not in ('1', 'true', 'on'),
+    }
+
+
+@app.get('/export/equipos/<fmt>')
+def export_equipos(fmt):
+    """Listado de equipos (filtros del inicio) en CSV o XLSX, fila a fila."""
+    if fmt not in exportar.FORMATOS:
+        abort(404)
+    filas = iter_dispositivos(chunk=app.config['EXPORT_CHUNK'], **_filtros_export())
+    return exportar.respuesta(filas, _COLUMNAS_EQUIPOS, fmt, 'equipos_' + time.strftime('%Y%m%d'), hoja='Equipos')
+
+
+@app.get('/export/historial/<fmt>')
+def export_historial(fmt):
+    """
+    Historial completo de los equipos filtrados (ti.v_EquipoHistorial), con
+    desde/hasta opcionales sobre la fecha del cambio.
+    """
+    if fmt not in exportar.FORMATOS:
+        abort(404)
+    filas = iter_historial(desde=request.args.get('desde') or None, hasta=request.args.get('hasta') or None,
+                           chunk=app.config['EXPORT_CHUNK'], **_filtros_export())
+    return exportar.respuesta(filas, _COLUMNAS_HISTORIAL, fmt, 'historial_' + time.strftime('%Y%m%d'),
+                              hoja='Historial')
+
+
+def _entero_opcional(body, clave, maximo=None):
+    """int >= 1 de `body[clave]` (None si falta), acotado a `maximo`; ValueError si no es válido."""
+    v = body.get(clave)
+    if v is None:
+        return None
+    if isinstance(v, bool) or not isinstance(v, (int, str)):
+        raise ValueError(f"'{clave}' debe ser un entero positivo.")
+    try:
+        n = int(v)
+    except ValueError:
+        raise ValueError(f"'{clave}' debe ser un entero positivo.") from None
+    if n < 1:
+        raise ValueError(f"'{clave}' debe ser un entero positivo.")
+    return min(n, maximo) if maximo else n
+
+
+@app.post('/admin/import')
+def admin_import():
+    """
+    Importación masiva de hojas de entrega del share.
+    JSON: {"dry_run": true, "limit": n, "workers": n}. Por defecto es dry-run.
+    `workers` se acota a IMPORT_MAX_WORKERS. Corre dentro de la petición (y si
+    el índice del share no está armado lo construye antes): la respuesta
+    tarda lo que tarde leer todas las hojas; para cargas grandes usar el
+    comando `flask import-entregas`.
+    """
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return {"ok": False, "error": "Se esperaba un objeto JSON."}, 400
+    try:
+        limite = _entero_opcional(body, 'limit')
+        workers = _entero_opcional(body, 'workers', app.config['IMPORT_MAX_WORKERS'])
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}, 400
+    if not share_index.built:
+        try:
+            share_index.rebuild()
+        except ShareNoDisponible as e:
+            return {"ok": False, "error": str(e)}, 503
+    archivos = importer.hojas_del_share(share_index, limite=limite)
+    res = importer.importar(archivos, dry_run=bool(body.get('dry_run', True)), workers=workers)
+    return jsonify(dict(res, ok=True))
+
+
+@app.post('/api/cambios')
+def api_cambios_lote():
+    """
+    Registrar cambio masivo.
+    JSON: {"cambios": [{tag, tipo, desc, fecha, persona_rel, registrado_por}, ...],
+           "registrado_por": "TI"}   (el de arriba es el valor por defecto de cada fila)
+    Las filas con error (incluidas las que no son objeto o traen campos que
+    no son texto) se informan en "errores"; las demás se guardan igual.
+    """
+    body = request.get_json(silent=True)
+    cambios = body.get('cambios') if isinstance(body, dict) else None
+    if not isinstance(cambios, list):
+        return {"ok": False, "error": "Se espera {\"cambios\": [ {...}, ... ]}."}, 400
+    registrado_por = body.get('registrado_por') or 'TI'
+    if not isinstance(registrado_por, str):
+        return {"ok": False, "error": "registrado_por debe ser texto."}, 400
+    if len(cambios) > app.config['BULK_MAX']:
+        return {"ok": False, "error": f"Máximo {app.config['BULK_MAX']} cambios por petición."}, 400
+    t0 = time.perf_counter()
+    res = equipo_agregar_cambios_lote(cambios, registrado_por=registrado_por)
+    res["segundos"] = round(time.perf_counter() - t0, 3)
+    return jsonify(dict(res, ok=not res["errores"]))
 
 
 @app.route('/_routes')
@@ -612,13 +1131,118 @@ def _routes():
     return '<pre>' + '\n'.join(str(r) for r in app.url_map.iter_rules()) + '</pre>'
 
 
+@app.route('/_pool')
+def _pool():
+    return jsonify(pool_stats())
+
+
+metricas.REGISTRO.medidor(
+    "db_pool_connections", "Conexiones del pool por estado.",
+    lambda: {(k,): v for k, v in pool_stats().items() if k in ("size", "idle", "in_use")}, ("state",))
+
+
+@app.route('/metrics')
+def metrics():
+    return app.response_class(metricas.REGISTRO.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/_lentas')
+def _lentas():
+    return jsonify(peticiones_lentas.listar())
+
+
+@app.cli.command('share-index')
+@click.option('--full', is_flag=True, help='Re-listar todo el share en vez de solo las carpetas cambiadas.')
+def share_index_cmd(full):
+    """Construye/refresca el índice local de archivos del share."""
+    try:
+        res = share_index.rebuild() if full or not share_index.built else share_index.refresh()
+    except ShareNoDisponible as e:
+        raise click.ClickException(f"{e}; el índice no se modificó.")
+    click.echo(f"Carpetas: {res['dirs']}  re-listadas: {res['changed']}  eliminadas: {res['removed']}  "
+               f"archivos: {res['files']}  ({res['seconds']}s)")
+
+
+@app.route('/_cache')
+def _cache():
+    return jsonify(cache_stats())
+
+
+@app.route('/_share')
+def _share():
+    return jsonify({"index": share_index.stats(), "watcher": share_watcher.stats(), "io": share_io.stats()})
+
+
+@app.route('/_search')
+def _search():
+    return jsonify(search_index.stats())
+
+
+@app.route('/_autofill')
+def _autofill():
+    return jsonify(autofill_cache.stats())
+
+
+@app.route('/_espejo')
+def _espejo():
+    return jsonify(espejo.stats() if espejo else {"enabled": False})
+
+
+@app.route('/_personas')
+def _personas():
+    return jsonify(vista_personas.stats())
+
+
+@app.route('/_subidas')
+def _subidas():
+    return jsonify(subidas.stats())
+
+
+@app.route('/_previews')
+def _previews():
+    return jsonify(miniaturas.stats() if miniaturas else {"enabled": False})
+
+
+@app.cli.command('import-entregas')
+@click.option('--dry-run/--write', default=True, help='Solo mostrar el diff (por defecto) o escribir en la base.')
+@click.option('--workers', type=int, default=None, help='Procesos para leer los Excel.')
+@click.option('--limit', type=int, default=None, help='Procesar solo las N hojas más recientes.')
+def import_entregas_cmd(dry_run, workers, limit):
+    """Importa/actualiza equipos desde todas las hojas .xlsx del share."""
+    if not share_index.built:
+        share_index.rebuild()
+    archivos = importer.hojas_del_share(share_index, limite=limit)
+    res = importer.importar(archivos, dry_run=dry_run, workers=workers)
+    for c in res['diff']:
+        click.echo(f"[{c['accion'].upper():6}] {c['tag']}  ({os.path.basename(c['ruta'])})")
+        for campo, (antes, despues) in c['cambios'].items():
+            click.echo(f"           {campo}: {antes!r} -> {despues!r}")
+    for e in res['errores']:
+        click.echo(f"[ERROR ] {e['ruta']}: {e['error']}")
+    click.echo(f"Hojas: {res['hojas']}  equipos: {res['equipos']}  nuevos: {res['nuevos']}  "
+               f"cambian: {res['cambian']}  iguales: {res['iguales']}  sin tag: {len(res['sin_tag'])}  "
+               f"errores: {len(res['errores'])}")
+    click.echo(f"{res['hojas_por_segundo']} hojas/s, {res['segundos']}s en total"
+               + ("  (dry-run, no se escribió nada)" if dry_run else f"  escritura: {res['escritura']}"))
+
+
+@app.errorhandler(ShareIOError)
+def err_share_io(e):
+    app.logger.warning("share no disponible en %s: %s", request.path, e)
+    if request.is_json:
+        return {"ok": False, "error": str(e)}, 503
+    return str(e), 503
+
+
 @app.errorhandler(404)
 def err404(e):
-    print(f"[404] PATH solicitado: {repr(request.path)}")
+    # La línea de acceso ya registra el 404 con su ruta
+    app.logger.debug("404: %r", request.path)
     return "Not Found", 404
 
 
 if __name__ == '__main__':
-    print('CWD:', os.getcwd())
-    print('URL MAP:\n', app.url_map)
+    configurar_registro()
+    app.logger.info("CWD: %s", os.getcwd())
+    app.logger.debug("URL MAP:\n%s", app.url_map)
     app.run(debug=True)
@@ -0,0 +1,279 @@
+"""
+Extracción de datos de las hojas "Entrega Equipos" (Excel) para autollenado.
+
+Se usa desde la ruta /new/autofill_from_path y desde el importador masivo
+(importer.py), que la corre en un pool de procesos; por eso no depende de Flask.
+"""
+import logging
+import re
+
+from openpyxl import load_workbook
+
+from registro import debug_activo
+
+log = logging.getLogger(__name__)
+
+
+# Las hojas de entrega son un formulario corto; más allá de esto no hay etiquetas
+MAX_FILAS = 200
+
+# Todas las etiquetas que busca extraer_datos, en minúscula
+ETIQUETAS = (
+    'equipo entregado', 'lugar', 'entregado a', 'nombre:', 'nombre',
+    'área:', 'área', 'area:', 'area', 'cargo:', 'cargo', 'observaciones',
+    'cargador', 'maletín', 'maletin', 'mouse', 'teclado',
+)
+
+
+def xlsx_to_grid(path, max_rows=MAX_FILAS):
+    """
+    Lee la hoja activa en modo read-only (streaming: no carga el libro entero
+    en memoria) y se detiene tras `max_rows` filas.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        grid = []
+        for r in ws.iter_rows(max_row=max_rows, values_only=True):
+            row = []
+            for v in r:
+                s = '' if v is None else str(v).strip()
+                row.append(s)
+            grid.append(row)
+        return grid
+    finally:
+        # en read-only el libro mantiene el archivo abierto hasta cerrarlo
+        wb.close()
+
+
+def indexar_etiquetas(grid, etiquetas=ETIQUETAS):
+    """
+    Una sola pasada por la grilla: devuelve {etiqueta: (fila, col)} con la
+    primera celda (en orden fila/columna) que contiene cada etiqueta, igual que
+    find_cell pero sin recorrer la grilla una vez por etiqueta.
+    """
+    pendientes = [e.lower() for e in etiquetas]
+    pos = {}
+    for r, row in enumerate(grid):
+        for c, val in enumerate(row):
+            if not val:
+                continue
+            low = val.lower()
+            hallados = [e for e in pendientes if e in low]
+            if hallados:
+                for e in hallados:
+                    pos[e] = (r, c)
+                pendientes = [e for e in pendientes if e not in pos]
+                if not pendientes:
+                    return pos
+    return pos
+
+
+def find_cell(grid, needle):
+    n = (needle or '').lower()
+    for r, row in enumerate(grid):
+        for c, val in enumerate(row):
+            if n in (val or '').lower():
+                return (r, c)
+    return None
+
+
+def safe_get(grid, r, c):
+    try:
+        return grid[r][c]
+    except Exception:
+        return ''
+
+
+def truthy(s):
+    s = (s or '').strip().lower()
+    return s in {'✔', 'si', 'sí', 'true', '1', 'x'}
+
+
+def extract_tag_from_text(text):
+    m = re.search(r'(?i)\bactivo\b\s*[:#-]?\s*([A-Za-z0-9\-]+)', text or '')
+    return m.group(1).strip() if m else ''
+
+
+def extraer_datos(grid, debug=None):
+    """
+    Busca las etiquetas conocidas de la hoja de entrega y devuelve el dict que
+    espera el formulario de nuevo equipo (tipo_equipo, marca, modelo, serial,
+    ubicacion, persona_asignada, observaciones, accesorios, tag, area, cargo).
+
+    Las trazas van a log.debug; por defecto solo si DEBUG está activo para
+    este logger (y la petición salió en el muestreo, ver registro.py).
+    """
+    if debug is None:
+        debug = debug_activo(log)
+    if debug:
+        log.debug("contenido del Excel (primeras 30 filas):\n%s",
+                  "\n".join(f"Fila {i}: {row}" for i, row in enumerate(grid[:30])))
+
+    def _dbg(msg, *args):
+        if debug:
+            log.debug(msg, *args)
+
+    etiquetas = indexar_etiquetas(grid)
+
+    def find(needle):
+        n = needle.lower()
+        pos = etiquetas[n] if n in etiquetas else (None if n in ETIQUETAS else find_cell(grid, needle))
+        _dbg("buscando %r: %s", needle, pos)
+        return pos
+
+    def get(r, c):
+        return safe_get(grid, r, c)
+
+    def col_of(header, header_row):
+        h = header.lower()
+        for c, val in enumerate(grid[header_row]):
+            if h in (val or '').lower():
+                return c
+        return None
+
+    def first_below(col, header_row, max_down=6):
+        for r in range(header_row + 1, min(header_row + 1 + max_down, len(grid))):
+            txt = get(r, col)
+            if txt:
+                return txt
+        return ''
+
+    def first_right(row, start_c, max_right=10):
+        if row < 0 or row >= len(grid):
+            return ''
+        for cc in range(start_c + 1, min(start_c + 1 + max_right, len(grid[row]))):
+            txt = get(row, cc)
+            if txt:
+                return txt
+        return ''
+
+    data = {
+        "tipo_equipo": "",
+        "marca": "",
+        "modelo": "",
+        "serial": "",
+        "ubicacion": "",
+        "persona_asignada": "",
+        "observaciones": "",
+        "cargador": 0,
+        "maletin": 0,
+        "mouse": 0,
+        "teclado": 0,
+        "tag": "",
+        "area": "",
+        "cargo": ""
+    }
+
+    # Buscar encabezado "Equipo Entregado" para columnas
+    pos_eq = find('Equipo Entregado')
+    if pos_eq:
+        r_head, _ = pos_eq
+        c_tipo = col_of('Equipo Entregado', r_head)
+        c_marca = col_of('Marca', r_head)
+        c_modelo = col_of('Modelo', r_head)
+        c_serial = col_of('Serial', r_head)
+
+        if c_tipo is not None:
+            data["tipo_equipo"] = first_below(c_tipo, r_head)
+        if c_marca is not None:
+            data["marca"] = first_below(c_marca, r_head)
+        if c_modelo is not None:
+            data["modelo"] = first_below(c_modelo, r_head)
+        if c_serial is not None:
+            data["serial"] = first_below(c_serial, r_head)
+
+    # Ubicación (derecha de "Lugar")
+    pos_lugar = find('Lugar')
+    if pos_lugar:
+        r, c = pos_lugar
+        data["ubicacion"] = get(r, c + 1)
+
+    # Persona asignada (buscar 'Entregado a' y luego 'Nombre' cercano)
+    pos_entregado_a = find('Entregado a')
+    if pos_entregado_a:
+        rA, cA = pos_entregado_a
+        nombre_rc = None
+        for rr in range(rA, min(rA + 12, len(grid))):
+            for cc, val in enumerate(grid[rr]):
+                if 'nombre' in (val or '').lower():
+                    nombre_rc = (rr, cc)
+                    break
+            if nombre_rc:
+                break
+        if nombre_rc:
+            rn, cn = nombre_rc
+            nombre_val = get(rn, cn + 1)
+            _dbg("nombre encontrado en (%s,%s): %r", rn, cn, nombre_val)
+            data["persona_asignada"] = nombre_val
+
+    # si no lo encontramos con la búsqueda anterior, intentar 'Nombre' suelto
+    if not data["persona_asignada"]:
+        pos_nombre = find('Nombre:') or find('Nombre')
+        if pos_nombre:
+            r, c = pos_nombre
+            nombre_val = first_right(r, c, max_right=8)
+            if not nombre_val:
+                nombre_val = first_below(c, r, max_down=3)
+            _dbg("nombre (directo) en (%s,%s): %r", r, c, nombre_val)
+            data["persona_asignada"] = nombre_val
+
+    # Área
+    pos_area = find('Área:') or find('Área') or find('Area:') or find('Area')
+    if pos_area:
+        r, c = pos_area
+        area_val = first_right(r, c, max_right=8)
+        if not area_val:
+            area_val = first_below(c, r, max_down=3)
+        _dbg("área encontrada en (%s,%s): %r", r, c, area_val)
+        data["area"] = area_val
+    else:
+        _dbg("no se encontró 'Área' en el documento")
+
+    # Cargo
+    pos_cargo = find('Cargo:') or find('Cargo')
+    if pos_cargo:
+        r, c = pos_cargo
+        cargo_val = first_right(r, c, max_right=8)
+        if not cargo_val:
+            cargo_val = first_below(c, r, max_down=3)
+        _dbg("cargo encontrado en (%s,%s): %r", r, c, cargo_val)
+        data["cargo"] = cargo_val
+    else:
+        _dbg("no se encontró 'Cargo' en el documento")
+
+    # Observaciones y extracción de tag
+    pos_obs = find('Observaciones')
+    if pos_obs:
+        r, c = pos_obs
+        obs = first_right(r, c, max_right=12)
+        if not obs:
+            obs = first_below(c, r, max_down=6)
+        data["observaciones"] = obs
+        tag_from_obs = extract_tag_from_text(obs)
+        if tag_from_obs and not data.get("tag"):
+            data["tag"] = tag_from_obs
+
+    # Accesorios
+    pos_cargador = find('Cargador')
+    pos_maletin = find('Maletín') or find('Maletin')
+    pos_mouse = find('Mouse')
+    pos_teclado = find('Teclado')
+
+    if pos_cargador:
+        r, c = pos_cargador
+        data["cargador"] = 1 if truthy(get(r + 1, c)) else 0
+    if pos_maletin:
+        r, c = pos_maletin
+        data["maletin"] = 1 if truthy(get(r + 1, c)) else 0
+    if pos_mouse:
+        data["mouse"] = 1
+    if pos_teclado:
+        data["teclado"] = 1
+
+    _dbg("datos finales: %s", data)
+    return data
+
+
+def extraer_desde_excel(path, debug=None):
+    return extraer_datos(xlsx_to_grid(path), debug=debug)
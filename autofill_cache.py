@@ -0,0 +1,190 @@
+"""
+Caché persistente de los resultados del autollenado (autofill.py).
+
+Los usuarios suelen pedir /new/autofill_from_path varias veces sobre la misma
+hoja de entrega, y cada vez se traía el libro por la red y se volvía a
+parsear. Aquí guardamos el dict extraído en un SQLite local, con clave
+(ruta, tamaño, mtime): basta un stat contra el share para saber si sirve.
+Si la hoja cambia (otro tamaño o mtime) la entrada deja de coincidir y se
+reemplaza en la siguiente extracción.
+
+Con `use_hash=True` además se guarda el SHA-256 del contenido: cuando el
+stat no coincide (p.ej. la hoja se copió o se tocó sin cambiarla) se hashea
+el archivo y, si ese contenido ya se extrajo antes bajo cualquier ruta, se
+reutiliza. Leer el archivo cuesta, pero mucho menos que parsearlo. Con
+`share_io` el archivo se abre en su pool, con plazo y circuito: un share
+colgado corta la petición en vez de dejarla esperando.
+
+La tabla está acotada a `max_entries`; se descartan las menos usadas.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Subir cuando cambie lo que devuelve autofill.extraer_datos: invalida todo lo guardado
+VERSION = 1
+
+
+def _sha256(path, abrir=open, bloque=1024 * 1024):
+    h = hashlib.sha256()
+    with abrir(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(bloque), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class AutofillCache:
+    def __init__(self, db_path, max_entries=5000, use_hash=False, version=VERSION, share_io=None):
+        self.db_path = db_path
+        # con share_io el hash abre el archivo en su pool (plazo y circuito)
+        self._abrir = share_io.open if share_io is not None else open
+        self.max_entries = max_entries
+        self.use_hash = use_hash
+        self.version = version
+        self._lock = threading.Lock()
+        self._ready = False
+        self._stats = {"hits": 0, "hash_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    # ---------- persistencia ----------
+
+    def _db(self):
+        if not self._ready:
+            d = os.path.dirname(self.db_path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        if not self._ready:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS autofill(
+                    path    TEXT PRIMARY KEY,
+                    size    INTEGER NOT NULL,
+                    mtime   INTEGER NOT NULL,
+                    sha256  TEXT,
+                    version INTEGER NOT NULL,
+                    data    TEXT NOT NULL,
+                    used    REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_autofill_sha ON autofill(sha256);
+                CREATE INDEX IF NOT EXISTS ix_autofill_used ON autofill(used);
+            """)
+            self._ready = True
+        return conn
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    @staticmethod
+    def _key(path):
+        # En Windows las rutas UNC no distinguen mayúsculas
+        return os.path.normcase(os.path.normpath(path))
+
+    # ---------- API ----------
+
+    def get(self, path, st=None):
+        """
+        Devuelve el dict guardado para `path` si sigue vigente, o None.
+        `st` es un os.stat_result ya obtenido (evita otro stat contra el share).
+        """
+        return self._buscar(path, st or os.stat(path))[0]
+
+    def _buscar(self, path, st):
+        """(data | None, sha256 si se calculó): el hash sirve para guardar sin releer el archivo."""
+        key = self._key(path)
+        conn = self._db()
+        try:
+            row = conn.execute(
+                "SELECT size, mtime, data FROM autofill WHERE path = ? AND version = ?",
+                (key, self.version)).fetchone()
+            if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+                conn.execute("UPDATE autofill SET used = ? WHERE path = ?", (time.time(), key))
+                conn.commit()
+                self._count("hits")
+                return json.loads(row[2]), None
+            if not self.use_hash:
+                return None, None
+            sha = _sha256(path, self._abrir)
+            row = conn.execute(
+                "SELECT data FROM autofill WHERE sha256 = ? AND version = ? LIMIT 1",
+                (sha, self.version)).fetchone()
+            if row is None:
+                return None, sha
+            # Mismo contenido ya extraído: se registra también con el stat actual
+            self._store(conn, key, st, sha, row[0])
+            self._count("hash_hits")
+            return json.loads(row[0]), sha
+        finally:
+            conn.close()
+
+    def put(self, path, data, st=None, sha=None):
+        """Guarda `data` para `path`; `sha` es el hash ya calculado (si no, se hashea con use_hash)."""
+        st = st or os.stat(path)
+        if sha is None and self.use_hash:
+            sha = _sha256(path, self._abrir)
+        conn = self._db()
+        try:
+            self._store(conn, self._key(path), st, sha, json.dumps(data, ensure_ascii=False))
+        finally:
+            conn.close()
+
+    def _store(self, conn, key, st, sha, raw):
+        conn.execute(
+            "INSERT OR REPLACE INTO autofill(path, size, mtime, sha256, version, data, used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, st.st_size, st.st_mtime_ns, sha, self.version, raw, time.time()))
+        sobran = conn.execute("SELECT COUNT(*) FROM autofill").fetchone()[0] - self.max_entries
+        if sobran > 0:
+            conn.execute("DELETE FROM autofill WHERE path IN "
+                         "(SELECT path FROM autofill ORDER BY used LIMIT ?)", (sobran,))
+            with self._lock:
+                self._stats["evictions"] += sobran
+        conn.commit()
+        self._count("stores")
+
+    def get_or_extract(self, path, extractor, st=None):
+        """
+        (data, cached) para `path`; en un fallo llama a `extractor(path)` y
+        guarda el resultado. Las excepciones del extractor no se cachean.
+        `st` es el stat que ya hizo el llamador (p.ej. con share_io, con plazo).
+        """
+        st = st or os.stat(path)
+        data, sha = self._buscar(path, st)
+        if data is not None:
+            return data, True
+        self._count("misses")
+        data = extractor(path)
+        self.put(path, data, st, sha=sha)
+        return data, False
+
+    def invalidate(self, path=None):
+        """Borra la entrada de `path`, o todas si no se indica."""
+        conn = self._db()
+        try:
+            if path is None:
+                conn.execute("DELETE FROM autofill")
+            else:
+                conn.execute("DELETE FROM autofill WHERE path = ?", (self._key(path),))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def stats(self):
+        conn = self._db()
+        try:
+            entries = conn.execute("SELECT COUNT(*) FROM autofill").fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            data = dict(self._stats)
+        total = data["hits"] + data["hash_hits"] + data["misses"]
+        data.update({
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "use_hash": self.use_hash,
+            "version": self.version,
+            "hit_ratio": round((data["hits"] + data["hash_hits"]) / total, 4) if total else None,
+        })
+        return data
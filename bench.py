@@ -0,0 +1,440 @@
+"""
+Benchmarks locales contra fakedb (SQLite con interfaz pyodbc), sin SQL Server.
+
+    python bench.py device_page [--devices 2000] [--cambios 20] [--latency-ms 2] [--iters 200]
+    python bench.py autofill [--filas 5000] [--iters 5]
+    python bench.py share_io [--archivos 200] [--latency-ms 20]
+    python bench.py search [--devices 10000] [--iters 50]
+    python bench.py fechas [--filas 5000]
+    python bench.py filas [--cambios 10000] [--iters 20]
+    python bench.py export [--devices 20000] [--cambios 6]
+
+`--latency-ms` simula el round-trip de red por sentencia, que es lo que
+domina en producción; con 0 solo se mide el costo local.
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import jinja2
+
+import db
+import fakedb
+import fakeshare
+import fechas
+import filas
+import search_index
+import share_io
+
+
+# ---------- datos sintéticos ----------
+
+def seed(uri, devices=2000, cambios=20, personas=300, rnd=None):
+    """Crea el esquema ti.* en `uri` y lo llena con una flota sintética."""
+    rnd = rnd or random.Random(42)
+    conn = fakedb.connect(uri)
+    fakedb.create_schema(conn)
+    raw = conn._raw
+    raw.executemany("INSERT INTO ti.Persona(Nombre, Area, Cargo) VALUES (?, ?, ?)",
+                    [(f"Persona {i}", f"Area {i % 12}", f"Cargo {i % 7}") for i in range(personas)])
+    raw.executemany(
+        "INSERT INTO ti.Equipo(EquipoId, Tag, Marca, Modelo, Serial, Ubicacion, PersonaAsignadaId, Estado) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(i, f"ACT-{i:06d}", "Lenovo", f"T{i % 50}", f"SN{i:08d}", f"Sede {i % 9}",
+          rnd.randint(1, personas), "BAJA" if i % 25 == 0 else None)
+         for i in range(1, devices + 1)])
+    raw.executemany(
+        "INSERT INTO ti.EquipoCambio(EquipoId, TipoCambio, Descripcion, FechaCambio, RegistradoPor, PersonaCambioId) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(i, rnd.choice(("ASIGNACION", "MANTENIMIENTO", "REASIGNACION")), f"Cambio {j}",
+          f"2024-{1 + j % 12:02d}-{1 + j % 28:02d} 10:00:00", "TI", rnd.randint(1, personas))
+         for i in range(1, devices + 1) for j in range(cambios)])
+    # Las bajas con fecha y su cambio BAJA con el motivo, como deja sp_Equipo_DarBaja
+    raw.execute("UPDATE ti.Equipo SET FechaBaja = printf('%d-%02d-%02d 00:00:00', 2016 + EquipoId % 9, "
+                "1 + EquipoId % 12, 1 + EquipoId % 28) WHERE Estado = 'BAJA'")
+    raw.execute("INSERT INTO ti.EquipoCambio(EquipoId, TipoCambio, Descripcion, FechaCambio, RegistradoPor) "
+                "SELECT EquipoId, 'BAJA', CASE EquipoId % 3 WHEN 0 THEN 'Obsoleto' WHEN 1 THEN 'Robo' "
+                "ELSE 'Daño irreparable' END, FechaBaja, 'TI' FROM ti.Equipo WHERE Estado = 'BAJA'")
+    raw.executemany("INSERT INTO ti.EquipoArchivo(Tag, Ruta, Nombre, EsPrincipal) VALUES (?, ?, ?, 1)",
+                    [(f"ACT-{i:06d}", rf"\\share\Entrega ACT-{i:06d}.pdf", f"Entrega ACT-{i:06d}.pdf")
+                     for i in range(1, devices + 1, 2)])
+    conn.commit()
+    return conn  # mantener abierta: la base en memoria vive mientras haya una conexión
+
+
+def _percentiles(muestras):
+    muestras = sorted(muestras)
+    def p(q):
+        return muestras[min(len(muestras) - 1, int(q * len(muestras)))]
+    return {"p50": p(0.50), "p95": p(0.95), "p99": p(0.99), "mean": statistics.fmean(muestras)}
+
+
+def _medir(fn, tags):
+    fakedb.reset_stats()
+    tiempos = []
+    for tag in tags:
+        t0 = time.perf_counter()
+        fn(tag)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    n = len(tags)
+    return dict(_percentiles(tiempos),
+                round_trips=fakedb.stats["executes"] / n,
+                connects=fakedb.stats["connects"] / n)
+
+
+def _imprimir(titulo, res):
+    print(f"  {titulo:<28} round-trips/pág={res['round_trips']:.1f}  conexiones/pág={res['connects']:.2f}  "
+          f"p50={res['p50']:.2f}ms  p95={res['p95']:.2f}ms  p99={res['p99']:.2f}ms")
+
+
+# ---------- escenarios ----------
+
+def bench_device_page(args):
+    """device_view: 3 consultas separadas vs. equipo_completo() en un lote."""
+    uri = "file:bench_device_page?mode=memory&cache=shared"
+    keep = seed(uri, args.devices, args.cambios)
+    latency = args.latency_ms / 1000.0
+    db.configure_pool(connect=lambda: fakedb.connect(uri, latency=latency), minsize=1, maxsize=4)
+    rnd = random.Random(7)
+    iters = args.iters or 200
+    tags = [f"ACT-{rnd.randint(1, args.devices):06d}" for _ in range(iters)]
+
+    def antes(tag):
+        db.historial_por_equipo(tag)
+        db.obtener_equipo_por_tag(tag)
+        db.archivo_principal_get(tag)
+
+    def despues(tag):
+        db.equipo_completo(tag)
+
+    despues(tags[0])  # calienta el pool
+    print(f"device_page: {args.devices} equipos x {args.cambios} cambios, latencia {args.latency_ms}ms, "
+          f"{iters} páginas")
+    _imprimir("antes (3 consultas)", _medir(antes, tags))
+    _imprimir("después (1 lote)", _medir(despues, tags))
+    keep.close()
+
+
+def _hoja_grande(path, filas, columnas=20):
+    """Hoja de entrega con el formulario arriba y `filas` de relleno debajo."""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["ACTA DE ENTREGA DE EQUIPOS"])
+    ws.append(["Lugar", "Bodega principal"])
+    ws.append(["Equipo Entregado", "Marca", "Modelo", "Serial"])
+    ws.append(["Portátil", "Lenovo", "T14", "SN123"])
+    ws.append(["Entregado a"])
+    ws.append(["Nombre", "José Pérez"])
+    ws.append(["Área:", "Ventas"])
+    ws.append(["Cargo:", "Asesor"])
+    ws.append(["Cargador", "Maletín", "Mouse"])
+    ws.append(["si", "no", "x"])
+    ws.append(["Observaciones", "Activo: ACT-000123"])
+    for i in range(filas):
+        ws.append([f"dato {i}-{c}" for c in range(columnas)])
+    wb.save(path)
+
+
+def _autofill_antes(path):
+    """Camino anterior: libro completo en memoria + una búsqueda por etiqueta."""
+    from openpyxl import load_workbook
+    import autofill
+    wb = load_workbook(path, data_only=True)
+    grid = [['' if v is None else str(v).strip() for v in r] for r in wb.active.iter_rows(values_only=True)]
+    indexar, etiquetas = autofill.indexar_etiquetas, autofill.ETIQUETAS
+    autofill.indexar_etiquetas, autofill.ETIQUETAS = (lambda g, e=None: {}), ()
+    try:
+        return autofill.extraer_datos(grid)
+    finally:
+        autofill.indexar_etiquetas, autofill.ETIQUETAS = indexar, etiquetas
+
+
+def _autofill_despues(path):
+    import autofill
+    return autofill.extraer_desde_excel(path)
+
+
+def bench_autofill(args):
+    """Autollenado: carga completa + N búsquedas vs. read-only acotado + índice de etiquetas."""
+    path = os.path.join(tempfile.mkdtemp(), "entrega_grande.xlsx")
+    _hoja_grande(path, args.filas)
+    iters = args.iters or 5
+    print(f"autofill: hoja de {args.filas} filas ({os.path.getsize(path) / 1024:.0f} KB), {iters} iteraciones")
+    resultados = {}
+    for titulo, fn in (("antes (completo)", _autofill_antes), ("después (streaming)", _autofill_despues)):
+        tiempos = []
+        for _ in range(iters):
+            t0 = time.perf_counter()
+            resultados[titulo] = fn(path)
+            tiempos.append((time.perf_counter() - t0) * 1000)
+        # la memoria se mide aparte: tracemalloc infla mucho los tiempos
+        tracemalloc.start()
+        fn(path)
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        p = _percentiles(tiempos)
+        print(f"  {titulo:<22} p50={p['p50']:.1f}ms  p95={p['p95']:.1f}ms  memoria pico={pico / 1024 / 1024:.1f} MB")
+    if len({repr(sorted(r.items())) for r in resultados.values()}) != 1:
+        print("  ¡ATENCIÓN! los resultados difieren:", resultados)
+
+
+def bench_share_io(args):
+    """Share lento (fakeshare.SlowFS): stat en serie vs. stat_many, y un share colgado."""
+    d = tempfile.mkdtemp()
+    rutas = []
+    for i in range(args.archivos):
+        rutas.append(os.path.join(d, f"Entrega ACT-{i:06d}.pdf"))
+        with open(rutas[-1], "wb") as f:
+            f.write(b"x" * 100)
+    fs = fakeshare.SlowFS(latency=args.latency_ms / 1000.0)
+    io = share_io.ShareIO(workers=16, timeout=0.5,
+                          breaker=share_io.CircuitBreaker(threshold=3, reset_timeout=1.0), fs=fs)
+    print(f"share_io: {args.archivos} archivos, latencia {args.latency_ms}ms por operación")
+
+    t0 = time.perf_counter()
+    for r in rutas:
+        fs.stat(r)
+    serie = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    res = io.stat_many(rutas, timeout=60)
+    lote = (time.perf_counter() - t0) * 1000
+    print(f"  stat en serie          {serie:.0f}ms")
+    print(f"  stat_many              {lote:.0f}ms  ({sum(v is not None for v in res.values())} ok, "
+          f"concurrencia máx {fs.max_concurrent})")
+
+    fs.hang()
+    print("  share colgado (plazo 0.5s, circuito tras 3 fallos):")
+    for i in range(5):
+        t0 = time.perf_counter()
+        try:
+            io.isfile(rutas[0])
+            resultado = "ok"
+        except share_io.ShareIOError as e:
+            resultado = type(e).__name__
+        print(f"    isfile #{i + 1}: {resultado:<17} {(time.perf_counter() - t0) * 1000:7.1f}ms  "
+              f"circuito={io.breaker.state}")
+    fs.recover()
+    time.sleep(io.breaker.reset_timeout)
+    t0 = time.perf_counter()
+    ok = io.isfile(rutas[0])
+    print(f"    recuperado: isfile={ok} {(time.perf_counter() - t0) * 1000:.1f}ms  circuito={io.breaker.state}")
+    print(f"  {io.stats()}")
+    io.close()
+
+
+def bench_search(args):
+    """Typeahead: SearchIndex en memoria vs. los LIKE '%x%' de query_dispositivos."""
+    uri = "file:bench_search?mode=memory&cache=shared"
+    keep = seed(uri, args.devices, cambios=0, personas=max(300, args.devices // 5))
+    db.configure_pool(connect=lambda: fakedb.connect(uri, latency=args.latency_ms / 1000.0), minsize=1, maxsize=4)
+    db.cache.enabled = False
+    idx = search_index.SearchIndex(db.equipos_para_busqueda, db.personas_para_busqueda)
+    t0 = time.perf_counter()
+    idx.rebuild()
+    print(f"search: {args.devices} equipos, índice construido en {(time.perf_counter() - t0) * 1000:.0f}ms "
+          f"({idx.stats()['trigramas']} trigramas)")
+    iters = args.iters or 50
+    consultas = ["ACT-000123", "000123", "persona 17", "lenovo", "sede 3", "t14", "sn0000077", "ac"]
+    for q in consultas:
+        tiempos = []
+        for _ in range(iters):
+            t0 = time.perf_counter()
+            idx.search(q, limit=10)
+            tiempos.append((time.perf_counter() - t0) * 1000)
+        p = _percentiles(tiempos)
+        t0 = time.perf_counter()
+        db.query_dispositivos(filtro_tag=q)
+        like = (time.perf_counter() - t0) * 1000
+        print(f"  {q!r:<14} índice p50={p['p50']:.2f}ms  p95={p['p95']:.2f}ms   LIKE (1 vez)={like:.1f}ms")
+    keep.close()
+
+
+def _fecha_antes(fecha):
+    """Camino anterior de db.py: strptime con tres formatos, excepción por cada fallo."""
+    if not fecha:
+        return None
+    txt = fecha.strip().replace('T', ' ')
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(txt, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def bench_fechas(args):
+    """Fechas de una carga masiva: bucle de strptime vs. fechas.parse_fecha."""
+    rnd = random.Random(7)
+    dias = [datetime.date(2024, 1, 1) + datetime.timedelta(days=d) for d in range(60)]
+    valores = []
+    for _ in range(args.filas):
+        d = rnd.choice(dias)
+        forma = rnd.random()
+        if forma < 0.6:
+            valores.append(d.isoformat())                          # sin hora: falla 2 formatos antes
+        elif forma < 0.8:
+            valores.append(f"{d.isoformat()}T{rnd.randrange(8, 18):02d}:{rnd.choice((0, 30)):02d}")
+        elif forma < 0.9:
+            valores.append(d.strftime("%d/%m/%Y"))                 # antes: None
+        else:
+            valores.append("")
+    n = len(valores)
+    # mismas respuestas en lo que ya se entendía
+    for v in valores:
+        a = _fecha_antes(v)
+        assert a is None or a == fechas.parse_fecha(v), v
+    iters = args.iters or 20
+    print(f"fechas: {n} valores ({len(set(valores))} distintos), {iters} pasadas")
+    for titulo, fn in (("strptime x3 formatos", _fecha_antes), ("fechas.parse_fecha", fechas.parse_fecha)):
+        tiempos = []
+        for _ in range(iters):
+            t0 = time.perf_counter()
+            for v in valores:
+                fn(v)
+            tiempos.append((time.perf_counter() - t0) * 1000)
+        p = _percentiles(tiempos)
+        print(f"  {titulo:<24} p50={p['p50']:.2f}ms  ({p['p50'] * 1000 / n:.2f}µs/valor)")
+    print(f"  LRU: {fechas.cache_info()}")
+
+
+def _historial_antes(cols, rows):
+    """Camino anterior: dict(zip(...)) por fila y otro dict con .lower() por clave."""
+    crudas = [dict(zip(cols, r)) for r in rows]
+    return [{db._HISTORIAL_KEYS.get(k.lower(), k): v for k, v in d.items()} for d in crudas]
+
+
+# La tabla de historial de device.html
+_TABLA_HISTORIAL = jinja2.Template("""{% for h in historial %}<tr>
+<td>{{ h.FechaCambio or '—' }}</td><td>{{ h.TipoCambio or '—' }}</td>
+<td>{{ h.Descripcion or '—' }}</td><td>{{ h.RegistradoPor or '—' }}</td></tr>{% endfor %}""")
+
+
+def bench_filas(args):
+    """Historial de un equipo con muchos cambios: dict por fila vs. filas.Fila."""
+    uri = "file:bench_filas?mode=memory&cache=shared"
+    keep = seed(uri, devices=1, cambios=args.cambios, personas=50)
+    conn = fakedb.connect(uri)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM ti.v_EquipoHistorial WHERE Tag = ?", ("ACT-000001",))
+    desc = cur.description
+    crudas = cur.fetchall()
+    cur.close()
+    cols = [c[0] for c in desc]
+    n = len(crudas)
+    caminos = (
+        ("antes (dict + normalizar)", lambda: _historial_antes(cols, crudas)),
+        ("filas.Fila", lambda: list(map(filas.clase_para(desc, db._clave_historial), crudas))),
+    )
+    a, d = caminos[0][1](), caminos[1][1]()
+    assert all(dict(y) == x for x, y in zip(a, d))
+
+    iters = args.iters or 20
+    print(f"filas: historial de {n} filas x {len(cols)} columnas, {iters} pasadas")
+    for titulo, fn in caminos:
+        tiempos, lectura = [], []
+        for _ in range(iters):
+            t0 = time.perf_counter()
+            rows = fn()
+            t1 = time.perf_counter()
+            _TABLA_HISTORIAL.render(historial=rows)
+            tiempos.append((t1 - t0) * 1000)
+            lectura.append((time.perf_counter() - t1) * 1000)
+            del rows
+        tracemalloc.start()
+        base = tracemalloc.take_snapshot()
+        rows = fn()
+        snap = tracemalloc.take_snapshot()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        dif = snap.compare_to(base, "filename")
+        bloques = sum(s.count_diff for s in dif)
+        retenido = sum(s.size_diff for s in dif)
+        del rows
+        print(f"  {titulo:<26} armar p50={_percentiles(tiempos)['p50']:.2f}ms  "
+              f"render p50={_percentiles(lectura)['p50']:.2f}ms  "
+              f"asignaciones retenidas={bloques}  ({retenido / 1024:.0f}KB, pico {pico / 1024:.0f}KB)")
+
+    db.configure_pool(connect=lambda: fakedb.connect(uri), minsize=1, maxsize=2)
+    db.cache.enabled = False
+    tiempos = []
+    for _ in range(iters):
+        t0 = time.perf_counter()
+        db.historial_por_equipo("ACT-000001")
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    print(f"  historial_por_equipo (fakedb, sin latencia) p50={_percentiles(tiempos)['p50']:.2f}ms")
+    conn.close()
+    keep.close()
+
+
+def bench_export(args):
+    """Exportación del historial completo: lista en memoria vs. fetchmany + stream."""
+    import exportar
+    from app import _COLUMNAS_HISTORIAL
+
+    uri = "file:bench_export?mode=memory&cache=shared"
+    keep = seed(uri, devices=args.devices, cambios=args.cambios)
+    db.configure_pool(connect=lambda: fakedb.connect(uri), minsize=1, maxsize=2)
+    db.cache.enabled = False
+    print(f"export: historial de {args.devices} equipos x {args.cambios} cambios")
+
+    def antes(formato):
+        # lo que hacía falta sin exportación: todo el historial en una lista
+        rows = list(db.iter_historial(solo_activos=False, chunk=10 ** 9))
+        return exportar.csv_stream(rows, _COLUMNAS_HISTORIAL, por_bloque=10 ** 9) if formato == "csv" \
+            else exportar.xlsx_stream(rows, _COLUMNAS_HISTORIAL)
+
+    def despues(formato):
+        filas_ = db.iter_historial(solo_activos=False, chunk=1000)
+        return exportar.csv_stream(filas_, _COLUMNAS_HISTORIAL) if formato == "csv" \
+            else exportar.xlsx_stream(filas_, _COLUMNAS_HISTORIAL)
+
+    for formato in ("csv", "xlsx"):
+        for titulo, fn in (("lista completa", antes), ("fetchmany + stream", despues)):
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            primero = None
+            total = 0
+            for trozo in fn(formato):
+                if primero is None:
+                    primero = time.perf_counter() - t0
+                total += len(trozo)
+            dt = time.perf_counter() - t0
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {formato:<4} {titulo:<20} total={dt:.2f}s  primer byte={primero * 1000:.0f}ms  "
+                  f"pico={pico / 2 ** 20:.1f}MB  ({total / 2 ** 20:.1f}MB)")
+    keep.close()
+
+
+BENCHES = {
+    "device_page": bench_device_page,
+    "autofill": bench_autofill,
+    "share_io": bench_share_io,
+    "search": bench_search,
+    "fechas": bench_fechas,
+    "filas": bench_filas,
+    "export": bench_export,
+}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("bench", choices=sorted(BENCHES))
+    ap.add_argument("--devices", type=int, default=2000)
+    ap.add_argument("--cambios", type=int, default=20)
+    ap.add_argument("--latency-ms", type=float, default=2.0)
+    ap.add_argument("--iters", type=int, default=None, help="por defecto depende del escenario")
+    ap.add_argument("--filas", type=int, default=5000)
+    ap.add_argument("--archivos", type=int, default=200)
+    args = ap.parse_args(argv)
+    BENCHES[args.bench](args)
+
+
+if __name__ == "__main__":
+    main()
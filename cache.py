@@ -0,0 +1,217 @@
+"""
+Caché de lectura (read-through) con invalidación por escritura.
+
+Las lecturas de db.py pasan por `Cache.get_or_load(grupo, partes, loader)`.
+La clave real incluye una *generación* por grupo; invalidar es incrementar
+esa generación (`Cache.invalidate(grupo)`), con lo que las entradas viejas
+quedan inalcanzables y se van por LRU/TTL. Eso tiene dos ventajas:
+
+  - funciona igual con un backend compartido (varios workers), y
+  - si una lectura lenta empezó antes de una escritura, lo que guarde queda
+    bajo la generación vieja y nunca se sirve.
+
+El backend por defecto vive en memoria del proceso (LRU + TTL, acotado por
+número de entradas y bytes aproximados). Para despliegues con varios workers
+se puede usar RedisBackend (requiere el paquete `redis`).
+"""
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def _sizeof(obj, _depth=0):
+    """Tamaño aproximado en bytes (recorre dicts/listas/tuplas poco profundas)."""
+    n = sys.getsizeof(obj)
+    if _depth > 4:
+        return n
+    if isinstance(obj, dict):
+        n += sum(_sizeof(k, _depth + 1) + _sizeof(v, _depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        n += sum(_sizeof(v, _depth + 1) for v in obj)
+    return n
+
+
+class LocalBackend:
+    """LRU + TTL en memoria, acotado por entradas y por bytes aproximados."""
+
+    def __init__(self, max_entries=4096, max_bytes=64 * 1024 * 1024, max_groups=1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_groups = max_groups
+        self._data = OrderedDict()   # clave -> (valor, vence, bytes)
+        # Generaciones por grupo, en LRU. Al expulsar un grupo su contador se
+        # pliega en `_gen_base`, que es la generación de todo grupo no
+        # registrado: así ninguna generación retrocede y una entrada vieja
+        # nunca vuelve a ser alcanzable.
+        self._gens = OrderedDict()
+        self._gen_base = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            valor, vence, size = item
+            if vence and vence < time.monotonic():
+                del self._data[key]
+                self._bytes -= size
+                return _MISSING
+            self._data.move_to_end(key)
+            return valor
+
+    def set(self, key, value, ttl):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        vence = time.monotonic() + ttl if ttl else 0
+        with self._lock:
+            previo = self._data.pop(key, None)
+            if previo is not None:
+                self._bytes -= previo[2]
+            self._data[key] = (value, vence, size)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, s) = self._data.popitem(last=False)
+                self._bytes -= s
+                self.evictions += 1
+
+    def generation(self, group):
+        with self._lock:
+            gen = self._gens.get(group)
+            if gen is None:
+                return self._gen_base
+            self._gens.move_to_end(group)
+            return gen
+
+    def bump(self, group):
+        with self._lock:
+            self._gens[group] = self._gens.pop(group, self._gen_base) + 1
+            while len(self._gens) > self.max_groups:
+                _, gen = self._gens.popitem(last=False)
+                self._gen_base = max(self._gen_base, gen)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._gens.clear()
+            self._gen_base = 0
+            self._bytes = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                "backend": "local",
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "groups": len(self._gens),
+                "max_groups": self.max_groups,
+            }
+
+
+class RedisBackend:
+    """Backend compartido entre workers. Los valores se guardan con pickle."""
+
+    def __init__(self, url, prefix="inventario_ti:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RedisBackend requiere el paquete 'redis' (pip install redis)")
+        self._r = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _k(self, key):
+        return self.prefix + repr(key)
+
+    def get(self, key):
+        raw = self._r.get(self._k(key))
+        return _MISSING if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl):
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if ttl:
+            self._r.setex(self._k(key), int(max(1, ttl)), raw)
+        else:
+            self._r.set(self._k(key), raw)
+
+    def generation(self, group):
+        raw = self._r.get(self._k(("gen", group)))
+        return int(raw) if raw is not None else 0
+
+    def bump(self, group):
+        self._r.incr(self._k(("gen", group)))
+
+    def clear(self):
+        for k in self._r.scan_iter(self.prefix + "*"):
+            self._r.delete(k)
+
+    def info(self):
+        return {"backend": "redis", "prefix": self.prefix}
+
+
+class Cache:
+    def __init__(self, backend=None, ttl=300.0, enabled=True):
+        self.backend = backend or LocalBackend()
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+
+    def _count(self, tabla, ns):
+        with self._lock:
+            tabla[ns] = tabla.get(ns, 0) + 1
+
+    def get_or_load(self, group, parts, loader, ttl=None):
+        """
+        Devuelve el valor cacheado para (group, parts) o llama a `loader()`.
+        `group` es la unidad de invalidación, p.ej. ("equipo", "ACT-001") o "listado".
+        Los valores devueltos se comparten entre peticiones: no mutarlos.
+        """
+        if not self.enabled:
+            return loader()
+        ns = group[0] if isinstance(group, tuple) else group
+        key = (group, self.backend.generation(group), parts)
+        valor = self.backend.get(key)
+        if valor is not _MISSING:
+            self._count(self._hits, ns)
+            return valor
+        self._count(self._misses, ns)
+        valor = loader()
+        self.backend.set(key, valor, self.ttl if ttl is None else ttl)
+        return valor
+
+    def invalidate(self, *groups):
+        for g in groups:
+            self.backend.bump(g)
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = dict(self._hits), dict(self._misses)
+        total_h, total_m = sum(hits.values()), sum(misses.values())
+        data = {
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "hits": total_h,
+            "misses": total_m,
+            "hit_ratio": round(total_h / (total_h + total_m), 4) if total_h + total_m else None,
+            "by_group": {ns: {"hits": hits.get(ns, 0), "misses": misses.get(ns, 0)}
+                         for ns in sorted(set(hits) | set(misses))},
+        }
+        data.update(self.backend.info())
+        return data
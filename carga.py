@@ -0,0 +1,362 @@
+"""
+Prueba de carga de la aplicación completa sin SQL Server ni carpeta de red.
+
+Por cada tamaño de flota:
+
+  1. Siembra una base fakedb en disco (SQLite en modo WAL) con N equipos,
+     sus cambios, personas y archivos principales (bench.seed); fakedb emula
+     las vistas, los ti.sp_* y el MERGE que usa db.py.
+  2. Genera una carpeta de red falsa: una hoja de entrega (.pdf) para parte
+     de los equipos, repartidas en Sede/Año como el share real, y algunas
+     .xlsx de entrega para el autollenado.
+  3. Levanta la app en un servidor WSGI con hilos en un puerto local y la
+     golpea con `--clientes` clientes concurrentes durante `--segundos`,
+     con una mezcla ponderada de rutas (index, device_view, device_link,
+     bajas, autofill; opcionales: buscar, registrar cambio y descargar el
+     archivo principal).
+
+Imprime p50/p95/p99, errores y throughput por ruta, más el tiempo en base
+que informa el encabezado Server-Timing. Con --salida se guarda como JSON
+para usarlo de línea base, y --comparar contra una línea base anterior
+marca las regresiones (y sale con código 1):
+
+    python carga.py --equipos 1000,10000 --clientes 8 --segundos 15 --salida base.json
+    python carga.py --equipos 1000,10000 --clientes 8 --segundos 15 --comparar base.json
+
+Las latencias incluyen el cliente HTTP en el mismo proceso; sirven para
+comparar una versión contra otra en la misma máquina, no como valores
+absolutos de producción.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import bench
+import db
+import fakedb
+
+# ruta -> peso por defecto
+MEZCLA = {
+    "index": 25,
+    "device": 40,
+    "device_link": 15,
+    "bajas": 5,
+    "autofill": 15,
+    "descarga": 0,
+    "buscar": 0,
+    "cambio": 0,
+    "persona": 0,
+}
+
+_RE_DB_TIMING = re.compile(r'\bdb;dur=([\d.]+)')
+
+
+# ---------- datos ----------
+
+def generar_share(root, equipos, fraccion=0.5, hojas_xlsx=200, pdf_kb=16, rnd=None):
+    """
+    Árbol Sede N/Año/ con 'Entrega ACT-xxxxxx.pdf' para `fraccion` de los
+    equipos y 'Entrega ACT-xxxxxx.xlsx' (una hoja de entrega real) para
+    hasta `hojas_xlsx`. Los .pdf pesan entre pdf_kb/2 y 2*pdf_kb KiB.
+    Devuelve {"xlsx": [rutas], "pdf": {tag: ruta}}.
+    """
+    rnd = rnd or random.Random(11)
+    plantilla = os.path.join(root, "_plantilla.xlsx")
+    os.makedirs(root, exist_ok=True)
+    bench._hoja_grande(plantilla, filas=30)
+    xlsx = []
+    pdf = {}
+    relleno = os.urandom(1024) * (pdf_kb * 2)
+    elegidos = rnd.sample(range(1, equipos + 1), max(1, int(equipos * fraccion)))
+    for n, i in enumerate(elegidos):
+        carpeta = os.path.join(root, f"Sede {i % 9}", str(2019 + i % 6))
+        os.makedirs(carpeta, exist_ok=True)
+        pdf[f"ACT-{i:06d}"] = ruta = os.path.join(carpeta, f"Entrega ACT-{i:06d}.pdf")
+        with open(ruta, "wb") as f:
+            f.write(b"%PDF-1.4\n% hoja de entrega\n" + relleno[:rnd.randint(pdf_kb // 2, pdf_kb * 2) * 1024])
+        if n < hojas_xlsx:
+            destino = os.path.join(carpeta, f"Entrega ACT-{i:06d}.xlsx")
+            shutil.copyfile(plantilla, destino)
+            xlsx.append(destino)
+    os.remove(plantilla)
+    return {"xlsx": xlsx, "pdf": pdf}
+
+
+def preparar(app_mod, trabajo, equipos, cambios, latency_ms, fraccion_share, pdf_kb=16,
+             share_latency_ms=0.0, share_mb_s=None):
+    """
+    Siembra la base y el share y apunta la app (ya importada) a ellos. Con
+    share_latency_ms / share_mb_s el share se lee a través de fakeshare.SlowFS.
+    """
+    from autofill_cache import AutofillCache
+    from search_index import SearchIndex
+    from share_index import ShareIndex
+
+    ruta_db = os.path.join(trabajo, "inventario.sqlite3")
+    keep = bench.seed(ruta_db, equipos, cambios, personas=max(300, equipos // 5))
+    keep._raw.execute("PRAGMA journal_mode=WAL")
+    keep._raw.execute("PRAGMA ti.journal_mode=WAL")
+    db.configure_pool(connect=lambda: fakedb.connect(ruta_db, latency=latency_ms / 1000.0),
+                      minsize=1, maxsize=16)
+    db.cache.clear()
+
+    root = os.path.join(trabajo, "share")
+    share = generar_share(root, equipos, fraccion_share, pdf_kb=pdf_kb)
+    # Los archivos principales apuntan a las hojas generadas
+    keep._raw.execute("DELETE FROM ti.EquipoArchivo")
+    keep._raw.executemany("INSERT INTO ti.EquipoArchivo(Tag, Ruta, Nombre, EsPrincipal) VALUES (?, ?, ?, 1)",
+                          [(t, r, os.path.basename(r)) for t, r in share["pdf"].items()])
+    keep.commit()
+    share["principales"] = sorted(share["pdf"])
+
+    app_mod.app.config['SHARE_WATCH_INTERVAL'] = 0
+    app_mod.SHARE_ROOT = root
+    if share_latency_ms or share_mb_s:
+        import fakeshare
+        app_mod.share_io.fs = fakeshare.SlowFS(latency=share_latency_ms / 1000.0, bandwidth_mb_s=share_mb_s)
+    app_mod.share_index = ShareIndex(root, os.path.join(trabajo, "share_index.sqlite3"),
+                                     exts=app_mod.ALLOWED_EXTS)
+    app_mod.share_index.rebuild()
+    app_mod.autofill_cache = AutofillCache(os.path.join(trabajo, "autofill.sqlite3"))
+    if app_mod.espejo is not None:
+        from espejo import EspejoLocal
+        app_mod.espejo = EspejoLocal(os.path.join(trabajo, "espejo"), max_bytes=app_mod.espejo.max_bytes,
+                                     share_io=app_mod.share_io)
+    app_mod.search_index = SearchIndex(db.equipos_para_busqueda, db.personas_para_busqueda)
+    db.al_escribir(app_mod.search_index.marcar)
+    return keep, share
+
+
+# ---------- clientes ----------
+
+def _peticion(nombre, rnd, equipos, share):
+    """(método, url, cuerpo, encabezados) de una petición de la ruta `nombre`."""
+    tag = f"ACT-{rnd.randint(1, equipos):06d}"
+    if nombre == "index":
+        return "GET", "/", None, {}
+    if nombre == "device":
+        return "GET", f"/device/{tag}", None, {}
+    if nombre == "device_link":
+        return "GET", f"/device/{tag}/link", None, {}
+    if nombre == "bajas":
+        return "GET", "/bajas", None, {}
+    if nombre == "autofill":
+        cuerpo = json.dumps({"ruta": rnd.choice(share["xlsx"])})
+        return "POST", "/new/autofill_from_path", cuerpo, {"Content-Type": "application/json"}
+    if nombre == "descarga":
+        return "GET", f"/device/{rnd.choice(share['principales'])}/principal/download", None, {}
+    if nombre == "buscar":
+        q = rnd.choice((tag[-4:], f"persona {rnd.randint(1, 300)}", "lenovo", "sede"))
+        return "GET", "/api/buscar?" + urllib.parse.urlencode({"q": q}), None, {}
+    if nombre == "persona":
+        nombre_p = f"Persona {rnd.randint(0, 299)}"
+        if rnd.random() < 0.5:
+            return "GET", "/search/person?" + urllib.parse.urlencode({"nombre": nombre_p}), None, {}
+        return "GET", f"/api/personas/{urllib.parse.quote(nombre_p)}/offboarding", None, {}
+    if nombre == "cambio":
+        cuerpo = urllib.parse.urlencode({"tipo": "MANTENIMIENTO", "descripcion": "carga",
+                                         "registrado_por": "carga"})
+        return "POST", f"/device/{tag}", cuerpo, {"Content-Type": "application/x-www-form-urlencoded"}
+    raise ValueError(nombre)
+
+
+def _cliente(puerto, mezcla, hasta, equipos, share, semilla, out, revalidar=False):
+    rnd = random.Random(semilla)
+    nombres, pesos = zip(*mezcla.items())
+    conn = http.client.HTTPConnection("127.0.0.1", puerto, timeout=60)
+    etags = {}   # url -> ETag, como la caché de un navegador (con --revalidar)
+    while time.perf_counter() < hasta:
+        nombre = rnd.choices(nombres, pesos)[0]
+        metodo, url, cuerpo, hdrs = _peticion(nombre, rnd, equipos, share)
+        if revalidar and metodo == "GET" and url in etags:
+            hdrs = dict(hdrs, **{"If-None-Match": etags[url]})
+        t0 = time.perf_counter()
+        try:
+            conn.request(metodo, url, body=cuerpo, headers=hdrs)
+            resp = conn.getresponse()
+            resp.read()
+            status = resp.status
+            if revalidar and resp.getheader("ETag"):
+                etags[url] = resp.getheader("ETag")
+            m = _RE_DB_TIMING.search(resp.getheader("Server-Timing") or "")
+            db_ms = float(m.group(1)) if m else None
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", puerto, timeout=60)
+            status, db_ms = 0, None
+        out.append((nombre, status, (time.perf_counter() - t0) * 1000, db_ms))
+    conn.close()
+
+
+def correr(app_mod, mezcla, clientes, segundos, equipos, share, semilla=1, revalidar=False):
+    from werkzeug.serving import make_server
+
+    srv = make_server("127.0.0.1", 0, app_mod.app, threaded=True)
+    hilo = threading.Thread(target=srv.serve_forever, daemon=True)
+    hilo.start()
+    try:
+        # Calentamiento: una petición por ruta (índices, plantillas, pool)
+        _cliente(srv.server_port, {k: 1 for k in mezcla}, time.perf_counter() + 0.5,
+                 equipos, share, semilla, [])
+        muestras = []
+        hasta = time.perf_counter() + segundos
+        hilos = [threading.Thread(target=_cliente,
+                                  args=(srv.server_port, mezcla, hasta, equipos, share, semilla + i, muestras, revalidar))
+                 for i in range(clientes)]
+        t0 = time.perf_counter()
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        total = time.perf_counter() - t0
+    finally:
+        srv.shutdown()
+    return muestras, total
+
+
+def resumir(muestras, total):
+    rutas = {}
+    for nombre in sorted({m[0] for m in muestras}):
+        mias = [m for m in muestras if m[0] == nombre]
+        ok = [m for m in mias if 200 <= m[1] < 400]
+        res = {"n": len(mias), "errores": len(mias) - len(ok), "rps": round(len(mias) / total, 1)}
+        if ok:
+            p = bench._percentiles([m[2] for m in ok])
+            res.update({k: round(v, 2) for k, v in p.items()})
+            dbs = [m[3] for m in ok if m[3] is not None]
+            if dbs:
+                res["db_p50"] = round(bench._percentiles(dbs)["p50"], 2)
+        rutas[nombre] = res
+    ok = [m[2] for m in muestras if 200 <= m[1] < 400]
+    general = {"n": len(muestras), "errores": len(muestras) - len(ok), "rps": round(len(muestras) / total, 1)}
+    if ok:
+        general.update({k: round(v, 2) for k, v in bench._percentiles(ok).items()})
+    return {"total": general, "rutas": rutas}
+
+
+def imprimir(equipos, res):
+    print(f"  {'ruta':<12} {'n':>6} {'err':>4} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'db p50':>7}")
+    for nombre, r in list(res["rutas"].items()) + [("TOTAL", res["total"])]:
+        def f(k):
+            return f"{r[k]:.1f}" if k in r else "-"
+        print(f"  {nombre:<12} {r['n']:>6} {r['errores']:>4} {r['rps']:>7.1f} {f('p50'):>8} {f('p95'):>8} "
+              f"{f('p99'):>8} {f('db_p50'):>7}")
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones: p95 peor o throughput menor que la base más allá de `tolerancia`."""
+    regresiones = []
+    for flota, res in actual["flotas"].items():
+        previo = base.get("flotas", {}).get(flota)
+        if not previo:
+            continue
+        print(f"\nvs. línea base ({flota} equipos):")
+        for nombre, r in list(res["rutas"].items()) + [("TOTAL", res["total"])]:
+            b = previo["total"] if nombre == "TOTAL" else previo["rutas"].get(nombre)
+            if not b or "p95" not in r or "p95" not in b:
+                continue
+            dp95 = r["p95"] / b["p95"] - 1 if b["p95"] else 0.0
+            drps = r["rps"] / b["rps"] - 1 if b["rps"] else 0.0
+            marca = ""
+            if dp95 > tolerancia or (nombre == "TOTAL" and drps < -tolerancia):
+                marca = "  <-- REGRESIÓN"
+                regresiones.append((flota, nombre, dp95, drps))
+            print(f"  {nombre:<12} p95 {b['p95']:>8.1f} -> {r['p95']:>8.1f} ({dp95:+.0%})  "
+                  f"req/s {b['rps']:>7.1f} -> {r['rps']:>7.1f} ({drps:+.0%}){marca}")
+    return regresiones
+
+
+def _mezcla(texto):
+    mezcla = dict(MEZCLA)
+    if texto:
+        for parte in texto.split(","):
+            k, _, v = parte.partition("=")
+            if k.strip() not in MEZCLA:
+                raise SystemExit(f"ruta desconocida en --mezcla: {k!r} (válidas: {', '.join(MEZCLA)})")
+            mezcla[k.strip()] = int(v)
+    return {k: v for k, v in mezcla.items() if v > 0}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--equipos", default="1000", help="tamaños de flota separados por coma, p. ej. 1000,10000,100000")
+    ap.add_argument("--cambios", type=int, default=5, help="cambios por equipo")
+    ap.add_argument("--clientes", type=int, default=8)
+    ap.add_argument("--segundos", type=float, default=10.0)
+    ap.add_argument("--latency-ms", type=float, default=1.0, help="round-trip simulado por sentencia SQL")
+    ap.add_argument("--share", type=float, default=0.5, help="fracción de equipos con hoja en el share")
+    ap.add_argument("--pdf-kb", type=int, default=16, help="tamaño medio de las hojas .pdf del share")
+    ap.add_argument("--share-latency-ms", type=float, default=0.0, help="latencia por stat/open en el share")
+    ap.add_argument("--share-mb-s", type=float, default=None, help="velocidad de lectura del share (MB/s)")
+    ap.add_argument("--mezcla", default="", help="pesos por ruta, p. ej. index=10,device=50,cambio=5")
+    ap.add_argument("--sin-cache", action="store_true", help="desactiva la caché de lecturas de db.py")
+    ap.add_argument("--revalidar", action="store_true",
+                    help="los clientes guardan el ETag de cada URL y mandan If-None-Match (visitas repetidas)")
+    ap.add_argument("--salida", help="guarda el resultado en este JSON (línea base)")
+    ap.add_argument("--comparar", help="JSON de una corrida anterior contra el cual comparar")
+    ap.add_argument("--tolerancia", type=float, default=0.25, help="margen antes de marcar regresión")
+    ap.add_argument("--conservar", action="store_true", help="no borrar la carpeta de trabajo")
+    args = ap.parse_args(argv)
+
+    import app as app_mod
+    import registro
+
+    mezcla = _mezcla(args.mezcla)
+    db.cache.enabled = not args.sin_cache
+    resultado = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar", "conservar")},
+        "mezcla": mezcla,
+        "flotas": {},
+    }
+    for equipos in (int(x) for x in args.equipos.split(",")):
+        trabajo = tempfile.mkdtemp(prefix=f"carga_{equipos}_")
+        log = open(os.path.join(trabajo, "app.log"), "w", encoding="utf-8")
+        registro.configurar("WARNING", stream=log)
+        try:
+            t0 = time.perf_counter()
+            keep, share = preparar(app_mod, trabajo, equipos, args.cambios, args.latency_ms, args.share,
+                                  args.pdf_kb, args.share_latency_ms, args.share_mb_s)
+            print(f"\n{equipos} equipos x {args.cambios} cambios, {len(app_mod.share_index.files())} archivos "
+                  f"en el share, preparado en {time.perf_counter() - t0:.1f}s; "
+                  f"{args.clientes} clientes x {args.segundos:g}s, latencia SQL {args.latency_ms:g}ms")
+            muestras, total = correr(app_mod, mezcla, args.clientes, args.segundos, equipos, share,
+                                     revalidar=args.revalidar)
+            res = resumir(muestras, total)
+            res["lentas"] = app_mod.peticiones_lentas.listar()["total"]
+            resultado["flotas"][str(equipos)] = res
+            imprimir(equipos, res)
+            db.configure_pool(connect=lambda: fakedb.connect(":memory:"), minsize=0, maxsize=1)
+            keep.close()
+        finally:
+            log.close()
+            if not args.conservar:
+                shutil.rmtree(trabajo, ignore_errors=True)
+            else:
+                print(f"  carpeta de trabajo: {trabajo}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"\nresultado guardado en {args.salida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        regresiones = comparar(resultado, base, args.tolerancia)
+        if regresiones:
+            print(f"\n{len(regresiones)} regresión(es) más allá de {args.tolerancia:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+GET condicionales: ETag fuerte, 304 Not Modified y Cache-Control por ruta.
+
+Las páginas de equipo, el inicio y las descargas del share se recalculaban y
+reenviaban completas en cada visita, aunque el navegador ya tuviera la misma
+versión. Ahora cada respuesta lleva un ETag calculado a partir de lo que
+determina su contenido:
+
+  - páginas: los datos que se van a renderizar (la fila del equipo, el
+    último CambioId del historial, el archivo principal...), que salen de la
+    caché de lecturas de db.py; con la caché caliente un 304 no toca la base
+    ni renderiza el template. Se mezcla además la versión de los templates,
+    para que un despliegue no deje páginas viejas pegadas.
+  - archivos: ruta, tamaño y mtime del stat; el 304 se decide antes de abrir
+    el archivo en el share.
+
+Con mensajes flash pendientes (la página después de un POST) no se usa ETag
+y se responde no-store: el mensaje se muestra una sola vez y un 304 lo haría
+desaparecer o lo dejaría pegado.
+
+Las políticas de Cache-Control van en app.config['CACHE_CONTROL'] por
+endpoint; el default es revalidar siempre ('private, no-cache'), que con un
+ETag cuesta un 304 sin cuerpo.
+"""
+import hashlib
+import os
+
+from flask import current_app, make_response, request, session
+
+POLITICA_DEFAULT = "private, no-cache"
+
+_version_plantillas = None
+
+
+def etag(*partes):
+    """ETag fuerte (sin comillas) para una tupla de valores con repr estable."""
+    return hashlib.blake2b(repr(partes).encode("utf-8", "surrogatepass"), digest_size=12).hexdigest()
+
+
+def version_plantillas():
+    """Huella de los templates (nombres y mtime): cambia con cada despliegue."""
+    global _version_plantillas
+    if _version_plantillas is None:
+        raiz = os.path.join(current_app.root_path, current_app.template_folder or "templates")
+        partes = []
+        for dirpath, _dirs, files in os.walk(raiz):
+            for f in sorted(files):
+                st = os.stat(os.path.join(dirpath, f))
+                partes.append((os.path.relpath(os.path.join(dirpath, f), raiz), st.st_size, st.st_mtime_ns))
+        _version_plantillas = etag(*sorted(partes))[:8]
+    return _version_plantillas
+
+
+def politica(endpoint=None):
+    return current_app.config.get("CACHE_CONTROL", {}).get(endpoint or request.endpoint, POLITICA_DEFAULT)
+
+
+def hay_flashes():
+    return bool(session.get("_flashes"))
+
+
+def ya_lo_tiene(valor):
+    """¿El navegador mandó If-None-Match con este ETag?"""
+    return request.if_none_match.contains(valor)
+
+
+def no_modificado(valor, last_modified=None):
+    """Respuesta 304 con los encabezados que exige el RFC (ETag, Cache-Control, Last-Modified)."""
+    rv = current_app.response_class(status=304)
+    rv.set_etag(valor)
+    if last_modified is not None:
+        rv.last_modified = last_modified
+    rv.headers["Cache-Control"] = politica()
+    return rv
+
+
+def pagina(partes, generar):
+    """
+    Responde una página HTML condicionalmente: `partes` es lo que determina
+    su contenido y generar() la renderiza (solo si hace falta).
+    """
+    if hay_flashes():
+        rv = make_response(generar())
+        rv.headers["Cache-Control"] = "no-store"
+        return rv
+    valor = etag(version_plantillas(), *partes)
+    if ya_lo_tiene(valor):
+        return no_modificado(valor)
+    rv = make_response(generar())
+    rv.set_etag(valor)
+    rv.headers["Cache-Control"] = politica()
+    return rv
+
+
+def etag_archivo(path, st):
+    """ETag de un archivo a partir de su stat: cambia si lo reemplazan o lo editan."""
+    return etag(path, st.st_size, getattr(st, "st_mtime_ns", int(st.st_mtime * 1e9)))
@@ -1,8 +1,19 @@
 import os
 import base64
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import datetime as _dt
 
+from pool import ConnectionPool
+from cache import Cache, LocalBackend, RedisBackend
+import filas
+import metricas
+from fechas import parse_fecha
+
 # Fallback: intenta pyodbc y si no, usa pypyodbc con el mismo alias
 try:
     import pyodbc
@@ -11,6 +22,9 @@ except ImportError:
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
+
 def get_connection():
     return pyodbc.connect(
         f"DRIVER={{{os.getenv('SQL_DRIVER', 'ODBC Driver 17 for SQL Server')}}};"
@@ -19,79 +33,284 @@ def get_connection():
         f"Trusted_Connection={os.getenv('SQL_TRUSTED','yes')};"
     )
 
+# ---------- Pool de conexiones ----------
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _crear_pool(connect=None, minsize=None, maxsize=None, idle_timeout=None, **kwargs):
+    return ConnectionPool(
+        metricas.contar_conexiones(connect or get_connection),
+        minsize=int(os.getenv('SQL_POOL_MIN', '1')) if minsize is None else minsize,
+        maxsize=int(os.getenv('SQL_POOL_MAX', '10')) if maxsize is None else maxsize,
+        idle_timeout=float(os.getenv('SQL_POOL_IDLE', '300')) if idle_timeout is None else idle_timeout,
+        **kwargs
+    )
+
+
+def configure_pool(connect=None, minsize=None, maxsize=None, idle_timeout=None, **kwargs):
+    """
+    (Re)crea el pool global. Lo no indicado se toma del .env:
+      SQL_POOL_MIN, SQL_POOL_MAX, SQL_POOL_IDLE (segundos).
+    `connect` permite inyectar otro driver (p.ej. fakedb.connect en pruebas).
+    """
+    global _pool
+    nuevo = _crear_pool(connect, minsize, maxsize, idle_timeout, **kwargs)
+    with _pool_lock:
+        viejo, _pool = _pool, nuevo
+    if viejo is not None:
+        viejo.close()
+    return nuevo
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _crear_pool()
+    return _pool
+
+
+@contextmanager
+def conexion():
+    """
+    Presta una conexión del pool; se devuelve (con rollback de lo no confirmado) al salir.
+    Las sentencias, filas y la espera por la conexión se miden (ver metricas.py).
+    """
+    t0 = time.perf_counter()
+    with get_pool().connection() as conn:
+        metricas.espera_conexion(time.perf_counter() - t0)
+        yield metricas.ConexionMedida(conn)
+
+
+def pool_stats():
+    return get_pool().stats()
+
+# ---------- Caché de lecturas ----------
+
+def _crear_cache():
+    """
+    CACHE_URL=redis://... usa un backend compartido entre workers; si no, memoria local
+    acotada por CACHE_MAX_ENTRIES / CACHE_MAX_MB (y CACHE_MAX_GROUPS contadores de
+    generación). CACHE_TTL en segundos, CACHE_ENABLED=0 la apaga.
+    """
+    url = os.getenv('CACHE_URL')
+    if url:
+        backend = RedisBackend(url)
+    else:
+        backend = LocalBackend(max_entries=int(os.getenv('CACHE_MAX_ENTRIES', '4096')),
+                               max_bytes=int(float(os.getenv('CACHE_MAX_MB', '64')) * 1024 * 1024),
+                               max_groups=int(os.getenv('CACHE_MAX_GROUPS', '1024')))
+    return Cache(backend, ttl=float(os.getenv('CACHE_TTL', '300')),
+                 enabled=os.getenv('CACHE_ENABLED', '1') != '0')
+
+
+cache = _crear_cache()
+
+# Grupos de invalidación por tag; 'listado' cubre todas las consultas de listados
+_GRUPOS_EQUIPO = ('equipo', 'historial', 'completo', 'listado')
+
+
+def _tag_key(tag):
+    # La intercalación de SQL Server es CI: 'act-1' y 'ACT-1' son el mismo equipo
+    return (tag or '').strip().upper()
+
+
+def _cache_por_tag(grupo):
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(tag, *args, **kwargs):
+            return cache.get_or_load((grupo, _tag_key(tag)), (args, tuple(sorted(kwargs.items()))),
+                                     lambda: fn(tag, *args, **kwargs))
+        return wrapper
+    return deco
+
+
+def _cache_listado(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return cache.get_or_load('listado', (fn.__name__, args, tuple(sorted(kwargs.items()))),
+                                 lambda: fn(*args, **kwargs))
+    return wrapper
+
+
+def _invalidar(tag, *grupos):
+    """Invalida exactamente los grupos afectados por una escritura sobre `tag`."""
+    for g in grupos:
+        cache.invalidate(g if g == 'listado' else (g, _tag_key(tag)))
+    for fn in _oyentes:
+        fn(tag, *grupos)
+
+
+# Funciones fn(tag, *grupos) avisadas después de cada escritura (p.ej. el índice de búsqueda)
+_oyentes = []
+
+
+def al_escribir(fn):
+    """Registra `fn(tag, *grupos)`; se llama tras cada escritura confirmada sobre `tag`."""
+    _oyentes.append(fn)
+    return fn
+
+
+def cache_stats():
+    return cache.stats()
+
 # ---------- SP helpers ----------
 
 def sp_equipo_upsert(tag, modelo=None, serial=None, ubicacion=None, persona_asignada=None, cargo=None):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        DECLARE @EquipoId INT;
-        EXEC ti.sp_Equipo_Upsert
-            @Tag=?, @Modelo=?, @Serial=?, @Ubicacion=?,
-            @PersonaAsignadaNombre=?, @Cargo=?,
-            @EquipoId=@EquipoId OUTPUT;
-        SELECT @EquipoId AS EquipoId;
-    """, (tag, modelo, serial, ubicacion, persona_asignada, cargo))
-    row = cur.fetchone()
-    eid = row[0] if row else None
-    conn.commit(); cur.close(); conn.close()
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            DECLARE @EquipoId INT;
+            EXEC ti.sp_Equipo_Upsert
+                @Tag=?, @Modelo=?, @Serial=?, @Ubicacion=?,
+                @PersonaAsignadaNombre=?, @Cargo=?,
+                @EquipoId=@EquipoId OUTPUT;
+            SELECT @EquipoId AS EquipoId;
+        """, (tag, modelo, serial, ubicacion, persona_asignada, cargo))
+        row = cur.fetchone()
+        eid = row[0] if row else None
+        conn.commit(); cur.close()
+    _invalidar(tag, *_GRUPOS_EQUIPO)
     return eid
 
 
+_SQL_AGREGAR_CAMBIO = """
+    EXEC ti.sp_Equipo_AgregarCambio
+        @Tag=?, @TipoCambio=?, @Descripcion=?, @FechaCambio=?, @PersonaRelacionada=?, @RegistradoPor=?;
+"""
+
+
 def sp_equipo_agregar_cambio(tag, tipo, desc=None, fecha=None, persona_rel=None, registrado_por='TI'):
     """
     Agrega un cambio al historial.
-    - fecha: puede venir como '', 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM', o 'YYYY-MM-DDTHH:MM'
-             Aquí la convertimos a datetime o la dejamos en None.
-    """
-    # --- Normalizar fecha ---
-    if isinstance(fecha, str):
-        fecha = fecha.strip()
-        if not fecha:
-            fecha = None
+    - fecha: texto ISO ('YYYY-MM-DD', 'YYYY-MM-DD HH:MM', 'YYYY-MM-DDTHH:MM'...), dd/mm/yyyy,
+             serial de Excel o datetime; ver fechas.parse_fecha. Si no se reconoce queda None.
+    """
+    fecha = parse_fecha(fecha)
+
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(_SQL_AGREGAR_CAMBIO, (tag, tipo, desc, fecha, persona_rel, registrado_por))
+        conn.commit()
+        cur.close()
+    _invalidar(tag, 'historial', 'completo')
+
+
+def _tags_existentes(cur, tags, chunk=500):
+    """{TAG_NORMALIZADO} de los `tags` que existen en ti.Equipo (un SELECT ... IN por chunk)."""
+    tags = sorted({t for t in tags if t})
+    out = set()
+    for i in range(0, len(tags), chunk):
+        parte = tags[i:i + chunk]
+        cur.execute(f"SELECT LTRIM(RTRIM(Tag)) FROM ti.Equipo WHERE Tag IN ({', '.join('?' * len(parte))})",
+                    tuple(parte))
+        out.update(_tag_key(r[0]) for r in cur.fetchall())
+    return out
+
+
+def _executemany_aislando(conn, cur, sql, filas):
+    """
+    executemany de `filas` [(indice, params)] en una transacción. Si el lote
+    falla se deshace y se parte en mitades hasta aislar las filas con error;
+    el resto se confirma. Devuelve [(indice, mensaje)] de las que fallaron.
+    """
+    if not filas:
+        return []
+    try:
+        cur.executemany(sql, [p for _, p in filas])
+        conn.commit()
+        return []
+    except Exception as e:
+        conn.rollback()
+        if len(filas) == 1:
+            return [(filas[0][0], str(e))]
+    mitad = len(filas) // 2
+    return (_executemany_aislando(conn, cur, sql, filas[:mitad]) +
+            _executemany_aislando(conn, cur, sql, filas[mitad:]))
+
+
+_CAMPOS_TEXTO_CAMBIO = ('tag', 'tipo', 'desc', 'persona_rel', 'registrado_por')
+
+
+def equipo_agregar_cambios_lote(cambios, batch_size=200, registrado_por='TI'):
+    """
+    Versión masiva de sp_equipo_agregar_cambio. `cambios` son dicts con las
+    claves tag, tipo, desc, fecha, persona_rel, registrado_por (como los
+    argumentos de la función individual).
+
+    Valida antes de ir a la base (cada fila un dict con campos de texto, tag y
+    tipo obligatorios, fecha legible, el equipo existe) y manda el resto con executemany + fast_executemany en
+    transacciones de `batch_size`. Un error en una fila no tumba el lote: se
+    aísla (ver _executemany_aislando) y se informa junto con las demás.
+    Devuelve {"total", "ok", "errores": [{"indice", "tag", "error"}], "lotes"}.
+    """
+    errores, validas = [], []
+    for i, c in enumerate(cambios):
+        if not isinstance(c, dict):
+            errores.append({"indice": i, "tag": None, "error": "cada cambio debe ser un objeto"})
+            continue
+        malos = [k for k in _CAMPOS_TEXTO_CAMBIO if c.get(k) is not None and not isinstance(c.get(k), str)]
+        if malos:
+            tag = c.get('tag').strip() if isinstance(c.get('tag'), str) else None
+            errores.append({"indice": i, "tag": tag, "error": "deben ser texto: " + ", ".join(malos)})
+            continue
+        tag = (c.get('tag') or '').strip()
+        tipo = (c.get('tipo') or '').strip()
+        fecha = c.get('fecha')
+        parsed = parse_fecha(fecha)
+        if not tag or not tipo:
+            errores.append({"indice": i, "tag": tag, "error": "tag y tipo son obligatorios"})
+        elif fecha not in (None, '') and parsed is None:
+            errores.append({"indice": i, "tag": tag, "error": f"fecha inválida: {fecha!r}"})
         else:
-            # Aceptar 'YYYY-MM-DDTHH:MM' o 'YYYY-MM-DD HH:MM[:SS]'
-            txt = fecha.replace('T', ' ')
-            parsed = None
-            for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
-                try:
-                    parsed = _dt.datetime.strptime(txt, fmt)
-                    break
-                except ValueError:
-                    pass
-            fecha = parsed  # si no parsea, queda None
-
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        EXEC ti.sp_Equipo_AgregarCambio
-            @Tag=?, @TipoCambio=?, @Descripcion=?, @FechaCambio=?, @PersonaRelacionada=?, @RegistradoPor=?;
-    """, (tag, tipo, desc, fecha, persona_rel, registrado_por))
-    conn.commit()
-    cur.close()
-    conn.close()
+            validas.append((i, tag, (tag, tipo, c.get('desc') or None, parsed, c.get('persona_rel') or None,
+                                     c.get('registrado_por') or registrado_por)))
+
+    lotes, tocados = 0, set()
+    with conexion() as conn:
+        cur = conn.cursor()
+        existentes = _tags_existentes(cur, [t for _, t, _ in validas])
+        filas = []
+        for i, tag, params in validas:
+            if _tag_key(tag) in existentes:
+                filas.append((i, params))
+            else:
+                errores.append({"indice": i, "tag": tag, "error": "el equipo no existe"})
+
+        cur.fast_executemany = True
+        fallidas = {}
+        for j in range(0, len(filas), batch_size):
+            lote = filas[j:j + batch_size]
+            fallidas.update(_executemany_aislando(conn, cur, _SQL_AGREGAR_CAMBIO, lote))
+            tocados.update(p[0] for i, p in lote if i not in fallidas)
+            lotes += 1
+        cur.close()
+
+    for i, params in filas:
+        if i in fallidas:
+            errores.append({"indice": i, "tag": params[0], "error": fallidas[i]})
+    for tag in {_tag_key(t) for t in tocados}:
+        _invalidar(tag, 'historial', 'completo')
+
+    errores.sort(key=lambda e: e["indice"])
+    return {"total": len(cambios), "ok": len(cambios) - len(errores), "errores": errores, "lotes": lotes}
 
 
 def sp_historial_por_persona(nombre):
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("EXEC ti.sp_Historial_PorPersona @Nombre=?", (nombre,))
-    cols = [c[0] for c in cur.description]
-    rows = [dict(zip(cols, r)) for r in cur.fetchall()]
-    cur.close(); conn.close()
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute("EXEC ti.sp_Historial_PorPersona @Nombre=?", (nombre,))
+        rows = filas.todas(cur)
+        cur.close()
     return rows
 
 # ---------- Consultas directas sobre la vista ----------
 
-def query_dispositivos(filtro_tag=None, filtro_persona=None, solo_activos=True):
-    """
-    Devuelve filas con claves en minúscula para que coincidan con el template:
-      tag, modelo, serial, ubicacion, personaasignada, estado, fechabaja
-    """
-    conn = get_connection()
-    cur = conn.cursor()
-
-    sql = """
-    SELECT
+_SQL_DISPOSITIVOS = """
+    SELECT {top}
         e.EquipoId                          AS equipoid,
         LTRIM(RTRIM(e.Tag))                 AS tag,
         e.Modelo                            AS modelo,
@@ -99,11 +318,16 @@ def query_dispositivos(filtro_tag=None, filtro_persona=None, solo_activos=True):
         e.Ubicacion                         AS ubicacion,
         ISNULL(e.Estado,'ACTIVO')           AS estado,
         e.FechaBaja                         AS fechabaja,
-        pa.Nombre                           AS personaasignada
+        pa.Nombre                           AS personaasignada,
+        e.Tag                               AS tagorden
     FROM ti.Equipo e
     LEFT JOIN ti.Persona pa ON pa.PersonaId = e.PersonaAsignadaId
     WHERE e.Tag IS NOT NULL AND LTRIM(RTRIM(e.Tag)) <> ''
-    """
+"""
+
+
+def _filtros_dispositivos(filtro_tag, filtro_persona, solo_activos):
+    sql = ""
     params = []
     if solo_activos:
         sql += " AND (e.Estado IS NULL OR e.Estado <> 'BAJA')"
@@ -113,104 +337,427 @@ def query_dispositivos(filtro_tag=None, filtro_persona=None, solo_activos=True):
     if filtro_persona:
         sql += " AND pa.Nombre LIKE ?"
         params.append(f"%{filtro_persona}%")
+    return sql, params
+
 
-    sql += " ORDER BY e.Tag"
+@_cache_listado
+def query_dispositivos(filtro_tag=None, filtro_persona=None, solo_activos=True):
+    """
+    Devuelve filas con claves en minúscula para que coincidan con el template:
+      tag, modelo, serial, ubicacion, personaasignada, estado, fechabaja
+    """
+    filtros, params = _filtros_dispositivos(filtro_tag, filtro_persona, solo_activos)
+    sql = _SQL_DISPOSITIVOS.format(top="") + filtros + " ORDER BY e.Tag, e.EquipoId"
 
-    cur.execute(sql, tuple(params))
-    cols = [c[0] for c in cur.description]
-    rows = [dict(zip(cols, r)) for r in cur.fetchall()]
-    cur.close(); conn.close()
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, tuple(params))
+        rows = filas.todas(cur)
+        cur.close()
     return rows
 
 
+@_cache_listado
+def query_dispositivos_pagina(filtro_tag=None, filtro_persona=None, solo_activos=True,
+                              despues=None, antes=None, limite=50):
+    """
+    Igual que query_dispositivos pero paginado por keyset sobre (Tag, EquipoId).
+      - despues: (tag, equipoid) de la última fila de la página anterior -> página siguiente
+      - antes:   (tag, equipoid) de la primera fila de la página actual   -> página previa
+    Cada página cuesta lo mismo sin importar cuántos equipos haya antes: la
+    condición de keyset aprovecha el orden del índice y solo se leen limite+1 filas.
+
+    Devuelve {"rows": [...], "siguiente": (tag, id) | None, "anterior": (tag, id) | None}.
+    """
+    filtros, params = _filtros_dispositivos(filtro_tag, filtro_persona, solo_activos)
+    return _pagina_por_tag(_SQL_DISPOSITIVOS, filtros, params, despues, antes, limite)
+
+
+def _pagina_por_tag(sql_base, filtros, params, despues, antes, limite):
+    """
+    Keyset sobre (Tag, EquipoId) para un SELECT con `{top}` que devuelve las
+    columnas tagorden y equipoid. Ver query_dispositivos_pagina.
+    """
+    params = list(params)
+    hacia_atras = antes is not None and despues is None
+    if despues is not None:
+        filtros += " AND (e.Tag > ? OR (e.Tag = ? AND e.EquipoId > ?))"
+        params += [despues[0], despues[0], despues[1]]
+    elif antes is not None:
+        filtros += " AND (e.Tag < ? OR (e.Tag = ? AND e.EquipoId < ?))"
+        params += [antes[0], antes[0], antes[1]]
+    orden = " ORDER BY e.Tag DESC, e.EquipoId DESC" if hacia_atras else " ORDER BY e.Tag, e.EquipoId"
+    # Pedimos una fila extra para saber si hay más allá de esta página
+    sql = sql_base.format(top="TOP (?)") + filtros + orden
+    params.insert(0, limite + 1)
+
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, tuple(params))
+        rows = filas.todas(cur)
+        cur.close()
+
+    hay_mas = len(rows) > limite
+    rows = rows[:limite]
+    if hacia_atras:
+        rows.reverse()
+
+    primera = (rows[0]['tagorden'], rows[0]['equipoid']) if rows else None
+    ultima = (rows[-1]['tagorden'], rows[-1]['equipoid']) if rows else None
+    if hacia_atras:
+        anterior = primera if hay_mas else None
+        siguiente = ultima
+    else:
+        anterior = primera if despues is not None else None
+        siguiente = ultima if hay_mas else None
+    return {"rows": rows, "siguiente": siguiente, "anterior": anterior}
+
+
+# ---------- Equipos dados de baja ----------
+
+# El motivo y quién la registró salen del último cambio BAJA del equipo
+# (sp_Equipo_DarBaja lo deja en ti.EquipoCambio); la subconsulta usa el
+# índice por EquipoId y solo corre para las filas en BAJA.
+_SQL_BAJAS = """
+    SELECT {top}
+        e.EquipoId                          AS equipoid,
+        LTRIM(RTRIM(e.Tag))                 AS tag,
+        e.Marca                             AS marca,
+        e.Modelo                            AS modelo,
+        e.Serial                            AS serial,
+        e.Ubicacion                         AS ubicacion,
+        pa.Nombre                           AS personaasignada,
+        e.FechaBaja                         AS fechabaja,
+        cb.Descripcion                      AS motivo,
+        cb.RegistradoPor                    AS registradopor,
+        e.Tag                               AS tagorden
+    FROM ti.Equipo e
+    LEFT JOIN ti.Persona pa ON pa.PersonaId = e.PersonaAsignadaId
+    LEFT JOIN ti.EquipoCambio cb ON cb.CambioId = (
+        SELECT MAX(c.CambioId) FROM ti.EquipoCambio c
+        WHERE c.EquipoId = e.EquipoId AND c.TipoCambio = 'BAJA')
+    WHERE e.Estado = 'BAJA' AND e.Tag IS NOT NULL AND LTRIM(RTRIM(e.Tag)) <> ''
+"""
+
+
+def _rango_fechas(columna, desde=None, hasta=None):
+    """Condición desde/hasta sobre `columna`; `hasta` sin hora incluye el día completo."""
+    sql = ""
+    params = []
+    desde = parse_fecha(desde)
+    if desde:
+        sql += f" AND {columna} >= ?"
+        params.append(desde)
+    hasta = parse_fecha(hasta)
+    if hasta:
+        if hasta.time() == _dt.time(0):
+            sql += f" AND {columna} < ?"
+            params.append(hasta + _dt.timedelta(days=1))
+        else:
+            sql += f" AND {columna} <= ?"
+            params.append(hasta)
+    return sql, params
+
+
+def _filtros_bajas(desde=None, hasta=None, motivo=None, filtro_tag=None):
+    """
+    desde/hasta: cualquier forma que entienda parse_fecha (ver _rango_fechas).
+    motivo y filtro_tag: texto contenido (LIKE).
+    """
+    sql, params = _rango_fechas("e.FechaBaja", desde, hasta)
+    if motivo:
+        sql += " AND cb.Descripcion LIKE ?"
+        params.append(f"%{motivo}%")
+    if filtro_tag:
+        sql += " AND e.Tag LIKE ?"
+        params.append(f"%{filtro_tag}%")
+    return sql, params
+
+
+@_cache_listado
+def query_bajas_pagina(desde=None, hasta=None, motivo=None, filtro_tag=None,
+                       despues=None, antes=None, limite=50):
+    """
+    Equipos en BAJA filtrados en SQL por fecha de baja, motivo y tag, con el
+    mismo keyset que query_dispositivos_pagina. Antes /bajas traía toda la
+    tabla de equipos (activos incluidos) y filtraba en Python.
+    """
+    filtros, params = _filtros_bajas(desde, hasta, motivo, filtro_tag)
+    return _pagina_por_tag(_SQL_BAJAS, filtros, params, despues, antes, limite)
+
+
+def iter_bajas(desde=None, hasta=None, motivo=None, filtro_tag=None, chunk=500):
+    """
+    Todas las bajas que cumplen los filtros, de a `chunk` filas por viaje
+    (para exportar). Generador: la conexión queda tomada hasta agotarlo o
+    cerrarlo.
+    """
+    filtros, params = _filtros_bajas(desde, hasta, motivo, filtro_tag)
+    sql = _SQL_BAJAS.format(top="") + filtros + " ORDER BY e.Tag, e.EquipoId"
+    yield from _iterar(sql, params, chunk)
+
+
+# ---------- Exportación (de a lotes, sin armar la lista completa) ----------
+
+def _iterar(sql, params=(), chunk=500, renombrar=None):
+    """
+    Filas de `sql` de a `chunk` por viaje. El cursor de pyodbc es de solo
+    avance: el servidor va entregando el result set a medida que se pide, sin
+    materializarlo de este lado. La conexión queda tomada mientras se itera.
+    """
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, tuple(params))
+            yield from filas.en_lotes(cur, chunk, renombrar)
+        finally:
+            cur.close()
+
+
+def iter_dispositivos(filtro_tag=None, filtro_persona=None, solo_activos=True, chunk=500):
+    """Mismas filas y filtros que query_dispositivos, de a `chunk` filas (para exportar)."""
+    filtros, params = _filtros_dispositivos(filtro_tag, filtro_persona, solo_activos)
+    sql = _SQL_DISPOSITIVOS.format(top="") + filtros + " ORDER BY e.Tag, e.EquipoId"
+    yield from _iterar(sql, params, chunk)
+
+
+_SQL_HISTORIAL_EXPORT = """
+    SELECT h.*
+    FROM ti.v_EquipoHistorial h
+    JOIN ti.Equipo e        ON e.EquipoId = h.EquipoId
+    LEFT JOIN ti.Persona pa ON pa.PersonaId = e.PersonaAsignadaId
+    WHERE e.Tag IS NOT NULL AND LTRIM(RTRIM(e.Tag)) <> ''
+"""
+
+
+def iter_historial(filtro_tag=None, filtro_persona=None, solo_activos=True, desde=None, hasta=None,
+                   chunk=500):
+    """
+    Historial completo (ti.v_EquipoHistorial) de los equipos que cumplen los
+    filtros de query_dispositivos, opcionalmente acotado por FechaCambio.
+    Claves como historial_por_equipo; ordenado por equipo y luego por fecha.
+    """
+    filtros, params = _filtros_dispositivos(filtro_tag, filtro_persona, solo_activos)
+    rango, p_rango = _rango_fechas("h.FechaCambio", desde, hasta)
+    sql = (_SQL_HISTORIAL_EXPORT + filtros + rango
+           + " ORDER BY e.Tag, e.EquipoId, h.FechaCambio, h.CambioId")
+    yield from _iterar(sql, params + p_rango, chunk, _clave_historial)
+
+
+# Normaliza las claves a formato esperado por Jinja (camel-case)
+_HISTORIAL_KEYS = {
+    'tag': 'Tag',
+    'equipoid': 'EquipoId',
+    'modelo': 'Modelo',
+    'serial': 'Serial',
+    'ubicacion': 'Ubicacion',
+    'personaasignadaid': 'PersonaAsignadaId',
+    'personaasignada': 'PersonaAsignada',
+    'cambioid': 'CambioId',
+    'tipocambio': 'TipoCambio',
+    'descripcion': 'Descripcion',
+    'fechacambio': 'FechaCambio',
+    'registradopor': 'RegistradoPor',
+    'fecharegistro': 'FechaRegistro',
+    'personacambioid': 'PersonaCambioId',
+    'personacambio': 'PersonaCambio',
+}
+
+
+def _clave_historial(col):
+    """Columna de ti.v_EquipoHistorial -> clave del template (una vez por descripción)."""
+    return _HISTORIAL_KEYS.get(col.lower(), col)
+
+
+@_cache_por_tag('historial')
 def historial_por_equipo(tag):
     safe_tag = (tag or "").strip()
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT *
-        FROM ti.v_EquipoHistorial
-        WHERE LTRIM(RTRIM(Tag)) = ?
-        ORDER BY
-            CASE WHEN FechaCambio IS NULL THEN 1 ELSE 0 END,
-            FechaCambio DESC,
-            CambioId DESC
-    """, (safe_tag,))
-
-    cols = [c[0] for c in cur.description]
-    raw = [dict(zip(cols, r)) for r in cur.fetchall()]
-    cur.close(); conn.close()
-
-    # Normaliza las claves a formato esperado por Jinja (camel-case)
-    norm_map = {
-        'tag': 'Tag',
-        'equipoid': 'EquipoId',
-        'modelo': 'Modelo',
-        'serial': 'Serial',
-        'ubicacion': 'Ubicacion',
-        'personaasignadaid': 'PersonaAsignadaId',
-        'personaasignada': 'PersonaAsignada',
-        'cambioid': 'CambioId',
-        'tipocambio': 'TipoCambio',
-        'descripcion': 'Descripcion',
-        'fechacambio': 'FechaCambio',
-        'registradopor': 'RegistradoPor',
-        'fecharegistro': 'FechaRegistro',
-        'personacambioid': 'PersonaCambioId',
-        'personacambio': 'PersonaCambio',
-    }
-
-    rows = []
-    for r in raw:
-        norm = {}
-        for k, v in r.items():
-            key = norm_map.get(k.lower(), k)
-            norm[key] = v
-        rows.append(norm)
-
-    # Debug para consola
-    print(f"[historial_por_equipo] tag={safe_tag!r}, filas={len(rows)}")
-    if rows:
-        print(" ejemplo:", {k: rows[0].get(k) for k in ("Tag","CambioId","TipoCambio","FechaCambio","RegistradoPor")})
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT *
+            FROM ti.v_EquipoHistorial
+            WHERE LTRIM(RTRIM(Tag)) = ?
+            ORDER BY
+                CASE WHEN FechaCambio IS NULL THEN 1 ELSE 0 END,
+                FechaCambio DESC,
+                CambioId DESC
+        """, (safe_tag,))
 
+        rows = filas.todas(cur, _clave_historial)
+        cur.close()
+    log.debug("historial_por_equipo tag=%r filas=%d", safe_tag, len(rows))
     return rows
 
 
+_SQL_REASIGNAR = """
+    EXEC ti.sp_Equipo_Reasignar
+        @Tag=?, @NuevaPersona=?, @Cargo=?, @FechaCambio=?, @RegistradoPor=?, @Descripcion=?;
+"""
+
+_SQL_DAR_BAJA = """
+    EXEC ti.sp_Equipo_DarBaja
+        @Tag=?, @Motivo=?, @FechaBaja=?, @RegistradoPor=?;
+"""
+
+
 def sp_equipo_reasignar(tag, nueva_persona, cargo=None, fecha=None, registrado_por='TI', descripcion=None):
-    # normaliza fecha
-    parsed = None
-    if fecha:
-        txt = fecha.replace('T', ' ')
-        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
-            try:
-                parsed = _dt.datetime.strptime(txt, fmt); break
-            except ValueError:
-                pass
+    parsed = parse_fecha(fecha)
 
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("""
-        EXEC ti.sp_Equipo_Reasignar
-            @Tag=?, @NuevaPersona=?, @Cargo=?, @FechaCambio=?, @RegistradoPor=?, @Descripcion=?;
-    """, (tag, nueva_persona, cargo, parsed, registrado_por, descripcion))
-    conn.commit(); cur.close(); conn.close()
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(_SQL_REASIGNAR, (tag, nueva_persona, cargo, parsed, registrado_por, descripcion))
+        conn.commit(); cur.close()
+    _invalidar(tag, *_GRUPOS_EQUIPO)
 
 
 def sp_equipo_dar_baja(tag, motivo=None, fecha_baja=None, registrado_por='TI'):
-    parsed = None
-    if fecha_baja:
-        txt = fecha_baja.replace('T', ' ')
-        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+    parsed = parse_fecha(fecha_baja)
+
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(_SQL_DAR_BAJA, (tag, motivo, parsed, registrado_por))
+        conn.commit(); cur.close()
+    _invalidar(tag, *_GRUPOS_EQUIPO)
+
+
+def _por_lotes_todo_o_nada(tags, sql, params_de, batch_size):
+    """
+    Corre `sql` para cada tag (params_de(tag) -> tupla) en lotes de
+    `batch_size`: un executemany + fast_executemany y un commit por lote, en
+    una sola conexión. Si algo del lote falla se deshace el lote entero y se
+    sigue con el siguiente.
+    Devuelve el resumen {"total", "ok", "no_existen", "lotes": [...]}.
+    """
+    pedidos = list(dict.fromkeys((t or '').strip() for t in tags if (t or '').strip()))
+    resumen = {"total": len(pedidos), "ok": 0, "no_existen": [], "lotes": []}
+    hechos = []
+    with conexion() as conn:
+        cur = conn.cursor()
+        existentes = _tags_existentes(cur, pedidos)
+        validos = []
+        for t in pedidos:
+            (validos if _tag_key(t) in existentes else resumen["no_existen"]).append(t)
+        cur.fast_executemany = True
+        for i in range(0, len(validos), batch_size):
+            lote = validos[i:i + batch_size]
+            t0 = time.perf_counter()
+            info = {"lote": len(resumen["lotes"]) + 1, "tags": lote, "ok": True, "error": None}
             try:
-                parsed = _dt.datetime.strptime(txt, fmt); break
-            except ValueError:
-                pass
+                cur.executemany(sql, [params_de(t) for t in lote])
+                conn.commit()
+                resumen["ok"] += len(lote)
+                hechos += lote
+            except Exception as e:
+                conn.rollback()
+                info.update(ok=False, error=str(e))
+            info["segundos"] = round(time.perf_counter() - t0, 3)
+            resumen["lotes"].append(info)
+        cur.close()
+
+    for t in hechos:
+        _invalidar(t, *_GRUPOS_EQUIPO)
+    return resumen
+
+
+def equipos_reasignar_lote(tags, nueva_persona, cargo=None, fecha=None, registrado_por='TI',
+                           descripcion=None, batch_size=100):
+    """
+    Reasigna muchos equipos a la misma persona (mudanzas de oficina).
+    Misma regla que sp_equipo_reasignar, pero en lotes todo-o-nada de
+    `batch_size` sobre una sola conexión. Ver _por_lotes_todo_o_nada.
+    """
+    parsed = parse_fecha(fecha)
+    return _por_lotes_todo_o_nada(
+        tags, _SQL_REASIGNAR,
+        lambda t: (t, nueva_persona, cargo, parsed, registrado_por, descripcion),
+        batch_size)
+
+
+def equipos_dar_baja_lote(tags, motivo=None, fecha_baja=None, registrado_por='TI', batch_size=100):
+    """Da de baja muchos equipos (renovación de hardware), en lotes todo-o-nada."""
+    parsed = parse_fecha(fecha_baja)
+    return _por_lotes_todo_o_nada(
+        tags, _SQL_DAR_BAJA,
+        lambda t: (t, motivo, parsed, registrado_por),
+        batch_size)
 
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("""
-        EXEC ti.sp_Equipo_DarBaja
-            @Tag=?, @Motivo=?, @FechaBaja=?, @RegistradoPor=?;
-    """, (tag, motivo, parsed, registrado_por))
-    conn.commit(); cur.close(); conn.close()
+
+def _resolver_persona(cur, nombre, area=None, cargo=None, tipo_ubicacion='ALMACEN'):
+    """
+    Crea/obtiene el PersonaId con sp_Persona_Upsert(@Nombre,@Area,@Cargo,@PersonaId OUTPUT)
+    (si tipo_ubicacion == 'ADMINISTRATIVO', pasamos area/cargo al SP, si no, pasamos NULLs).
+    """
+    area = area if tipo_ubicacion == 'ADMINISTRATIVO' else None
+    cargo = cargo if tipo_ubicacion == 'ADMINISTRATIVO' else None
+    try:
+        # Llamamos al mismo SP tanto para ADMINISTRATIVO como para ALMACEN (SP acepta Area/Cargo NULL)
+        cur.execute("""
+            DECLARE @PersonaId INT;
+            EXEC ti.sp_Persona_Upsert @Nombre=?, @Area=?, @Cargo=?, @PersonaId=@PersonaId OUTPUT;
+            SELECT @PersonaId AS PersonaId;
+        """, (nombre, area, cargo))
+
+        row = cur.fetchone()
+        persona_id = row[0] if row else None
+
+        # consumir posibles resultsets adicionales para evitar "Invalid cursor state"
+        while cur.nextset():
+            pass
+        return persona_id
+    except Exception:
+        # fallback: si por alguna razón el SP falla, intentar INSERT/SELECT simple
+        try:
+            cur.execute("SELECT PersonaId FROM ti.Persona WHERE Nombre = ?", (nombre,))
+            r = cur.fetchone()
+            if r:
+                return r[0]
+            cur.execute("INSERT INTO ti.Persona (Nombre, Area, Cargo) VALUES (?, ?, ?)",
+                        (nombre, area, cargo))
+            cur.execute("SELECT SCOPE_IDENTITY()")
+            r2 = cur.fetchone()
+            return int(r2[0]) if r2 and r2[0] else None
+        except Exception:
+            return None
+
+
+_SQL_EQUIPO_MERGE = """
+    MERGE ti.Equipo AS target
+    USING (SELECT CAST(? AS NVARCHAR(50)) AS Tag) AS src
+    ON (target.Tag = src.Tag)
+    WHEN MATCHED THEN
+        UPDATE SET
+            Marca           = ?,
+            Modelo          = ?,
+            Serial          = ?,
+            Ubicacion       = ?,
+            TipoEquipo      = ?,    -- equipo entregado (p.ej. Portátil)
+            TipoUbicacion   = ?,    -- ALMACEN / ADMINISTRATIVO
+            PersonaAsignadaId = COALESCE(?, target.PersonaAsignadaId),
+            Area            = ?,
+            Cargo           = ?,
+            Cargador        = ?,
+            Maletin         = ?,
+            Mouse           = ?,
+            Teclado         = ?,
+            Impresora       = ?,
+            Lector          = ?,
+            Observaciones   = ?
+    WHEN NOT MATCHED THEN
+        INSERT (Tag, Marca, Modelo, Serial, Ubicacion, TipoEquipo, TipoUbicacion, PersonaAsignadaId,
+                Area, Cargo, Cargador, Maletin, Mouse, Teclado, Impresora, Lector, Observaciones)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+
+def _params_equipo_merge(tag, marca, modelo, serial, ubicacion, persona_id,
+                         cargador, maletin, mouse, teclado, observaciones,
+                         impresora, lector, tipo_equipo, tipo_ubicacion, area, cargo):
+    valores = (marca, modelo, serial, ubicacion, tipo_equipo, tipo_ubicacion, persona_id,
+               area, cargo,
+               cargador, maletin, mouse, teclado, impresora, lector, observaciones)
+    # USING (tag) + UPDATE values + INSERT values (mismo orden que el MERGE)
+    return (tag,) + valores + (tag,) + valores
 
 
 def equipo_upsert_completo(tag, marca, modelo, serial, ubicacion, persona_asignada,
@@ -225,163 +772,329 @@ def equipo_upsert_completo(tag, marca, modelo, serial, ubicacion, persona_asigna
       - Luego hace MERGE en ti.Equipo (inserta/actualiza). Usa COALESCE para no sobrescribir PersonaAsignadaId
         cuando la persona no fue enviada.
     """
-    conn = get_connection()
-    cur = conn.cursor()
-
     # normalizar tag y nombre
     tag = (tag or '').strip()
     nombre = (persona_asignada or '').strip()
 
-    persona_id = None
+    with conexion() as conn:
+        cur = conn.cursor()
 
-    # 1) Resolver Persona con el SP (si enviaron nombre)
-    if nombre:
-        try:
-            # Llamamos al mismo SP tanto para ADMINISTRATIVO como para ALMACEN (SP acepta Area/Cargo NULL)
-            cur.execute("""
-                DECLARE @PersonaId INT;
-                EXEC ti.sp_Persona_Upsert @Nombre=?, @Area=?, @Cargo=?, @PersonaId=@PersonaId OUTPUT;
-                SELECT @PersonaId AS PersonaId;
-            """, (nombre, area if tipo_ubicacion == 'ADMINISTRATIVO' else None, cargo if tipo_ubicacion == 'ADMINISTRATIVO' else None))
+        # 1) Resolver Persona con el SP (si enviaron nombre)
+        persona_id = _resolver_persona(cur, nombre, area, cargo, tipo_ubicacion) if nombre else None
 
-            row = cur.fetchone()
-            persona_id = row[0] if row else None
+        # 2) MERGE/UPSERT en ti.Equipo
+        cur.execute(_SQL_EQUIPO_MERGE, _params_equipo_merge(
+            tag, marca, modelo, serial, ubicacion, persona_id,
+            cargador, maletin, mouse, teclado, observaciones,
+            impresora, lector, tipo_equipo, tipo_ubicacion, area, cargo))
+        conn.commit()
+        cur.close()
+    _invalidar(tag, *_GRUPOS_EQUIPO)
 
-            # consumir posibles resultsets adicionales para evitar "Invalid cursor state"
-            while cur.nextset():
-                pass
-        except Exception:
-            # fallback: si por alguna razón el SP falla, intentar INSERT/SELECT simple
-            try:
-                cur.execute("SELECT PersonaId FROM ti.Persona WHERE Nombre = ?", (nombre,))
-                r = cur.fetchone()
-                if r:
-                    persona_id = r[0]
-                else:
-                    cur.execute("INSERT INTO ti.Persona (Nombre, Area, Cargo) VALUES (?, ?, ?)",
-                                (nombre, area if tipo_ubicacion == 'ADMINISTRATIVO' else None,
-                                 cargo if tipo_ubicacion == 'ADMINISTRATIVO' else None))
-                    cur.execute("SELECT SCOPE_IDENTITY()")
-                    r2 = cur.fetchone()
-                    persona_id = int(r2[0]) if r2 and r2[0] else None
-            except Exception:
-                persona_id = None
-
-    # 2) MERGE/UPSERT en ti.Equipo
-    #    *** ESTO AHORA ESTÁ DENTRO DE LA FUNCIÓN ***
-    sql ="""
-        MERGE ti.Equipo AS target
-        USING (SELECT CAST(? AS NVARCHAR(50)) AS Tag) AS src
-        ON (target.Tag = src.Tag)
-        WHEN MATCHED THEN
-            UPDATE SET
-                Marca           = ?,
-                Modelo          = ?,
-                Serial          = ?,
-                Ubicacion       = ?,
-                TipoEquipo      = ?,    -- equipo entregado (p.ej. Portátil)
-                TipoUbicacion   = ?,    -- ALMACEN / ADMINISTRATIVO
-                PersonaAsignadaId = COALESCE(?, target.PersonaAsignadaId),
-                Area            = ?,
-                Cargo           = ?,
-                Cargador        = ?,
-                Maletin         = ?,
-                Mouse           = ?,
-                Teclado         = ?,
-                Impresora       = ?,
-                Lector          = ?,
-                Observaciones   = ?
-        WHEN NOT MATCHED THEN
-            INSERT (Tag, Marca, Modelo, Serial, Ubicacion, TipoEquipo, TipoUbicacion, PersonaAsignadaId,
-                    Area, Cargo, Cargador, Maletin, Mouse, Teclado, Impresora, Lector, Observaciones)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-    """
-
-    params = (
-            # USING (tag)
-            tag,
-            # UPDATE values (in same order as UPDATE SET above)
-            marca, modelo, serial, ubicacion, tipo_equipo, tipo_ubicacion, persona_id,
-            area, cargo,
-            cargador, maletin, mouse, teclado, impresora, lector, observaciones,
-            # INSERT values (same order as INSERT list)
-            tag, marca, modelo, serial, ubicacion, tipo_equipo, tipo_ubicacion, persona_id,
-            area, cargo,
-            cargador, maletin, mouse, teclado, impresora, lector, observaciones
-    )
 
-    cur.execute(sql, params)
-    conn.commit()
-    cur.close()
-    conn.close()
+def equipo_upsert_lote(registros, batch_size=500):
+    """
+    Upsert masivo de equipos (importador de hojas de entrega).
+    `registros` son dicts con las mismas claves que los argumentos de
+    equipo_upsert_completo (tag, marca, modelo, ..., tipo_ubicacion, area, cargo).
+
+    Resuelve cada persona distinta una sola vez y manda el MERGE con
+    executemany + fast_executemany en lotes de `batch_size`, todo sobre una
+    sola conexión y con un commit por lote.
+    Devuelve {"equipos": n, "personas": n, "lotes": n}.
+    """
+    registros = [dict(r, tag=(r.get('tag') or '').strip()) for r in registros if (r.get('tag') or '').strip()]
+    if not registros:
+        return {"equipos": 0, "personas": 0, "lotes": 0}
+
+    lotes = 0
+    confirmados = []   # tags de los lotes ya confirmados: se invalidan aunque un lote posterior falle
+    try:
+        with conexion() as conn:
+            cur = conn.cursor()
 
+            personas = {}
+            for r in registros:
+                nombre = (r.get('persona_asignada') or '').strip()
+                tipo_ub = r.get('tipo_ubicacion') or 'ALMACEN'
+                if nombre and nombre not in personas:
+                    personas[nombre] = _resolver_persona(cur, nombre, r.get('area'), r.get('cargo'), tipo_ub)
+            conn.commit()
 
+            cur.fast_executemany = True
+            for i in range(0, len(registros), batch_size):
+                lote = registros[i:i + batch_size]
+                params = []
+                for r in lote:
+                    params.append(_params_equipo_merge(
+                        r['tag'], r.get('marca'), r.get('modelo'), r.get('serial'), r.get('ubicacion'),
+                        personas.get((r.get('persona_asignada') or '').strip()),
+                        r.get('cargador', 0), r.get('maletin', 0), r.get('mouse', 0), r.get('teclado', 0),
+                        r.get('observaciones'), r.get('impresora', 0), r.get('lector', 0),
+                        r.get('tipo_equipo'), r.get('tipo_ubicacion') or 'ALMACEN', r.get('area'), r.get('cargo')))
+                cur.executemany(_SQL_EQUIPO_MERGE, params)
+                conn.commit()
+                confirmados.extend(r['tag'] for r in lote)
+                lotes += 1
+            cur.close()
+    finally:
+        for tag in confirmados:
+            _invalidar(tag, *_GRUPOS_EQUIPO)
+    return {"equipos": len(registros), "personas": len(personas), "lotes": lotes}
+
+
+_SQL_EQUIPO_SELECT = """
+    SELECT
+        e.EquipoId,
+        LTRIM(RTRIM(e.Tag)) AS tag,
+        e.Modelo           AS modelo,
+        e.Marca            AS marca,
+        e.Serial           AS serial,
+        e.Ubicacion        AS ubicacion,
+        e.TipoEquipo       AS tipoequipo,
+        e.TipoUbicacion    AS tipoubicacion,
+        pa.Nombre          AS personaasignada,
+        e.Area             AS area,
+        e.Cargo            AS cargo,
+        e.Cargador         AS cargador,
+        e.Maletin          AS maletin,
+        e.Mouse            AS mouse,
+        e.Teclado          AS teclado,
+        ISNULL(e.Impresora, 0) AS impresora,
+        ISNULL(e.Lector, 0)   AS lector,
+        e.Observaciones    AS observaciones
+    FROM ti.Equipo e
+    LEFT JOIN ti.Persona pa ON pa.PersonaId = e.PersonaAsignadaId
+"""
+
+
+@_cache_por_tag('equipo')
 def obtener_equipo_por_tag(tag):
     """Actualizado para traer área y cargo del equipo y TipoEquipo/TipoUbicacion"""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT
-            e.EquipoId,
-            LTRIM(RTRIM(e.Tag)) AS tag,
-            e.Modelo           AS modelo,
-            e.Marca            AS marca,
-            e.Serial           AS serial,
-            e.Ubicacion        AS ubicacion,
-            e.TipoEquipo       AS tipoequipo,
-            e.TipoUbicacion    AS tipoubicacion,
-            pa.Nombre          AS personaasignada,
-            e.Area             AS area,
-            e.Cargo            AS cargo,
-            e.Cargador         AS cargador,
-            e.Maletin          AS maletin,
-            e.Mouse            AS mouse,
-            e.Teclado          AS teclado,
-            ISNULL(e.Impresora, 0) AS impresora,
-            ISNULL(e.Lector, 0)   AS lector,
-            e.Observaciones    AS observaciones
-        FROM ti.Equipo e
-        LEFT JOIN ti.Persona pa ON pa.PersonaId = e.PersonaAsignadaId
-        WHERE LTRIM(RTRIM(e.Tag)) = ?
-    """, (tag,))
-    row = cur.fetchone()
-    equipo = dict(zip([c[0] for c in cur.description], row)) if row else {}
-    cur.close(); conn.close()
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(_SQL_EQUIPO_SELECT + """
+            WHERE LTRIM(RTRIM(e.Tag)) = ?
+        """, (tag,))
+        equipo = filas.una(cur) or {}
+        cur.close()
     return equipo
 
 
+def obtener_equipos_por_tags(tags, chunk=500):
+    """
+    Versión por lotes de obtener_equipo_por_tag para comparar muchos equipos a la vez
+    (un SELECT ... IN (...) por cada `chunk` tags). Devuelve {TAG_NORMALIZADO: equipo}.
+    """
+    tags = sorted({(t or '').strip() for t in tags if (t or '').strip()})
+    out = {}
+    with conexion() as conn:
+        cur = conn.cursor()
+        for i in range(0, len(tags), chunk):
+            parte = tags[i:i + chunk]
+            cur.execute(_SQL_EQUIPO_SELECT + f"""
+                WHERE e.Tag IN ({', '.join('?' * len(parte))})
+            """, tuple(parte))
+            for row in filas.todas(cur):
+                out[_tag_key(row['tag'])] = row
+        cur.close()
+    return out
+
+
+_SQL_BUSQUEDA = """
+    SELECT
+        LTRIM(RTRIM(e.Tag))        AS tag,
+        e.Marca                    AS marca,
+        e.Modelo                   AS modelo,
+        e.Serial                   AS serial,
+        e.Ubicacion                AS ubicacion,
+        pa.Nombre                  AS personaasignada,
+        ISNULL(e.Estado,'ACTIVO')  AS estado
+    FROM ti.Equipo e
+    LEFT JOIN ti.Persona pa ON pa.PersonaId = e.PersonaAsignadaId
+    WHERE e.Tag IS NOT NULL AND LTRIM(RTRIM(e.Tag)) <> ''
+"""
+
+
+def equipos_para_busqueda(tags=None, chunk=500):
+    """Filas para search_index: todos los equipos, o solo `tags` (en lotes de `chunk`)."""
+    with conexion() as conn:
+        cur = conn.cursor()
+        if tags is None:
+            cur.execute(_SQL_BUSQUEDA)
+            rows = filas.todas(cur)
+        else:
+            tags = list(tags)
+            rows = []
+            for i in range(0, len(tags), chunk):
+                parte = tags[i:i + chunk]
+                cur.execute(_SQL_BUSQUEDA + f" AND e.Tag IN ({', '.join('?' * len(parte))})", tuple(parte))
+                rows += filas.todas(cur)
+        cur.close()
+    return rows
+
+
+def personas_para_busqueda():
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT Nombre AS nombre, Area AS area, Cargo AS cargo FROM ti.Persona")
+        rows = filas.todas(cur)
+        cur.close()
+    return rows
+
+
+_SQL_EQUIPOS_PERSONA = """
+    SELECT
+        LTRIM(RTRIM(e.Tag))        AS tag,
+        e.TipoEquipo               AS tipoequipo,
+        e.Marca                    AS marca,
+        e.Modelo                   AS modelo,
+        e.Serial                   AS serial,
+        e.Ubicacion                AS ubicacion,
+        ISNULL(e.Estado,'ACTIVO')  AS estado,
+        pa.Nombre                  AS personaasignada,
+        pa.Area                    AS personaarea,
+        pa.Cargo                   AS personacargo,
+        e.Cargador                 AS cargador,
+        e.Maletin                  AS maletin,
+        e.Mouse                    AS mouse,
+        e.Teclado                  AS teclado,
+        ISNULL(e.Impresora, 0)     AS impresora,
+        ISNULL(e.Lector, 0)        AS lector
+    FROM ti.Equipo e
+    LEFT JOIN ti.Persona pa ON pa.PersonaId = e.PersonaAsignadaId
+    WHERE e.Tag IS NOT NULL AND LTRIM(RTRIM(e.Tag)) <> ''
+"""
+
+# Resumen del historial por (persona relacionada, equipo): lo que listaba
+# sp_Historial_PorPersona, agregado a una fila por equipo
+_SQL_RESUMEN_HISTORIAL = """
+    SELECT
+        LTRIM(RTRIM(e.Tag))  AS tag,
+        pc.Nombre            AS persona,
+        COUNT(*)             AS cambios,
+        MIN(c.FechaCambio)   AS primero,
+        MAX(c.FechaCambio)   AS ultimo,
+        MAX(c.CambioId)      AS ultimocambioid
+    FROM ti.EquipoCambio c
+    JOIN ti.Equipo e     ON e.EquipoId = c.EquipoId
+    JOIN ti.Persona pc   ON pc.PersonaId = c.PersonaCambioId
+    WHERE e.Tag IS NOT NULL AND LTRIM(RTRIM(e.Tag)) <> ''
+"""
+
+
+def _por_tags(sql, tags, chunk, sufijo=""):
+    """Todas las filas de `sql`, o solo las de `tags` (un IN por cada `chunk` tags)."""
+    with conexion() as conn:
+        cur = conn.cursor()
+        if tags is None:
+            cur.execute(sql + sufijo)
+            rows = filas.todas(cur)
+        else:
+            tags = list(tags)
+            rows = []
+            for i in range(0, len(tags), chunk):
+                parte = tags[i:i + chunk]
+                cur.execute(sql + f" AND e.Tag IN ({', '.join('?' * len(parte))})" + sufijo, tuple(parte))
+                rows += filas.todas(cur)
+        cur.close()
+    return rows
+
+
+def equipos_por_persona(tags=None, chunk=500):
+    """Filas para la vista por persona (personas.py): equipo, asignado y accesorios."""
+    return _por_tags(_SQL_EQUIPOS_PERSONA, tags, chunk)
+
+
+def resumen_historial_personas(tags=None, chunk=500):
+    """Filas (tag, persona, cambios, primero, ultimo) del historial, de todos los equipos o de `tags`."""
+    return _por_tags(_SQL_RESUMEN_HISTORIAL, tags, chunk, " GROUP BY e.Tag, pc.Nombre")
+
+
+@_cache_por_tag('principal')
 def archivo_principal_get(tag: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT TOP 1 Ruta, Nombre
-        FROM ti.EquipoArchivo
-        WHERE Tag = ? AND EsPrincipal = 1
-        ORDER BY EquipoArchivoId DESC
-    """, (tag,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT TOP 1 Ruta, Nombre
+            FROM ti.EquipoArchivo
+            WHERE Tag = ? AND EsPrincipal = 1
+            ORDER BY EquipoArchivoId DESC
+        """, (tag,))
+        row = cur.fetchone()
+        cur.close()
     if row:
         return {"ruta": row[0], "nombre": row[1]}
     return None
 
 
+_SQL_EQUIPO_COMPLETO = "\n    SET NOCOUNT ON;\n" + _SQL_EQUIPO_SELECT + """    WHERE e.Tag = ? OR (e.Tag LIKE ' %' AND LTRIM(e.Tag) = ?);
+
+    SELECT *
+    FROM ti.v_EquipoHistorial
+    WHERE Tag = ? OR (Tag LIKE ' %' AND LTRIM(Tag) = ?)
+    ORDER BY
+        CASE WHEN FechaCambio IS NULL THEN 1 ELSE 0 END,
+        FechaCambio DESC,
+        CambioId DESC;
+
+    SELECT TOP 1 Ruta, Nombre
+    FROM ti.EquipoArchivo
+    WHERE Tag = ? AND EsPrincipal = 1
+    ORDER BY EquipoArchivoId DESC;
+"""
+
+
+@_cache_por_tag('completo')
+def equipo_completo(tag):
+    """
+    Trae todo lo que necesita la vista de un equipo en un solo round-trip:
+    un lote con tres result sets (equipo, historial, archivo principal).
+
+    Filtra con `Tag = ?` sobre el tag ya recortado en lugar de
+    LTRIM(RTRIM(Tag)) = ?, así SQL Server puede hacer seek en el índice de Tag
+    (la comparación de igualdad ya ignora los espacios a la derecha). Los tags
+    guardados con espacios a la izquierda entran por la segunda rama,
+    `Tag LIKE ' %' AND LTRIM(Tag) = ?`: también es un seek (prefijo fijo) y
+    solo recorre esos pocos tags.
+
+    Devuelve {"equipo": {...} | {}, "historial": [...], "principal": {...} | None}.
+    """
+    safe_tag = (tag or "").strip()
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(_SQL_EQUIPO_COMPLETO, (safe_tag,) * 5)
+
+        equipo = filas.una(cur) or {}
+
+        historial = []
+        if cur.nextset():
+            historial = filas.todas(cur, _clave_historial)
+
+        principal = None
+        if cur.nextset():
+            row = cur.fetchone()
+            if row:
+                principal = {"ruta": row[0], "nombre": row[1]}
+        cur.close()
+    return {"equipo": equipo, "historial": historial, "principal": principal}
+
+
 def archivo_principal_set(tag: str, ruta: str, nombre: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    # Quita principal previo
-    cur.execute("""
-        UPDATE ti.EquipoArchivo
-            SET EsPrincipal = 0
-            WHERE Tag = ? AND EsPrincipal = 1
-    """, (tag,))
-    # Inserta nuevo principal
-    cur.execute("""
-        INSERT INTO ti.EquipoArchivo(Tag, Ruta, Nombre, EsPrincipal)
-        VALUES(?, ?, ?, 1)
-    """, (tag, ruta, nombre))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with conexion() as conn:
+        cur = conn.cursor()
+        # Quita principal previo
+        cur.execute("""
+            UPDATE ti.EquipoArchivo
+                SET EsPrincipal = 0
+                WHERE Tag = ? AND EsPrincipal = 1
+        """, (tag,))
+        # Inserta nuevo principal
+        cur.execute("""
+            INSERT INTO ti.EquipoArchivo(Tag, Ruta, Nombre, EsPrincipal)
+            VALUES(?, ?, ?, 1)
+        """, (tag, ruta, nombre))
+        conn.commit()
+        cur.close()
+    _invalidar(tag, 'principal', 'completo')
 
@@ -0,0 +1,273 @@
+"""
+Espejo local de los archivos principales del share.
+
+Las hojas de entrega más consultadas se bajaban por SMB una y otra vez. Aquí
+se guarda una copia en disco local con clave (ruta, tamaño, mtime): basta el
+stat contra el share (que igual hace falta para el ETag) para saber si la
+copia sirve. Si el archivo cambia, la clave cambia y la copia vieja deja de
+usarse hasta que el LRU la descarta.
+
+  - acierto: se entrega el archivo local por ruta, así send_file usa el
+    wsgi.file_wrapper del servidor (sendfile, sin copiar por Python) o
+    X-Sendfile si USE_X_SENDFILE está activo detrás de un proxy.
+  - fallo en una descarga completa: se sirve desde el share y, a la vez, se
+    escribe la copia (`tee`); si la descarga termina entera queda en el
+    espejo, si se corta se descarta. El share se lee una sola vez.
+  - fallo con Range (visor de PDF): se sirve el tramo desde el share y se
+    encola una copia completa en segundo plano.
+  - prefetch: al vincular un archivo principal se copia en segundo plano.
+
+El espejo está acotado a `max_bytes`; se descartan los menos usados. Al
+arrancar se vuelve a leer el directorio (el orden de uso se aproxima con el
+mtime de cada copia) y se borran los temporales que hayan quedado.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+_BLOQUE = 1024 * 1024
+
+
+class _Tee:
+    """Archivo de solo lectura que copia lo leído a `tmp` y lo guarda en el espejo al llegar al final."""
+
+    def __init__(self, espejo, clave, origen, tmp, size):
+        self._espejo = espejo
+        self._clave = clave
+        self._origen = origen
+        self._tmp = tmp
+        self._size = size
+        self._leidos = 0
+        self._cerrado = False
+        self._dst = open(tmp, "wb")
+
+    def read(self, n=-1):
+        data = self._origen.read(n)
+        if data and self._dst is not None:
+            try:
+                self._dst.write(data)
+            except OSError:
+                # disco local lleno o similar: se sigue sirviendo sin copia
+                self._dst.close()
+                self._dst = None
+        self._leidos += len(data)
+        return data
+
+    def close(self):
+        if self._cerrado:
+            return
+        self._cerrado = True
+        self._origen.close()
+        if self._dst is None:
+            self._espejo._descartar(self._clave, self._tmp)
+            return
+        self._dst.close()
+        self._dst = None
+        if self._leidos == self._size:
+            self._espejo._guardar(self._clave, self._tmp, self._size)
+        else:
+            self._espejo._descartar(self._clave, self._tmp)
+
+
+class EspejoLocal:
+    def __init__(self, directorio, max_bytes=1024 * 1024 * 1024, share_io=None, workers=2):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.share_io = share_io
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()     # clave -> bytes
+        self._bytes = 0
+        self._en_curso = set()        # claves que se están copiando
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="espejo")
+        self._stats = {"hits": 0, "misses": 0, "bytes_saved": 0, "bytes_fetched": 0,
+                       "stores": 0, "discarded": 0, "prefetches": 0, "prefetch_errors": 0, "evictions": 0}
+        os.makedirs(directorio, exist_ok=True)
+        self._cargar()
+
+    # ---------- índice ----------
+
+    def _cargar(self):
+        copias = []
+        for nombre in os.listdir(self.directorio):
+            ruta = os.path.join(self.directorio, nombre)
+            if nombre.endswith(".tmp"):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+                continue
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue
+            copias.append((st.st_mtime, nombre, st.st_size))
+        for _, clave, size in sorted(copias):
+            self._lru[clave] = size
+            self._bytes += size
+        self._recortar()
+
+    @staticmethod
+    def clave(path, st):
+        norm = os.path.normcase(os.path.normpath(path))
+        return hashlib.blake2b(f"{norm}|{st.st_size}|{st.st_mtime_ns}".encode("utf-8", "surrogatepass"),
+                               digest_size=16).hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave)
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _guardar(self, clave, tmp, size):
+        try:
+            os.replace(tmp, self._ruta(clave))
+        except OSError:
+            self._descartar(clave, tmp)
+            return
+        with self._lock:
+            self._en_curso.discard(clave)
+            if clave not in self._lru:
+                self._lru[clave] = size
+                self._bytes += size
+            self._stats["stores"] += 1
+            self._stats["bytes_fetched"] += size
+        self._recortar()
+
+    def _descartar(self, clave, tmp):
+        with self._lock:
+            self._en_curso.discard(clave)
+            self._stats["discarded"] += 1
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+    def _recortar(self):
+        borrar = []
+        with self._lock:
+            while self._lru and self._bytes > self.max_bytes:
+                clave, size = self._lru.popitem(last=False)
+                self._bytes -= size
+                self._stats["evictions"] += 1
+                borrar.append(clave)
+        for clave in borrar:
+            try:
+                os.remove(self._ruta(clave))
+            except OSError:
+                # En Windows no se puede borrar un archivo abierto: queda
+                # fuera del índice y se vuelve a considerar al reiniciar
+                pass
+
+    def _reservar(self, clave, size):
+        """¿Conviene copiar `clave`? (no está, no se está copiando y entra en el espejo)"""
+        with self._lock:
+            if clave in self._lru or clave in self._en_curso or size > self.max_bytes:
+                return False
+            self._en_curso.add(clave)
+            return True
+
+    # ---------- API ----------
+
+    def local(self, path, st, contar=True):
+        """
+        Ruta de la copia local vigente de `path` (con su stat del share), o
+        None. Con contar=False no suma aciertos ni fallos (lecturas internas).
+        """
+        clave = self.clave(path, st)
+        with self._lock:
+            if clave in self._lru:
+                self._lru.move_to_end(clave)
+                if contar:
+                    self._stats["hits"] += 1
+                return self._ruta(clave)
+            if contar:
+                self._stats["misses"] += 1
+        return None
+
+    def servido(self, n):
+        """Anota `n` bytes entregados desde el espejo (no leídos del share)."""
+        self._count("bytes_saved", n)
+
+    def tee(self, path, st, f):
+        """
+        Envuelve `f` (abierto en el share) para que lo leído quede también en
+        el espejo. Si la copia ya está en curso o no entra, devuelve `f`.
+        """
+        clave = self.clave(path, st)
+        if not self._reservar(clave, st.st_size):
+            return f
+        tmp = self._ruta(f"{clave}.{threading.get_ident()}.tmp")
+        try:
+            return _Tee(self, clave, f, tmp, st.st_size)
+        except OSError:
+            self._descartar(clave, tmp)
+            return f
+
+    def prefetch(self, path):
+        """
+        Copia `path` al espejo en segundo plano. `path` puede ser una función
+        que devuelve la ruta (o None), para resolverla también fuera de la petición.
+        """
+        self._executor.submit(self._prefetch, path)
+
+    def _prefetch(self, path):
+        try:
+            path = path() if callable(path) else path
+            if not path:
+                return
+            st = self.share_io.stat(path) if self.share_io else os.stat(path)
+            if st is None:
+                return
+            clave = self.clave(path, st)
+            if not self._reservar(clave, st.st_size):
+                return
+            self._count("prefetches")
+            tmp = self._ruta(f"{clave}.{threading.get_ident()}.tmp")
+            copiados = 0
+            try:
+                origen = self.share_io.open(path) if self.share_io else open(path, "rb")
+                with origen, open(tmp, "wb") as dst:
+                    for bloque in iter(lambda: origen.read(_BLOQUE), b""):
+                        dst.write(bloque)
+                        copiados += len(bloque)
+            except OSError:
+                self._descartar(clave, tmp)
+                raise
+            if copiados == st.st_size:
+                self._guardar(clave, tmp, copiados)
+            else:
+                # cambió mientras se copiaba: la próxima descarga trae la versión nueva
+                self._descartar(clave, tmp)
+        except Exception:
+            self._count("prefetch_errors")
+            log.warning("espejo: no se pudo copiar %r", path, exc_info=True)
+
+    def limpiar(self):
+        """Borra todas las copias."""
+        with self._lock:
+            claves = list(self._lru)
+            self._lru.clear()
+            self._bytes = 0
+        for clave in claves:
+            try:
+                os.remove(self._ruta(clave))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({"entries": len(self._lru), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                         "in_flight": len(self._en_curso)})
+        total = data["hits"] + data["misses"]
+        data["hit_ratio"] = round(data["hits"] / total, 4) if total else None
+        return data
+
+    def close(self):
+        self._executor.shutdown(wait=False)
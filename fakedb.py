@@ -0,0 +1,511 @@
+"""
+Driver de reemplazo con la interfaz de pyodbc, respaldado por SQLite.
+
+Sirve para ejercitar el pool, los helpers de db.py y los benchmarks sin un
+SQL Server:
+
+    import db, fakedb
+    uri = "file:inv?mode=memory&cache=shared"
+    fakedb.create_schema(fakedb.connect(uri))
+    db.configure_pool(connect=lambda: fakedb.connect(uri))
+
+Solo cubre lo que usa esta aplicación: connect/cursor/execute/executemany,
+fetchone/fetchall/fetchmany, description, nextset, commit/rollback/close y
+el atributo `fast_executemany`. Traduce lo mínimo de T-SQL que aparece en
+db.py (esquema `ti`, TOP, ISNULL, SCOPE_IDENTITY, lotes con varias
+sentencias y varios result sets) y emula:
+
+  - los procedimientos ti.sp_* que llama db.py (ver PROCEDIMIENTOS), con
+    DECLARE @x / EXEC ... @x=@x OUTPUT / SELECT @x AS Nombre;
+  - el MERGE de un solo registro de db._SQL_EQUIPO_MERGE (UPDATE y, si no
+    tocó ninguna fila, INSERT).
+
+Los cuerpos reales de los SP viven en SQL Server; aquí se reproduce lo que
+la aplicación espera de ellos, no cada detalle.
+"""
+import datetime as _dt
+import re
+import sqlite3
+import threading
+import time
+
+Error = sqlite3.Error
+DatabaseError = sqlite3.DatabaseError
+OperationalError = sqlite3.OperationalError
+
+_stats_lock = threading.Lock()
+stats = {"connects": 0, "executes": 0, "rows": 0}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        stats[key] += n
+
+
+def reset_stats():
+    with _stats_lock:
+        for k in stats:
+            stats[k] = 0
+
+
+# ---------- traducción T-SQL -> SQLite ----------
+
+_RE_TOP = re.compile(r'\bSELECT\s+TOP\s*(\(\s*\?\s*\)|\(\s*\d+\s*\)|\d+)', re.I)
+_RE_ISNULL = re.compile(r'\bISNULL\s*\(', re.I)
+_RE_NOCOUNT = re.compile(r'^\s*SET\s+NOCOUNT\s+(ON|OFF)\s*$', re.I)
+
+
+def _split_batch(sql):
+    """Parte un lote por ';' fuera de comillas."""
+    out, buf, quote = [], [], False
+    for ch in sql:
+        if ch == "'":
+            quote = not quote
+        if ch == ';' and not quote:
+            out.append(''.join(buf))
+            buf = []
+        else:
+            buf.append(ch)
+    out.append(''.join(buf))
+    return [s for s in out if s.strip() and not _RE_NOCOUNT.match(s)]
+
+
+_RE_SCOPE_IDENTITY = re.compile(r'\bSCOPE_IDENTITY\s*\(\s*\)', re.I)
+_RE_COMENTARIO = re.compile(r'--[^\n]*')
+_RE_DECLARE = re.compile(r'^\s*DECLARE\s+@(\w+)\b', re.I)
+_RE_EXEC = re.compile(r'^\s*EXEC(?:UTE)?\s+([\w.\[\]]+)\s*(.*?)\s*$', re.I | re.S)
+_RE_SELECT_VARS = re.compile(r'^\s*SELECT\s+(@\w+(?:\s+AS\s+\w+)?(?:\s*,\s*@\w+(?:\s+AS\s+\w+)?)*)\s*$', re.I)
+_RE_VAR_ALIAS = re.compile(r'@(\w+)(?:\s+AS\s+(\w+))?', re.I)
+_RE_MERGE = re.compile(
+    r'^\s*MERGE\s+([\w.]+)\s+AS\s+(\w+)\s+'
+    r'USING\s*\(\s*SELECT\s+CAST\s*\(\s*\?\s+AS\s+[\w() ]+?\)\s+AS\s+(\w+)\s*\)\s+AS\s+(\w+)\s+'
+    r'ON\s*\(\s*\2\.(\w+)\s*=\s*\4\.\3\s*\)\s+'
+    r'WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+(.*?)\s+'
+    r'WHEN\s+NOT\s+MATCHED\s+THEN\s+INSERT\s*\((.*?)\)\s*VALUES\s*\((.*?)\)\s*$', re.I | re.S)
+
+
+def _especial(stmt):
+    """¿La sentencia necesita emulación (no basta traducirla para SQLite)?"""
+    return bool(_RE_DECLARE.match(stmt) or _RE_EXEC.match(stmt) or _RE_SELECT_VARS.match(stmt)
+                or re.match(r'^\s*MERGE\b', stmt, re.I))
+
+
+def _translate(stmt, params):
+    stmt = _RE_ISNULL.sub('IFNULL(', stmt)
+    stmt = _RE_SCOPE_IDENTITY.sub('last_insert_rowid()', stmt)
+    m = _RE_TOP.search(stmt)
+    if m:
+        n = m.group(1).strip('() ')
+        if n == '?':
+            idx = stmt[:m.start()].count('?')
+            n_param = params.pop(idx)
+            params.append(n_param)
+        else:
+            params.append(int(n))
+        stmt = stmt[:m.start()] + 'SELECT' + stmt[m.end():].rstrip() + ' LIMIT ?'
+    return stmt, params
+
+
+class Cursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._cur = conn._raw.cursor()
+        self._sets = []           # result sets pendientes de un lote
+        self._buffer = None       # filas del result set actual (modo lote)
+        self._description = None
+        self.fast_executemany = False
+
+    @property
+    def description(self):
+        return self._description if self._buffer is not None else self._cur.description
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def _latency(self):
+        if self._conn.latency:
+            time.sleep(self._conn.latency)
+
+    def execute(self, sql, params=()):
+        self._latency()
+        _count("executes")
+        self._correr(sql, list(params or ()))
+        return self
+
+    def _correr(self, sql, params):
+        self._sets, self._buffer = [], None
+        stmts = _split_batch(_RE_COMENTARIO.sub('', sql))
+        if len(stmts) <= 1 and not (stmts and _especial(stmts[0])):
+            stmt, p = _translate(stmts[0] if stmts else sql, params)
+            self._cur.execute(stmt, p)
+            return
+
+        # Lote (o sentencia emulada): se ejecuta cada sentencia y se guardan los result sets
+        variables = {}
+        for stmt in stmts:
+            n = stmt.count('?')
+            p, params = params[:n], params[n:]
+            res = self._sentencia(stmt, p, variables)
+            if res is not None:
+                self._sets.append(res)
+        self.nextset()
+
+    def _sentencia(self, stmt, params, variables):
+        """Una sentencia del lote; devuelve (description, filas) si produce un result set."""
+        m = _RE_DECLARE.match(stmt)
+        if m:
+            variables[m.group(1).lower()] = None
+            return None
+        m = _RE_EXEC.match(stmt)
+        if m:
+            return _exec_sp(self._cur, m.group(1), m.group(2), params, variables)
+        m = _RE_SELECT_VARS.match(stmt)
+        if m:
+            pares = _RE_VAR_ALIAS.findall(m.group(1))
+            desc = [(alias or var, None, None, None, None, None, None) for var, alias in pares]
+            return desc, [tuple(variables.get(var.lower()) for var, _ in pares)]
+        m = _RE_MERGE.match(stmt)
+        if m:
+            _merge(self._cur, m, params)
+            return None
+        stmt, p = _translate(stmt, params)
+        self._cur.execute(stmt, p)
+        if self._cur.description is not None:
+            return self._cur.description, self._cur.fetchall()
+        return None
+
+    def executemany(self, sql, seq_params):
+        self._latency()
+        _count("executes")
+        self._sets, self._buffer = [], None
+        seq = [list(p) for p in seq_params]
+        if not seq:
+            return self
+        stmts = _split_batch(_RE_COMENTARIO.sub('', sql))
+        if len(stmts) > 1 or (stmts and _especial(stmts[0])):
+            for p in seq:
+                self._correr(sql, p)
+            self._sets, self._buffer = [], None
+            return self
+        stmt, _ = _translate(sql, list(seq[0]))
+        self._cur.executemany(stmt, [_translate(sql, p)[1] for p in seq])
+        return self
+
+    def _fetch_buffer(self, n=None):
+        if n is None:
+            rows, self._buffer = self._buffer, []
+        else:
+            rows, self._buffer = self._buffer[:n], self._buffer[n:]
+        return rows
+
+    def fetchone(self):
+        if self._buffer is not None:
+            rows = self._fetch_buffer(1)
+            row = rows[0] if rows else None
+        else:
+            row = self._cur.fetchone()
+        if row is not None:
+            _count("rows")
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._fetch_buffer(size) if self._buffer is not None else self._cur.fetchmany(size)
+        _count("rows", len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch_buffer() if self._buffer is not None else self._cur.fetchall()
+        _count("rows", len(rows))
+        return rows
+
+    def nextset(self):
+        if not self._sets:
+            self._buffer = None if self._buffer is None else []
+            return False
+        self._description, rows = self._sets.pop(0)
+        self._buffer = list(rows)
+        return True
+
+    def close(self):
+        self._cur.close()
+
+
+class Connection:
+    def __init__(self, database, latency=0.0):
+        uri = database.startswith("file:")
+        self._raw = sqlite3.connect(database, uri=uri, check_same_thread=False)
+        self._raw.execute("ATTACH DATABASE ? AS ti", (_ti_database(database),))
+        self.latency = latency
+        self.autocommit = False
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        self._raw.close()
+
+
+def _ti_database(database):
+    """Base adjunta para el esquema `ti`, compartida igual que la principal."""
+    if database == ":memory:":
+        return ":memory:"
+    if database.startswith("file:"):
+        nombre, _, query = database[5:].partition("?")
+        return f"file:{nombre}_ti" + (f"?{query}" if query else "")
+    return database + ".ti"
+
+
+def connect(database=":memory:", latency=0.0, **_ignored):
+    """Equivalente a pyodbc.connect(); `latency` simula el round-trip por sentencia."""
+    if latency:
+        time.sleep(latency)  # el handshake también cuesta un round-trip
+    _count("connects")
+    return Connection(database, latency=latency)
+
+
+# ---------- esquema ti.* ----------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ti.Persona(
+    PersonaId INTEGER PRIMARY KEY,
+    Nombre    TEXT NOT NULL,
+    Area      TEXT,
+    Cargo     TEXT
+);
+CREATE INDEX IF NOT EXISTS ti.IX_Persona_Nombre ON Persona(Nombre);
+
+CREATE TABLE IF NOT EXISTS ti.Equipo(
+    EquipoId          INTEGER PRIMARY KEY,
+    Tag               TEXT NOT NULL,
+    Marca             TEXT,
+    Modelo            TEXT,
+    Serial            TEXT,
+    Ubicacion         TEXT,
+    TipoEquipo        TEXT,
+    TipoUbicacion     TEXT,
+    PersonaAsignadaId INTEGER,
+    Area              TEXT,
+    Cargo             TEXT,
+    Cargador          INTEGER,
+    Maletin           INTEGER,
+    Mouse             INTEGER,
+    Teclado           INTEGER,
+    Impresora         INTEGER,
+    Lector            INTEGER,
+    Observaciones     TEXT,
+    Estado            TEXT,
+    FechaBaja         TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ti.IX_Equipo_Tag ON Equipo(Tag, EquipoId);
+
+CREATE TABLE IF NOT EXISTS ti.EquipoCambio(
+    CambioId        INTEGER PRIMARY KEY,
+    EquipoId        INTEGER NOT NULL,
+    TipoCambio      TEXT,
+    Descripcion     TEXT,
+    FechaCambio     TEXT,
+    RegistradoPor   TEXT,
+    FechaRegistro   TEXT DEFAULT CURRENT_TIMESTAMP,
+    PersonaCambioId INTEGER
+);
+CREATE INDEX IF NOT EXISTS ti.IX_EquipoCambio_Equipo ON EquipoCambio(EquipoId);
+
+CREATE TABLE IF NOT EXISTS ti.EquipoArchivo(
+    EquipoArchivoId INTEGER PRIMARY KEY,
+    Tag             TEXT NOT NULL,
+    Ruta            TEXT,
+    Nombre          TEXT,
+    EsPrincipal     INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ti.IX_EquipoArchivo_Tag ON EquipoArchivo(Tag, EsPrincipal);
+
+CREATE VIEW IF NOT EXISTS ti.v_EquipoHistorial AS
+SELECT
+    e.Tag               AS Tag,
+    e.EquipoId          AS EquipoId,
+    e.Modelo            AS Modelo,
+    e.Serial            AS Serial,
+    e.Ubicacion         AS Ubicacion,
+    e.PersonaAsignadaId AS PersonaAsignadaId,
+    pa.Nombre           AS PersonaAsignada,
+    c.CambioId          AS CambioId,
+    c.TipoCambio        AS TipoCambio,
+    c.Descripcion       AS Descripcion,
+    c.FechaCambio       AS FechaCambio,
+    c.RegistradoPor     AS RegistradoPor,
+    c.FechaRegistro     AS FechaRegistro,
+    c.PersonaCambioId   AS PersonaCambioId,
+    pc.Nombre           AS PersonaCambio
+FROM EquipoCambio c
+JOIN Equipo e        ON e.EquipoId = c.EquipoId
+LEFT JOIN Persona pa ON pa.PersonaId = e.PersonaAsignadaId
+LEFT JOIN Persona pc ON pc.PersonaId = c.PersonaCambioId;
+"""
+
+
+def create_schema(conn):
+    """Crea las tablas y la vista ti.* que consultan los helpers de db.py."""
+    conn._raw.executescript(SCHEMA)
+    conn.commit()
+
+
+# ---------- emulación de MERGE y de los procedimientos ti.sp_* ----------
+
+def _merge(cur, m, params):
+    """MERGE de un registro: UPDATE por la clave y, si no tocó nada, INSERT."""
+    tabla, alias, col_src, _src, col_dst, set_sql, cols_ins, vals_ins = m.groups()
+    set_sql = re.sub(rf'\b{alias}\.', '', set_sql)
+    n_set = set_sql.count('?')
+    clave, p_set, p_ins = params[0], params[1:1 + n_set], params[1 + n_set:]
+    cur.execute(_RE_ISNULL.sub('IFNULL(', f"UPDATE {tabla} SET {set_sql} WHERE {col_dst} = ?"), p_set + [clave])
+    if cur.rowcount == 0:
+        cur.execute(f"INSERT INTO {tabla} ({cols_ins}) VALUES ({vals_ins})", p_ins)
+
+
+def _argumentos(texto, params, variables):
+    """'@A=?, @B=@x OUTPUT' -> ({'a': valor}, {'b': 'x'}) (salidas: parámetro -> variable)."""
+    params = list(params)
+    args, salidas = {}, {}
+    for parte in filter(None, (p.strip() for p in texto.split(','))):
+        nombre, _, valor = parte.partition('=')
+        nombre = nombre.strip().lstrip('@').lower()
+        valor = valor.strip()
+        es_salida = bool(re.search(r'\s+OUT(PUT)?$', valor, re.I))
+        valor = re.sub(r'\s+OUT(PUT)?$', '', valor, flags=re.I).strip()
+        if valor == '?':
+            args[nombre] = params.pop(0)
+        elif valor.startswith('@'):
+            args[nombre] = variables.get(valor[1:].lower())
+            if es_salida:
+                salidas[nombre] = valor[1:].lower()
+        elif valor.upper() == 'NULL':
+            args[nombre] = None
+        elif valor.startswith(("'", "N'")):
+            args[nombre] = valor.split("'", 1)[1][:-1].replace("''", "'")
+        else:
+            args[nombre] = float(valor) if '.' in valor else int(valor)
+    return args, salidas
+
+
+def _exec_sp(cur, nombre, texto, params, variables):
+    proc = PROCEDIMIENTOS.get(nombre.replace('[', '').replace(']', '').lower())
+    if proc is None:
+        raise OperationalError(f"Procedimiento no emulado en fakedb: {nombre}")
+    args, salidas = _argumentos(texto, params, variables)
+    out, resultado = proc(cur, **args)
+    for param, var in salidas.items():
+        variables[var] = (out or {}).get(param)
+    return resultado
+
+
+def _ahora():
+    return _dt.datetime.now().replace(microsecond=0)
+
+
+def _texto_fecha(v):
+    return str(v) if v is not None else str(_ahora())
+
+
+def _persona_id(cur, nombre, area=None, cargo=None):
+    """PersonaId por nombre (recortado); la crea si no existe. Area/Cargo solo pisan si vienen."""
+    nombre = (nombre or '').strip()
+    if not nombre:
+        return None
+    cur.execute("SELECT PersonaId FROM ti.Persona WHERE Nombre = ?", (nombre,))
+    row = cur.fetchone()
+    if row:
+        if area is not None or cargo is not None:
+            cur.execute("UPDATE ti.Persona SET Area = COALESCE(?, Area), Cargo = COALESCE(?, Cargo) "
+                        "WHERE PersonaId = ?", (area, cargo, row[0]))
+        return row[0]
+    cur.execute("INSERT INTO ti.Persona(Nombre, Area, Cargo) VALUES (?, ?, ?)", (nombre, area, cargo))
+    return cur.lastrowid
+
+
+def _equipo_id(cur, tag, proc):
+    cur.execute("SELECT EquipoId FROM ti.Equipo WHERE LTRIM(RTRIM(Tag)) = ?", ((tag or '').strip(),))
+    row = cur.fetchone()
+    if not row:
+        raise DatabaseError(f"{proc}: no existe el equipo {tag!r}")
+    return row[0]
+
+
+def _insertar_cambio(cur, equipo_id, tipo, desc, fecha, registrado_por, persona_id):
+    cur.execute("INSERT INTO ti.EquipoCambio(EquipoId, TipoCambio, Descripcion, FechaCambio, RegistradoPor, "
+                "PersonaCambioId) VALUES (?, ?, ?, ?, ?, ?)",
+                (equipo_id, tipo, desc, _texto_fecha(fecha), registrado_por, persona_id))
+
+
+def sp_persona_upsert(cur, nombre=None, area=None, cargo=None, personaid=None):
+    return {"personaid": _persona_id(cur, nombre, area, cargo)}, None
+
+
+def sp_equipo_upsert(cur, tag=None, modelo=None, serial=None, ubicacion=None,
+                     personaasignadanombre=None, cargo=None, equipoid=None):
+    tag = (tag or '').strip()
+    persona = _persona_id(cur, personaasignadanombre)
+    cur.execute("SELECT EquipoId FROM ti.Equipo WHERE Tag = ?", (tag,))
+    row = cur.fetchone()
+    if row:
+        cur.execute("UPDATE ti.Equipo SET Modelo = COALESCE(?, Modelo), Serial = COALESCE(?, Serial), "
+                    "Ubicacion = COALESCE(?, Ubicacion), PersonaAsignadaId = COALESCE(?, PersonaAsignadaId), "
+                    "Cargo = COALESCE(?, Cargo) WHERE EquipoId = ?",
+                    (modelo, serial, ubicacion, persona, cargo, row[0]))
+        return {"equipoid": row[0]}, None
+    cur.execute("INSERT INTO ti.Equipo(Tag, Modelo, Serial, Ubicacion, PersonaAsignadaId, Cargo) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (tag, modelo, serial, ubicacion, persona, cargo))
+    return {"equipoid": cur.lastrowid}, None
+
+
+def sp_equipo_agregarcambio(cur, tag=None, tipocambio=None, descripcion=None, fechacambio=None,
+                            personarelacionada=None, registradopor=None):
+    eid = _equipo_id(cur, tag, "sp_Equipo_AgregarCambio")
+    _insertar_cambio(cur, eid, tipocambio, descripcion, fechacambio, registradopor,
+                     _persona_id(cur, personarelacionada))
+    return None, None
+
+
+def sp_equipo_reasignar(cur, tag=None, nuevapersona=None, cargo=None, fechacambio=None,
+                        registradopor=None, descripcion=None):
+    eid = _equipo_id(cur, tag, "sp_Equipo_Reasignar")
+    persona = _persona_id(cur, nuevapersona)
+    if persona is None:
+        raise DatabaseError("sp_Equipo_Reasignar: @NuevaPersona es obligatoria")
+    cur.execute("UPDATE ti.Equipo SET PersonaAsignadaId = ?, Cargo = COALESCE(?, Cargo) WHERE EquipoId = ?",
+                (persona, cargo, eid))
+    _insertar_cambio(cur, eid, "REASIGNACION", descripcion or f"Reasignado a {nuevapersona.strip()}",
+                     fechacambio, registradopor, persona)
+    return None, None
+
+
+def sp_equipo_darbaja(cur, tag=None, motivo=None, fechabaja=None, registradopor=None):
+    eid = _equipo_id(cur, tag, "sp_Equipo_DarBaja")
+    fecha = _texto_fecha(fechabaja)
+    cur.execute("UPDATE ti.Equipo SET Estado = 'BAJA', FechaBaja = ? WHERE EquipoId = ?", (fecha, eid))
+    _insertar_cambio(cur, eid, "BAJA", motivo, fecha, registradopor, None)
+    return None, None
+
+
+def sp_historial_porpersona(cur, nombre=None):
+    cur.execute("SELECT * FROM ti.v_EquipoHistorial WHERE PersonaAsignada = ? OR PersonaCambio = ? "
+                "ORDER BY CASE WHEN FechaCambio IS NULL THEN 1 ELSE 0 END, FechaCambio DESC, CambioId DESC",
+                (nombre, nombre))
+    return None, (cur.description, cur.fetchall())
+
+
+# nombre en minúscula -> fn(cursor sqlite, **parámetros sin '@' en minúscula) -> (salidas, result set)
+PROCEDIMIENTOS = {
+    "ti.sp_persona_upsert": sp_persona_upsert,
+    "ti.sp_equipo_upsert": sp_equipo_upsert,
+    "ti.sp_equipo_agregarcambio": sp_equipo_agregarcambio,
+    "ti.sp_equipo_reasignar": sp_equipo_reasignar,
+    "ti.sp_equipo_darbaja": sp_equipo_darbaja,
+    "ti.sp_historial_porpersona": sp_historial_porpersona,
+}
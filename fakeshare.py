@@ -0,0 +1,88 @@
+"""
+Doble de un servidor de archivos lento, con la interfaz `fs` de share_io.
+
+Lee del disco local pero agrega latencia por operación y permite simular un
+share que deja de responder:
+
+    import fakeshare, share_io
+    fs = fakeshare.SlowFS(latency=0.05)
+    io = share_io.ShareIO(timeout=0.5, fs=fs)
+    fs.hang()        # desde aquí todas las operaciones se cuelgan
+    fs.recover()     # ...y vuelven a responder
+
+`hang_paths` cuelga solo las rutas que contienen alguno de esos textos (hasta
+recover()). Con `bandwidth_mb_s` los archivos abiertos se leen a esa
+velocidad, como un enlace SMB.
+"""
+import os
+import threading
+import time
+
+
+class SlowFS:
+    def __init__(self, latency=0.0, jitter=0.0, hang_paths=(), bandwidth_mb_s=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth_mb_s = bandwidth_mb_s
+        self.hang_paths = tuple(hang_paths)
+        self._sano = threading.Event()
+        self._sano.set()
+        self._liberar = threading.Event()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.max_concurrent = 0
+        self._activos = 0
+
+    def hang(self):
+        self._sano.clear()
+
+    def recover(self):
+        self._liberar.set()
+        self._sano.set()
+
+    def _esperar(self, path):
+        with self._lock:
+            self.calls += 1
+            self._activos += 1
+            self.max_concurrent = max(self.max_concurrent, self._activos)
+        try:
+            if self.hang_paths and any(h in str(path) for h in self.hang_paths):
+                self._liberar.wait()
+            self._sano.wait()
+            if self.latency or self.jitter:
+                time.sleep(self.latency + (self.jitter * (hash(path) % 100) / 100.0))
+        finally:
+            with self._lock:
+                self._activos -= 1
+
+    def stat(self, path):
+        self._esperar(path)
+        return os.stat(path)
+
+    def open(self, path, mode="rb"):
+        self._esperar(path)
+        f = open(path, mode)
+        return _Lento(f, self.bandwidth_mb_s * 1024 * 1024) if self.bandwidth_mb_s else f
+
+
+class _Lento:
+    """Archivo cuyo read() tarda lo que tardaría a `bytes_s` bytes por segundo."""
+
+    def __init__(self, f, bytes_s):
+        self._f = f
+        self._bytes_s = bytes_s
+
+    def read(self, n=-1):
+        data = self._f.read(n)
+        if data:
+            time.sleep(len(data) / self._bytes_s)
+        return data
+
+    def __getattr__(self, k):
+        return getattr(self._f, k)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
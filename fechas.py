@@ -0,0 +1,123 @@
+"""
+Normalización de fechas para los helpers de escritura de db.py.
+
+Antes cada helper (agregar cambio, reasignar, dar de baja) tenía su propia
+copia del bucle de strptime sobre tres formatos, cada una con diferencias
+(solo una hacía strip, otra reventaba con datetime) y una excepción por cada
+formato que no coincidía, lo que en las cargas masivas se nota.
+
+parse_fecha() mira la forma del texto y va directo al parser que toca:
+
+  - ISO ('2024-05-01', '2024-05-01 10:30', '2024-05-01T10:30:00', con
+    fracciones o zona horaria) -> datetime.fromisoformat; si no es ISO
+    estricto ('2024-5-1', '2024-05-01 9:30') -> strptime, como antes
+  - día primero ('01/05/2024', '1-5-2024 10:30')        -> campos a mano
+  - número de serie de Excel (45413, 45413.5)            -> 1899-12-30 + días
+  - datetime / date                                      -> tal cual
+
+Los seriales de Excel solo se aceptan como números (celdas numéricas del
+autollenado o la importación): un texto de solo dígitos como '2024' o
+'20240115' no es una fecha y devuelve None, como antes. Todo lo demás
+también devuelve None. Los textos repetidos (en una
+importación la misma fecha aparece cientos de veces) salen de un LRU.
+"""
+import datetime as _dt
+from functools import lru_cache
+
+# Excel cuenta días desde 1899-12-30 (arrastra el 29/02/1900 inexistente de Lotus)
+_EXCEL_EPOCH = _dt.datetime(1899, 12, 30)
+# 1 = 1900-01-01 ... 2958465 = 9999-12-31
+_EXCEL_MAX = 2958465
+
+_DIGITOS = frozenset("0123456789")
+
+
+def _desde_excel(n):
+    if not 1 <= n <= _EXCEL_MAX:
+        return None
+    # redondeo al segundo: los seriales con hora traen ruido de punto flotante
+    return _EXCEL_EPOCH + _dt.timedelta(seconds=round(n * 86400))
+
+
+def _naive(dt):
+    """Las columnas son datetime sin zona: se pasa a hora local y se quita la zona."""
+    return dt.astimezone().replace(tzinfo=None) if dt.tzinfo is not None else dt
+
+
+def _dia_primero(txt):
+    """'dd/mm/yyyy[ HH:MM[:SS]]' (también con '-' o '.')."""
+    fecha, _, hora = txt.partition(' ')
+    partes = fecha.replace('-', '/').replace('.', '/').split('/')
+    if len(partes) != 3 or not all(p.isdigit() for p in partes) or len(partes[2]) != 4:
+        return None
+    d, m, y = (int(p) for p in partes)
+    h = mi = s = 0
+    if hora:
+        hp = hora.strip().split(':')
+        if not 2 <= len(hp) <= 3 or not all(p.isdigit() for p in hp):
+            return None
+        h, mi = int(hp[0]), int(hp[1])
+        s = int(hp[2]) if len(hp) == 3 else 0
+    try:
+        return _dt.datetime(y, m, d, h, mi, s)
+    except ValueError:
+        return None
+
+
+_FORMATOS_ANIO_PRIMERO = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+def _anio_primero(txt):
+    """Los formatos de los helpers originales: aceptan campos sin cero a la izquierda."""
+    txt = txt.replace('T', ' ')
+    for fmt in _FORMATOS_ANIO_PRIMERO:
+        try:
+            return _dt.datetime.strptime(txt, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _parse_texto(txt):
+    if not txt:
+        return None
+    c0 = txt[0]
+    if c0 not in _DIGITOS:
+        return None
+    # 'YYYY-MM-DD...' -> ISO; sin ceros a la izquierda ('2024-5-1 9:30') como antes, con strptime
+    if len(txt) >= 8 and txt[4] == '-':
+        try:
+            return _naive(_dt.datetime.fromisoformat(txt))
+        except ValueError:
+            return _anio_primero(txt)
+    # solo dígitos: un año o 'AAAAMMDD' tipeado, no un serial (esos llegan como número)
+    if set(txt) <= _DIGITOS | {'.'} and txt.count('.') <= 1:
+        return None
+    if '/' in txt[:6] or '-' in txt[:6] or '.' in txt[:6]:
+        return _dia_primero(txt)
+    return None
+
+
+def parse_fecha(valor):
+    """
+    datetime para `valor` (texto, número de serie de Excel, datetime o date),
+    o None si viene vacío o no se reconoce.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, _dt.datetime):
+        return _naive(valor)
+    if isinstance(valor, _dt.date):
+        return _dt.datetime(valor.year, valor.month, valor.day)
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        return _desde_excel(valor)
+    if isinstance(valor, str):
+        return _parse_texto(valor.strip())
+    return None
+
+
+def cache_info():
+    return _parse_texto.cache_info()
@@ -0,0 +1,129 @@
+"""
+Filas compactas para los result sets de db.py.
+
+Antes cada lectura armaba `dict(zip(cols, r))` por fila, y el historial lo
+volvía a armar pasando cada clave por `.lower()` y un dict de nombres. Aquí
+el mapeo columna -> clave se calcula una sola vez por descripción del cursor
+(mismas columnas, misma clase) y cada fila es una tupla con esa clase:
+
+    fila.modelo          # atributo (lo que usan los templates)
+    fila['modelo']       # clave, como el dict de antes
+    fila.get('x', 0)     # .get / keys() / items() / values() / 'x' in fila
+    dict(fila)           # cuando hace falta un dict de verdad
+
+Construir una fila es `tuple.__new__` en C, sin dict por fila: las claves
+viven en la clase. Las filas son inmutables; por eso se pueden compartir
+desde la caché de lecturas sin copiarlas. Iterar una fila recorre los valores
+(como una namedtuple), no las claves.
+
+Si dos columnas se llaman igual gana la última, igual que con dict(zip(...)).
+Las columnas que no son identificadores válidos, empiezan con '_' o chocan
+con un método (get, keys, count...) solo se leen por clave.
+"""
+import keyword
+import threading
+
+try:
+    # El descriptor en C que usa namedtuple para sus campos
+    from collections import _tuplegetter
+except ImportError:  # pragma: no cover
+    def _tuplegetter(i, _doc):
+        return property(lambda self: tuple.__getitem__(self, i))
+
+_por_claves = {}        # claves -> clase
+_por_descripcion = {}   # (columnas, renombrar) -> clase
+_lock = threading.Lock()
+
+
+class Fila(tuple):
+    __slots__ = ()
+    _claves = ()     # clave de cada posición (en orden de columnas)
+    _indice = {}     # clave -> posición
+
+    def __getitem__(self, k):
+        if isinstance(k, str):
+            return tuple.__getitem__(self, self._indice[k])
+        return tuple.__getitem__(self, k)
+
+    def get(self, k, default=None):
+        i = self._indice.get(k)
+        return default if i is None else tuple.__getitem__(self, i)
+
+    def __contains__(self, k):
+        return k in self._indice
+
+    def keys(self):
+        return self._indice.keys()
+
+    def values(self):
+        return [tuple.__getitem__(self, i) for i in self._indice.values()]
+
+    def items(self):
+        return [(k, tuple.__getitem__(self, i)) for k, i in self._indice.items()]
+
+    def __repr__(self):
+        return "Fila(" + ", ".join(f"{k}={v!r}" for k, v in self.items()) + ")"
+
+    def __reduce__(self):
+        # La clase se genera en tiempo de ejecución: pickle (RedisBackend) la
+        # reconstruye a partir de las claves
+        return _desde_pickle, (self._claves, tuple(self))
+
+
+def _desde_pickle(claves, valores):
+    return _clase(claves)(valores)
+
+
+def _clase(claves):
+    cls = _por_claves.get(claves)
+    if cls is not None:
+        return cls
+    with _lock:
+        cls = _por_claves.get(claves)
+        if cls is None:
+            indice = {k: i for i, k in enumerate(claves)}
+            attrs = {"__slots__": (), "_claves": claves, "_indice": indice}
+            for k, i in indice.items():
+                if (k.isidentifier() and not keyword.iskeyword(k) and not k.startswith('_')
+                        and not hasattr(Fila, k)):
+                    attrs[k] = _tuplegetter(i, k)
+            cls = _por_claves[claves] = type("Fila", (Fila,), attrs)
+    return cls
+
+
+def clase_para(description, renombrar=None):
+    """
+    Clase de fila para un `cursor.description`. `renombrar(columna) -> clave`
+    (opcional) se aplica una vez por descripción, no por fila.
+    """
+    cols = tuple(c[0] for c in description)
+    clave = (cols, renombrar)
+    cls = _por_descripcion.get(clave)
+    if cls is None:
+        cls = _por_descripcion[clave] = _clase(tuple(renombrar(c) for c in cols) if renombrar else cols)
+    return cls
+
+
+def todas(cur, renombrar=None):
+    """Todas las filas pendientes del result set actual de `cur`."""
+    return list(map(clase_para(cur.description, renombrar), cur.fetchall()))
+
+
+def una(cur, renombrar=None):
+    """La siguiente fila de `cur`, o None."""
+    row = cur.fetchone()
+    return clase_para(cur.description, renombrar)(row) if row is not None else None
+
+
+def en_lotes(cur, n=500, renombrar=None):
+    """Recorre el result set de `cur` pidiendo `n` filas por viaje (fetchmany)."""
+    cls = clase_para(cur.description, renombrar)
+    while True:
+        rows = cur.fetchmany(n)
+        if not rows:
+            return
+        yield from map(cls, rows)
+
+
+def stats():
+    return {"clases": len(_por_claves), "descripciones": len(_por_descripcion)}
@@ -0,0 +1,177 @@
+"""
+Importación masiva de equipos desde las hojas "Entrega Equipos" del share.
+
+Pasa cada .xlsx por la misma extracción que el autollenado (autofill.py) en un
+pool de procesos, compara contra lo que hay en la base (dry-run) y escribe con
+db.equipo_upsert_lote (executemany + fast_executemany) en vez de abrir una
+conexión por equipo.
+
+Se usa desde `flask import-entregas` y desde POST /admin/import.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from autofill import extraer_desde_excel
+from db import equipo_upsert_lote, obtener_equipos_por_tags
+
+# data de autofill -> columna de obtener_equipo_por_tag
+CAMPOS = {
+    "tipo_equipo": "tipoequipo",
+    "marca": "marca",
+    "modelo": "modelo",
+    "serial": "serial",
+    "ubicacion": "ubicacion",
+    "persona_asignada": "personaasignada",
+    "area": "area",
+    "cargo": "cargo",
+    "cargador": "cargador",
+    "maletin": "maletin",
+    "mouse": "mouse",
+    "teclado": "teclado",
+    "observaciones": "observaciones",
+}
+
+
+def _extraer(item):
+    """Worker del pool: (ruta, mtime) -> (ruta, mtime, data | None, error | None)."""
+    ruta, mtime = item
+    try:
+        return ruta, mtime, extraer_desde_excel(ruta), None
+    except Exception as e:
+        return ruta, mtime, None, f"{type(e).__name__}: {e}"
+
+
+def extraer_hojas(archivos, workers=None, chunksize=4):
+    """
+    Extrae en paralelo. `archivos` es una lista de (ruta, mtime).
+    Devuelve (registros_por_tag, errores, sin_tag); si un tag aparece en varias
+    hojas gana la más reciente.
+    """
+    registros, errores, sin_tag = {}, [], []
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for ruta, mtime, data, err in ex.map(_extraer, archivos, chunksize=chunksize):
+            if err:
+                errores.append({"ruta": ruta, "error": err})
+                continue
+            tag = (data.get("tag") or "").strip()
+            if not tag:
+                sin_tag.append(ruta)
+                continue
+            previo = registros.get(tag.upper())
+            if previo is None or mtime >= previo["_mtime"]:
+                registros[tag.upper()] = dict(data, tag=tag, _ruta=ruta, _mtime=mtime)
+    return registros, errores, sin_tag
+
+
+FLAGS = {"cargador", "maletin", "mouse", "teclado"}
+
+
+def _normalizar(v, flag=False):
+    if flag:
+        return int(v or 0)
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return int(v)
+    return v.strip() if isinstance(v, str) else v
+
+
+def diff(registros, actuales):
+    """
+    Compara lo extraído contra ti.Equipo (`actuales` de obtener_equipos_por_tags).
+    Devuelve [{tag, accion, cambios, ruta}].
+    """
+    out = []
+    for clave, r in sorted(registros.items()):
+        actual = actuales.get(clave)
+        if actual is None:
+            out.append({"tag": r["tag"], "accion": "nuevo", "ruta": r["_ruta"],
+                        "cambios": {k: [None, r.get(k)] for k in CAMPOS if _normalizar(r.get(k)) != ""}})
+            continue
+        cambios = {}
+        for k, col in CAMPOS.items():
+            nuevo = _normalizar(r.get(k), k in FLAGS)
+            # Campos vacíos en la hoja no borran lo que ya está en la base
+            if nuevo == "" or nuevo == _normalizar(actual.get(col), k in FLAGS):
+                continue
+            cambios[k] = [actual.get(col), r.get(k)]
+        out.append({"tag": r["tag"], "accion": "cambia" if cambios else "igual",
+                    "ruta": r["_ruta"], "cambios": cambios})
+    return out
+
+
+def _para_upsert(r, actual=None):
+    """Arma los argumentos del upsert; lo que la hoja trae vacío se conserva de la base."""
+    actual = actual or {}
+
+    def val(k):
+        v = r.get(k)
+        return v if _normalizar(v) != "" else actual.get(CAMPOS[k])
+
+    area, cargo = val("area") or None, val("cargo") or None
+    return {
+        "tag": r["tag"],
+        "marca": val("marca") or None,
+        "modelo": val("modelo") or None,
+        "serial": val("serial") or None,
+        "ubicacion": val("ubicacion") or None,
+        "persona_asignada": val("persona_asignada") or None,
+        "cargador": val("cargador") or 0,
+        "maletin": val("maletin") or 0,
+        "mouse": val("mouse") or 0,
+        "teclado": val("teclado") or 0,
+        "impresora": actual.get("impresora") or 0,
+        "lector": actual.get("lector") or 0,
+        "observaciones": val("observaciones") or None,
+        "tipo_equipo": val("tipo_equipo") or None,
+        # Las hojas con área/cargo son entregas a personal administrativo
+        "tipo_ubicacion": "ADMINISTRATIVO" if (area or cargo) else (actual.get("tipoubicacion") or "ALMACEN"),
+        "area": area,
+        "cargo": cargo,
+    }
+
+
+def importar(archivos, dry_run=True, workers=None, batch_size=500):
+    """
+    Corre el pipeline completo sobre `archivos` [(ruta, mtime)].
+    Con dry_run=True solo calcula el diff; si no, escribe lo nuevo/cambiado.
+    """
+    t0 = time.perf_counter()
+    registros, errores, sin_tag = extraer_hojas(archivos, workers=workers)
+    t_extr = time.perf_counter() - t0
+
+    actuales = obtener_equipos_por_tags([r["tag"] for r in registros.values()])
+    cambios = diff(registros, actuales)
+    pendientes = [c["tag"].upper() for c in cambios if c["accion"] != "igual"]
+
+    escritura = None
+    if not dry_run and pendientes:
+        t1 = time.perf_counter()
+        escritura = equipo_upsert_lote([_para_upsert(registros[k], actuales.get(k)) for k in pendientes],
+                                       batch_size=batch_size)
+        escritura["segundos"] = round(time.perf_counter() - t1, 3)
+
+    total = time.perf_counter() - t0
+    return {
+        "dry_run": dry_run,
+        "hojas": len(archivos),
+        "equipos": len(registros),
+        "nuevos": sum(1 for c in cambios if c["accion"] == "nuevo"),
+        "cambian": sum(1 for c in cambios if c["accion"] == "cambia"),
+        "iguales": sum(1 for c in cambios if c["accion"] == "igual"),
+        "sin_tag": sin_tag,
+        "errores": errores,
+        "diff": [c for c in cambios if c["accion"] != "igual"],
+        "escritura": escritura,
+        "segundos": round(total, 3),
+        "hojas_por_segundo": round(len(archivos) / t_extr, 2) if t_extr > 0 else None,
+    }
+
+
+def hojas_del_share(index, limite=None):
+    """Las .xlsx conocidas por el índice del share, como [(ruta, mtime)]."""
+    archivos = sorted(((f["path"], f["mtime"]) for f in index.files("xlsx")
+                       if not os.path.basename(f["path"]).startswith("~$")),
+                      key=lambda x: x[1], reverse=True)
+    return archivos[:limite] if limite else archivos
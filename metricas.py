@@ -0,0 +1,453 @@
+"""
+Métricas por petición: dónde se va el tiempo de cada ruta.
+
+  - Cada petición de Flask se mide de punta a punta (histograma por regla de
+    ruta, método y status).
+  - db.py pasa sus conexiones por ConexionMedida: cada sentencia SQL se
+    cuenta y se mide (con una etiqueta corta sacada del SQL, p. ej.
+    "exec ti.sp_equipo_reasignar" o "select ti.equipo"), igual que las filas
+    leídas, la espera por una conexión del pool y las conexiones nuevas.
+  - share_io mide cada operación contra la carpeta de red (stat, open,
+    stat_many...) con su resultado (ok, ShareTimeout, ...).
+
+Todo se publica en /metrics en formato de texto de Prometheus. Además cada
+respuesta lleva un encabezado Server-Timing (db, share y total) que se ve en
+las herramientas del navegador, y las peticiones que superan `lenta_ms`
+guardan el detalle de sus llamadas (las últimas se ven en /_lentas y salen en
+el log como WARNING).
+
+Los valores son del proceso: con varios workers Prometheus suma las series de
+cada uno.
+"""
+import bisect
+import collections
+import contextvars
+import functools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Segundos
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Llamadas que se guardan por petición para el detalle de las lentas
+MAX_LLAMADAS = 300
+
+log = logging.getLogger(__name__)
+
+# Desglose de la petición en curso (None fuera de una petición)
+_peticion = contextvars.ContextVar("metricas_peticion", default=None)
+
+
+def _escapar(v):
+    return str(v).replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n")
+
+
+def _etiquetas(nombres, valores, extra=""):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def inc(self, *valores, n=1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + n
+
+    def muestras(self):
+        with self._lock:
+            items = sorted(self._valores.items())
+        for valores, v in items:
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {_num(v)}"
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}   # valores de etiquetas -> [conteos por bucket (+Inf al final), suma]
+
+    def observar(self, segundos, *valores):
+        i = bisect.bisect_left(self.buckets, segundos)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][i] += 1
+            serie[1] += segundos
+
+    def muestras(self):
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._series.items())
+        for valores, (conteos, suma) in items:
+            acum = 0
+            for le, c in zip(self.buckets + ("+Inf",), conteos):
+                acum += c
+                le = 'le="%s"' % (le if isinstance(le, str) else _num(float(le)))
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {acum}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {_num(suma)}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {acum}"
+
+
+class Medidor:
+    """Gauge que se calcula al publicar: `fn() -> número | {(valores,): número}`."""
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, fn, etiquetas=()):
+        self.nombre, self.ayuda, self.fn, self.etiquetas = nombre, ayuda, fn, tuple(etiquetas)
+
+    def muestras(self):
+        try:
+            v = self.fn()
+        except Exception:
+            log.exception("metricas: falló el medidor %s", self.nombre)
+            return
+        items = sorted(v.items()) if isinstance(v, dict) else [((), v)]
+        for valores, n in items:
+            if n is not None:
+                yield f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {_num(n)}"
+
+
+class Registro:
+    def __init__(self, prefijo="inventario_"):
+        self.prefijo = prefijo
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _agregar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._agregar(Contador(self.prefijo + nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS):
+        return self._agregar(Histograma(self.prefijo + nombre, ayuda, etiquetas, buckets))
+
+    def medidor(self, nombre, ayuda, fn, etiquetas=()):
+        with self._lock:
+            m = self._metricas[self.prefijo + nombre] = Medidor(self.prefijo + nombre, ayuda, fn, etiquetas)
+        return m
+
+    def render(self):
+        """Texto de exposición de Prometheus (version 0.0.4)."""
+        with self._lock:
+            metricas = sorted(self._metricas.values(), key=lambda m: m.nombre)
+        out = []
+        for m in metricas:
+            out.append(f"# HELP {m.nombre} {m.ayuda}")
+            out.append(f"# TYPE {m.nombre} {m.tipo}")
+            out.extend(m.muestras())
+        return "\n".join(out) + "\n"
+
+
+REGISTRO = Registro()
+
+HTTP_SEGUNDOS = REGISTRO.histograma(
+    "http_request_duration_seconds", "Duración de las peticiones por regla de ruta.",
+    ("route", "method", "status"))
+DB_SEGUNDOS = REGISTRO.histograma(
+    "db_statement_duration_seconds", "Duración de cada sentencia SQL (execute + fetch).", ("op",))
+DB_FILAS = REGISTRO.contador("db_rows_fetched_total", "Filas leídas de la base.", ("op",))
+DB_ESPERA = REGISTRO.histograma(
+    "db_checkout_wait_seconds", "Espera por una conexión del pool.")
+DB_CONEXIONES = REGISTRO.contador("db_connections_opened_total", "Conexiones nuevas a la base.")
+SHARE_SEGUNDOS = REGISTRO.histograma(
+    "share_op_duration_seconds", "Operaciones contra la carpeta de red.", ("op", "result"))
+
+
+# ---------- desglose por petición ----------
+
+def _anotar(tipo, op, segundos, filas=0):
+    p = _peticion.get()
+    if p is None:
+        return
+    p[tipo + "_s"] += segundos
+    p[tipo + "_n"] += 1
+    p["filas"] += filas
+    if len(p["llamadas"]) < MAX_LLAMADAS:
+        p["llamadas"].append((tipo, op, round(segundos * 1000, 3), filas))
+    else:
+        p["omitidas"] += 1
+
+
+def desglose():
+    """Totales de la petición en curso, o None fuera de una petición."""
+    return _peticion.get()
+
+
+@contextmanager
+def medir_share(op):
+    """Mide una operación contra la carpeta de red (la base se mide en ConexionMedida)."""
+    t0 = time.perf_counter()
+    resultado = "ok"
+    try:
+        yield
+    except BaseException as e:
+        resultado = type(e).__name__
+        raise
+    finally:
+        dt = time.perf_counter() - t0
+        SHARE_SEGUNDOS.observar(dt, op, resultado)
+        _anotar("share", op, dt)
+
+
+# ---------- base de datos ----------
+
+_RE_COMENTARIO = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_RE_FROM = re.compile(r"\bfrom\s+([\w.\[\]]+)", re.IGNORECASE)
+_SIN_ETIQUETA = {"set", "declare", "begin", "commit"}
+
+
+def _tabla(palabra):
+    return palabra.split("(", 1)[0].replace("[", "").replace("]", "").lower()
+
+
+@functools.lru_cache(maxsize=512)
+def etiqueta_sql(sql):
+    """
+    Etiqueta corta y de pocos valores para una sentencia: 'exec ti.sp_x',
+    'select ti.equipo', 'merge ti.equipo'. En un lote se etiqueta la primera
+    sentencia útil (sin SET NOCOUNT y similares) y se agrega '+N' por las demás.
+    """
+    utiles = []
+    for st in _RE_COMENTARIO.sub(" ", sql or "").split(";"):
+        palabras = st.split()
+        if palabras and palabras[0].lower() not in _SIN_ETIQUETA:
+            utiles.append((st, palabras))
+    if not utiles:
+        return "?"
+    st, palabras = utiles[0]
+    verbo = palabras[0].lower()
+    resto = [p for p in palabras[1:] if p.lower() not in ("into", "top") and not p.startswith("(")]
+    if verbo in ("exec", "execute") and resto:
+        etiqueta = "exec " + _tabla(resto[0])
+    elif verbo in ("insert", "merge", "update") and resto:
+        etiqueta = f"{verbo} {_tabla(resto[0])}"
+    elif verbo in ("select", "delete", "with"):
+        m = _RE_FROM.search(st)
+        etiqueta = f"{'select' if verbo == 'with' else verbo} {_tabla(m.group(1))}" if m else verbo
+    else:
+        etiqueta = verbo
+    return etiqueta + (f" +{len(utiles) - 1}" if len(utiles) > 1 else "")
+
+
+def conexion_abierta():
+    DB_CONEXIONES.inc()
+    p = _peticion.get()
+    if p is not None:
+        p["conexiones"] += 1
+
+
+def espera_conexion(segundos):
+    DB_ESPERA.observar(segundos)
+    p = _peticion.get()
+    if p is not None:
+        p["espera_s"] += segundos
+
+
+def contar_conexiones(connect):
+    """Envuelve la función `connect` del pool para contar conexiones nuevas."""
+    @functools.wraps(connect)
+    def wrapper(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conexion_abierta()
+        return conn
+    return wrapper
+
+
+class CursorMedido:
+    """Proxy de un cursor DB-API: mide execute/fetch y cuenta filas; lo demás pasa tal cual."""
+    __slots__ = ("_cur", "_op")
+
+    def __init__(self, cur):
+        object.__setattr__(self, "_cur", cur)
+        object.__setattr__(self, "_op", "?")
+
+    def __getattr__(self, k):
+        return getattr(self._cur, k)
+
+    def __setattr__(self, k, v):
+        setattr(self._cur, k, v)
+
+    def _medir(self, fn, op, *args):
+        t0 = time.perf_counter()
+        try:
+            res = fn(*args)
+        finally:
+            dt = time.perf_counter() - t0
+            DB_SEGUNDOS.observar(dt, op)
+            _anotar("db", op, dt)
+        return self if res is self._cur else res
+
+    def execute(self, sql, *params):
+        op = etiqueta_sql(sql)
+        object.__setattr__(self, "_op", op)
+        return self._medir(self._cur.execute, op, sql, *params)
+
+    def executemany(self, sql, seq_params):
+        op = etiqueta_sql(sql)
+        object.__setattr__(self, "_op", op)
+        return self._medir(self._cur.executemany, op, sql, seq_params)
+
+    def _leer(self, res, t0):
+        dt = time.perf_counter() - t0
+        n = len(res) if isinstance(res, list) else (0 if res is None else 1)
+        if n:
+            DB_FILAS.inc(self._op, n=n)
+        p = _peticion.get()
+        if p is not None:
+            p["db_s"] += dt
+            p["filas"] += n
+            ultima = p["llamadas"][-1] if p["llamadas"] else None
+            if n and ultima and ultima[0] == "db" and ultima[1] == self._op:
+                p["llamadas"][-1] = ("db", self._op, round(ultima[2] + dt * 1000, 3), ultima[3] + n)
+        return res
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        return self._leer(self._cur.fetchone(), t0)
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        return self._leer(self._cur.fetchall(), t0)
+
+    def fetchmany(self, *size):
+        t0 = time.perf_counter()
+        return self._leer(self._cur.fetchmany(*size), t0)
+
+    def nextset(self):
+        return self._cur.nextset()
+
+
+class ConexionMedida:
+    """Proxy de una conexión cuyo cursor() devuelve un CursorMedido."""
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        object.__setattr__(self, "_conn", conn)
+
+    def __getattr__(self, k):
+        return getattr(self._conn, k)
+
+    def __setattr__(self, k, v):
+        setattr(self._conn, k, v)
+
+    def cursor(self):
+        return CursorMedido(self._conn.cursor())
+
+    def commit(self):
+        t0 = time.perf_counter()
+        try:
+            return self._conn.commit()
+        finally:
+            dt = time.perf_counter() - t0
+            DB_SEGUNDOS.observar(dt, "commit")
+            _anotar("db", "commit", dt)
+
+
+# ---------- Flask ----------
+
+def _nueva_peticion():
+    return {"db_s": 0.0, "db_n": 0, "share_s": 0.0, "share_n": 0, "filas": 0,
+            "conexiones": 0, "espera_s": 0.0, "llamadas": [], "omitidas": 0}
+
+
+def _server_timing(p, total):
+    return ", ".join((
+        f'db;dur={p["db_s"] * 1000:.1f};desc="{p["db_n"]} sql, {p["filas"]} filas"',
+        f'share;dur={p["share_s"] * 1000:.1f};desc="{p["share_n"]} ops"',
+        f"total;dur={total * 1000:.1f}",
+    ))
+
+
+class Lentas:
+    """Las últimas `n` peticiones que superaron el umbral, con su desglose."""
+
+    def __init__(self, umbral_ms=500, n=50):
+        self.umbral_ms = umbral_ms
+        self._items = collections.deque(maxlen=n)
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def agregar(self, item):
+        with self._lock:
+            self._items.append(item)
+            self.total += 1
+
+    def listar(self):
+        with self._lock:
+            return {"umbral_ms": self.umbral_ms, "total": self.total, "ultimas": list(reversed(self._items))}
+
+
+def instalar(app, registro=REGISTRO, lenta_ms=500, server_timing=True):
+    """
+    Hooks de Flask: mide cada petición, agrega Server-Timing y guarda las
+    lentas. Devuelve el objeto Lentas (para exponerlo en una ruta).
+    """
+    from flask import request
+
+    lentas = Lentas(lenta_ms)
+    logger = logging.getLogger("lento")
+
+    @app.before_request
+    def _abrir_medicion():
+        request.environ["metricas.t0"] = time.perf_counter()
+        request.environ["metricas.token"] = _peticion.set(_nueva_peticion())
+
+    @app.after_request
+    def _cerrar_medicion(response):
+        t0 = request.environ.get("metricas.t0")
+        p = _peticion.get()
+        if t0 is None or p is None:
+            return response
+        total = time.perf_counter() - t0
+        ruta = request.url_rule.rule if request.url_rule else "<sin ruta>"
+        HTTP_SEGUNDOS.observar(total, ruta, request.method, str(response.status_code))
+        if server_timing:
+            response.headers["Server-Timing"] = _server_timing(p, total)
+        if total * 1000 >= lentas.umbral_ms:
+            item = {
+                "ts": time.time(), "method": request.method, "route": ruta, "path": request.path,
+                "status": response.status_code, "ms": round(total * 1000, 1),
+                "db_ms": round(p["db_s"] * 1000, 1), "db_sql": p["db_n"], "filas": p["filas"],
+                "db_espera_ms": round(p["espera_s"] * 1000, 1), "db_conexiones": p["conexiones"],
+                "share_ms": round(p["share_s"] * 1000, 1), "share_ops": p["share_n"],
+                "llamadas": [{"tipo": t, "op": op, "ms": ms, "filas": n} for t, op, ms, n in p["llamadas"]],
+                "omitidas": p["omitidas"],
+            }
+            lentas.agregar(item)
+            mas_lentas = sorted(item["llamadas"], key=lambda c: -c["ms"])[:10]
+            logger.warning("petición lenta: %s %s %.0fms (db %.0fms/%d sql, share %.0fms/%d ops)",
+                           request.method, request.path, item["ms"], item["db_ms"], item["db_sql"],
+                           item["share_ms"], item["share_ops"],
+                           extra={"duration_ms": item["ms"], "llamadas": mas_lentas})
+        return response
+
+    @app.teardown_request
+    def _soltar_medicion(_exc):
+        token = request.environ.pop("metricas.token", None)
+        if token is not None:
+            try:
+                _peticion.reset(token)
+            except ValueError:
+                _peticion.set(None)
+
+    return lentas
@@ -0,0 +1,314 @@
+"""
+Vistas previas de los archivos vinculados: miniaturas de imágenes y las
+primeras filas de las hojas .xlsx.
+
+Para saber si eligieron el archivo correcto había que descargar PDFs e
+imágenes de varios MB desde el share. Ahora las páginas de equipo solo
+ponen una URL /preview/<token>?v=<tamaño-mtime> armada con lo que ya saben
+(índice del share o el stat que ya hicieron); la página nunca abre el
+archivo. Al pedir esa URL:
+
+  - si la vista previa ya está en disco se entrega (con la versión en la URL
+    el navegador la guarda como inmutable);
+  - si no, se encola en un pool propio y se responde 202 con Retry-After; el
+    script de la página vuelve a preguntar.
+
+El pool lee el archivo una sola vez, de corrido (de la copia del espejo
+local si la hay), y genera:
+
+  - imágenes (jpg/png): JPEG de `lado` px como máximo, con Pillow (en
+    requirements.txt). Si no está instalado, tipo() no ofrece vista previa
+    para imágenes y la página solo muestra el ícono; /_previews lo informa.
+  - .xlsx: tabla HTML con las primeras `filas` x `columnas` celdas de la hoja
+    activa (misma lectura read-only que el autollenado).
+  - PDF y .xls: solo ícono (renderizar PDF pide poppler/pdfium).
+
+Las vistas previas se guardan en `directorio` con clave (ruta, tamaño,
+mtime): si el archivo cambia, cambia la clave. Un archivo que no se pudo
+procesar (dañado, demasiado grande) deja un marcador .err para no volver a
+intentarlo; un error del share no deja marcador y se reintenta. El total
+está acotado a `max_bytes` (LRU, como espejo.py).
+"""
+import hashlib
+import html
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from autofill import xlsx_to_grid
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # sin Pillow: imágenes con ícono
+    Image = ImageOps = None
+
+log = logging.getLogger(__name__)
+
+IMAGENES = {"jpg", "jpeg", "png"}
+HOJAS = {"xlsx"}
+ICONOS = {
+    "pdf": "bi-file-earmark-pdf",
+    "xlsx": "bi-file-earmark-excel",
+    "xls": "bi-file-earmark-excel",
+    "jpg": "bi-file-earmark-image",
+    "jpeg": "bi-file-earmark-image",
+    "png": "bi-file-earmark-image",
+}
+_TIPOS = {".jpg": "image/jpeg", ".html": "text/html"}
+_ERROR = ".err"
+
+
+def extension(path):
+    return os.path.splitext(path)[1].lstrip(".").lower()
+
+
+def icono(path):
+    return ICONOS.get(extension(path), "bi-file-earmark")
+
+
+def tipo(path):
+    """'imagen', 'hoja' o None si no se genera vista previa para `path`."""
+    ext = extension(path)
+    if ext in HOJAS:
+        return "hoja"
+    if ext in IMAGENES and Image is not None:
+        return "imagen"
+    return None
+
+
+def version(size, mtime):
+    """Versión de un archivo para la URL de su vista previa (tamaño y mtime en ms)."""
+    return f"{int(size)}-{int(round(mtime * 1000))}"
+
+
+class ArchivoNoSoportado(Exception):
+    """El archivo no admite vista previa (dañado, demasiado grande...)."""
+
+
+class Miniaturas:
+    def __init__(self, directorio, share_io=None, espejo=None, max_bytes=64 * 1024 * 1024, workers=2,
+                 lado=320, filas=12, columnas=8, max_fuente=20 * 1024 * 1024, max_pendientes=100):
+        self.directorio = directorio
+        self.share_io = share_io
+        self.espejo = espejo
+        self.max_bytes = max_bytes
+        self.lado = lado
+        self.filas = filas
+        self.columnas = columnas
+        self.max_fuente = max_fuente
+        self.max_pendientes = max_pendientes
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()     # clave -> (sufijo, bytes)
+        self._bytes = 0
+        self._en_curso = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="miniaturas")
+        self._stats = {"hits": 0, "pending": 0, "busy": 0, "generated": 0, "failed": 0,
+                       "share_errors": 0, "stale": 0, "bytes_read": 0, "seconds": 0.0, "evictions": 0}
+        os.makedirs(directorio, exist_ok=True)
+        self._cargar()
+
+    # ---------- índice ----------
+
+    def _cargar(self):
+        vistas = []
+        for nombre in os.listdir(self.directorio):
+            ruta = os.path.join(self.directorio, nombre)
+            clave, sufijo = os.path.splitext(nombre)
+            if sufijo not in _TIPOS and sufijo != _ERROR:
+                try:
+                    os.remove(ruta)   # temporales de una generación cortada
+                except OSError:
+                    pass
+                continue
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue
+            vistas.append((st.st_mtime, clave, sufijo, st.st_size))
+        for _, clave, sufijo, size in sorted(vistas):
+            self._lru[clave] = (sufijo, size)
+            self._bytes += size
+        self._recortar()
+
+    @staticmethod
+    def clave(path, v):
+        norm = os.path.normcase(os.path.normpath(path))
+        return hashlib.blake2b(f"{norm}|{v}".encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+    def _ruta(self, clave, sufijo):
+        return os.path.join(self.directorio, clave + sufijo)
+
+    def _guardar(self, clave, sufijo, data):
+        tmp = self._ruta(clave, f".{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._ruta(clave, sufijo))
+        with self._lock:
+            previo = self._lru.pop(clave, None)
+            if previo:
+                self._bytes -= previo[1]
+            self._lru[clave] = (sufijo, len(data))
+            self._bytes += len(data)
+        self._recortar()
+
+    def _recortar(self):
+        borrar = []
+        with self._lock:
+            while self._lru and self._bytes > self.max_bytes:
+                clave, (sufijo, size) = self._lru.popitem(last=False)
+                self._bytes -= size
+                self._stats["evictions"] += 1
+                borrar.append(self._ruta(clave, sufijo))
+        for ruta in borrar:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def olvidar(self, clave):
+        """Saca `clave` del índice (su archivo ya no está en disco)."""
+        with self._lock:
+            previo = self._lru.pop(clave, None)
+            if previo:
+                self._bytes -= previo[1]
+
+    # ---------- API ----------
+
+    def pedir(self, path, v):
+        """
+        Estado de la vista previa de `path` en la versión `v`:
+          ("lista", ruta_local, content_type) si ya está generada
+          ("error", None, None) si el archivo no admite vista previa
+          ("pendiente", None, None) si se encoló (o ya estaba en curso)
+          ("ocupado", None, None) si la cola está llena; volver a pedir luego
+        No toca el share.
+        """
+        clave = self.clave(path, v)
+        with self._lock:
+            if clave in self._lru:
+                self._lru.move_to_end(clave)
+                sufijo = self._lru[clave][0]
+                if sufijo == _ERROR:
+                    return "error", None, None
+                self._stats["hits"] += 1
+                return "lista", self._ruta(clave, sufijo), _TIPOS[sufijo]
+            if clave in self._en_curso:
+                self._stats["pending"] += 1
+                return "pendiente", None, None
+            if len(self._en_curso) >= self.max_pendientes:
+                self._stats["busy"] += 1
+                return "ocupado", None, None
+            self._en_curso.add(clave)
+            self._stats["pending"] += 1
+        self._executor.submit(self._generar, clave, path, v)
+        return "pendiente", None, None
+
+    def _leer(self, path, v):
+        """Bytes de `path` si sigue en la versión `v` (None si cambió)."""
+        st = self.share_io.stat(path) if self.share_io else os.stat(path)
+        if st is None or version(st.st_size, st.st_mtime) != v:
+            return None
+        if st.st_size > self.max_fuente:
+            raise ArchivoNoSoportado(f"{st.st_size} bytes (máximo {self.max_fuente})")
+        local = self.espejo.local(path, st, contar=False) if self.espejo else None
+        if local:
+            try:
+                with open(local, "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass   # el espejo la descartó recién
+        f = self.share_io.open(path) if self.share_io else open(path, "rb")
+        with f:
+            data = f.read(self.max_fuente + 1)
+        self._count("bytes_read", len(data))
+        return data
+
+    def _generar(self, clave, path, v):
+        t0 = time.perf_counter()
+        try:
+            data = self._leer(path, v)
+            if data is None:
+                # la página tenía una versión vieja (la URL nueva trae otra
+                # clave): marcador para que el script deje de preguntar
+                self._count("stale")
+                self._guardar(clave, _ERROR, b"cambio")
+                return
+            if tipo(path) == "imagen":
+                self._guardar(clave, ".jpg", self._miniatura(data))
+            else:
+                self._guardar(clave, ".html", self._resumen(data).encode("utf-8"))
+            self._count("generated")
+        except OSError:
+            # share caído o lento: sin marcador, se reintenta en la próxima visita
+            self._count("share_errors")
+            log.warning("miniaturas: no se pudo leer %r", path, exc_info=True)
+        except Exception as e:
+            self._count("failed")
+            log.info("miniaturas: sin vista previa para %r: %s", path, e)
+            try:
+                self._guardar(clave, _ERROR, str(e).encode("utf-8", "replace")[:200] or b"error")
+            except OSError:
+                pass
+        finally:
+            with self._lock:
+                self._en_curso.discard(clave)
+                self._stats["seconds"] += time.perf_counter() - t0
+
+    def _miniatura(self, data):
+        with Image.open(io.BytesIO(data)) as img:
+            # JPEG: decodificar ya reducido (mucho más rápido en fotos grandes)
+            img.draft("RGB", (self.lado, self.lado))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((self.lado, self.lado))
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=80, optimize=True)
+            return out.getvalue()
+
+    def _resumen(self, data):
+        grid = xlsx_to_grid(io.BytesIO(data), max_rows=self.filas)
+        grid = [row[:self.columnas] for row in grid]
+        # sin filas ni columnas vacías al final
+        while grid and not any(grid[-1]):
+            grid.pop()
+        ancho = max((max((i + 1 for i, c in enumerate(row) if c), default=0) for row in grid), default=0)
+        if not ancho:
+            return '<div class="text-muted small">Hoja vacía</div>'
+        filas = "".join(
+            "<tr>" + "".join(f"<td>{html.escape(c[:60])}</td>" for c in (row + [""] * ancho)[:ancho]) + "</tr>"
+            for row in grid)
+        return ('<table class="table table-sm table-bordered small mb-0 vista-previa-hoja">'
+                f"<tbody>{filas}</tbody></table>")
+
+    def limpiar(self):
+        """Borra todas las vistas previas (incluidos los marcadores de error)."""
+        with self._lock:
+            rutas = [self._ruta(c, s) for c, (s, _) in self._lru.items()]
+            self._lru.clear()
+            self._bytes = 0
+        for ruta in rutas:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({"entries": len(self._lru), "errors": sum(1 for s, _ in self._lru.values() if s == _ERROR),
+                         "bytes": self._bytes, "max_bytes": self.max_bytes, "in_flight": len(self._en_curso),
+                         "pillow": Image is not None})
+        data["seconds"] = round(data["seconds"], 3)
+        return data
+
+    def close(self):
+        self._executor.shutdown(wait=False)
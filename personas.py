@@ -0,0 +1,304 @@
+"""
+Vista materializada por persona: qué equipos tiene hoy y con qué equipos
+tuvo movimientos.
+
+La búsqueda por persona corría ti.sp_Historial_PorPersona en cada petición y
+mostraba la lista cruda de cambios, sin decir qué tiene la persona ahora
+(lo que hace falta para recuperar equipos cuando alguien se va). Aquí se
+mantienen en memoria:
+
+  - persona -> {tag: equipo} con los equipos asignados que no están de baja
+    (con marca, modelo, serial y accesorios);
+  - persona -> {tag: resumen} con el historial agregado por equipo (cuántos
+    cambios, primero y último) donde la persona aparece como relacionada.
+
+La carga inicial son dos consultas (`cargar_equipos`, `cargar_historial`).
+Después se actualiza igual que search_index.py: las escrituras de db.py
+avisan qué tag cambió (db.al_escribir: reasignación, baja, upsert con
+sp_Persona_Upsert, cambios de historial) y el tag queda pendiente; los
+pendientes se releen en un solo lote antes de la siguiente lectura, y solo
+se tocan las personas de esos equipos.
+
+Las personas se comparan sin distinguir mayúsculas ni espacios repetidos
+(la intercalación de SQL Server es CI). Las listas ordenadas de cada persona
+se arman al leerlas y se guardan hasta que la persona cambia, así una
+página o el checklist de salida cuestan lo mismo sin importar el tamaño del
+inventario.
+"""
+import threading
+import time
+
+ACCESORIOS = ("cargador", "maletin", "mouse", "teclado", "impresora", "lector")
+
+
+def clave_persona(nombre):
+    return " ".join((nombre or "").split()).casefold()
+
+
+def _tag(row):
+    return (row.get("tag") or "").strip()
+
+
+def _orden_fecha(v):
+    # None al final en orden descendente; fechas y textos ISO comparan bien como texto
+    return "" if v is None else str(v)
+
+
+# Páginas por keyset sobre el orden de cada lista: equipos por tag, historial
+# por (último, tag) con el más reciente primero. El cursor es la clave del
+# último renglón entregado, no su posición: si ese equipo se reasigna o se
+# da de baja entre páginas, la siguiente sigue desde donde estaba, sin
+# repetir ni volver a empezar.
+
+def _clave(cual, x):
+    if cual == "equipos":
+        return x["tag"].upper()
+    return _orden_fecha(x["ultimo"]), x["tag"].upper()
+
+
+def _cursor(cual, x):
+    return x["tag"] if cual == "equipos" else f"{_orden_fecha(x['ultimo'])}|{x['tag']}"
+
+
+def _desde_cursor(cual, cursor):
+    """Clave de un cursor de página; ValueError si no tiene la forma esperada."""
+    if cual == "equipos":
+        return cursor.strip().upper()
+    fecha, sep, tag = cursor.partition("|")
+    if not sep or not tag.strip():
+        raise ValueError("Cursor de historial inválido (se espera 'último|tag').")
+    return fecha, tag.strip().upper()
+
+
+def _va_antes(cual, a, b):
+    if cual == "equipos":
+        return a < b
+    return a[0] > b[0] or (a[0] == b[0] and a[1] < b[1])
+
+
+class VistaPersonas:
+    def __init__(self, cargar_equipos, cargar_historial):
+        self.cargar_equipos = cargar_equipos        # tags | None -> [fila]
+        self.cargar_historial = cargar_historial    # tags | None -> [fila]
+        self._lock = threading.RLock()
+        self._refresco = threading.RLock()   # una carga (completa o de pendientes) a la vez
+        self._personas = {}      # clave -> {"nombre", "area", "cargo"}
+        self._actuales = {}      # clave -> {TAG: equipo}
+        self._historial = {}     # clave -> {TAG: resumen}
+        self._asignado = {}      # TAG -> clave de la persona que lo tiene
+        self._relacionados = {}  # TAG -> set(claves con historial en ese equipo)
+        self._ordenados = {}     # clave -> {"equipos": ([...], [clave de orden]), "historial": (...)}
+        self._pendientes = set()
+        self.built = False
+        self.last_build = None
+        self._stats = {"reads": 0, "updates": 0, "last_update_ms": None}
+
+    # ---------- mantenimiento ----------
+
+    def _persona(self, nombre, area=None, cargo=None):
+        k = clave_persona(nombre)
+        p = self._personas.get(k)
+        if p is None:
+            p = self._personas[k] = {"nombre": " ".join(nombre.split()), "area": area, "cargo": cargo}
+        elif area is not None or cargo is not None:
+            p.update(area=area, cargo=cargo)
+        return k
+
+    def _tocar(self, k):
+        self._ordenados.pop(k, None)
+
+    def _quitar_equipo(self, t):
+        k = self._asignado.pop(t, None)
+        if k is not None:
+            self._actuales[k].pop(t, None)
+            if not self._actuales[k]:
+                del self._actuales[k]
+            self._tocar(k)
+
+    def _poner_equipo(self, row):
+        t = _tag(row).upper()
+        self._quitar_equipo(t)
+        nombre = (row.get("personaasignada") or "").strip()
+        if not t or not nombre or row.get("estado") == "BAJA":
+            return
+        k = self._persona(nombre, row.get("personaarea"), row.get("personacargo"))
+        equipo = {c: row.get(c) for c in ("tipoequipo", "marca", "modelo", "serial", "ubicacion", "estado")}
+        equipo["tag"] = _tag(row)
+        equipo["accesorios"] = [a for a in ACCESORIOS if row.get(a)]
+        self._actuales.setdefault(k, {})[t] = equipo
+        self._asignado[t] = k
+        self._tocar(k)
+
+    def _quitar_historial(self, t):
+        for k in self._relacionados.pop(t, ()):
+            h = self._historial.get(k)
+            if h is not None:
+                h.pop(t, None)
+                if not h:
+                    del self._historial[k]
+            self._tocar(k)
+
+    def _poner_historial(self, row):
+        t = _tag(row).upper()
+        nombre = (row.get("persona") or "").strip()
+        if not t or not nombre:
+            return
+        k = self._persona(nombre)
+        self._historial.setdefault(k, {})[t] = {
+            "tag": _tag(row), "cambios": row.get("cambios"),
+            "primero": row.get("primero"), "ultimo": row.get("ultimo"),
+        }
+        self._relacionados.setdefault(t, set()).add(k)
+        self._tocar(k)
+
+    def rebuild(self):
+        """Carga todo desde la base."""
+        with self._refresco:
+            # lo marcado antes de la carga ya está en lo que se lee; lo que
+            # llegue durante la carga queda pendiente para la próxima lectura
+            with self._lock:
+                previos, self._pendientes = self._pendientes, set()
+            try:
+                equipos = self.cargar_equipos(None)
+                historial = self.cargar_historial(None)
+            except Exception:
+                with self._lock:
+                    self._pendientes |= previos
+                raise
+            with self._lock:
+                self._personas, self._actuales, self._historial = {}, {}, {}
+                self._asignado, self._relacionados, self._ordenados = {}, {}, {}
+                for row in equipos:
+                    self._poner_equipo(row)
+                for row in historial:
+                    self._poner_historial(row)
+                self.built = True
+                self.last_build = time.time()
+
+    def marcar(self, tag, *grupos):
+        """Oyente de db.al_escribir: el tag se relee antes de la próxima lectura."""
+        if tag and (not grupos or {'equipo', 'historial'} & set(grupos)):
+            with self._lock:
+                self._pendientes.add(tag.strip().upper())
+
+    def _aplicar_pendientes(self):
+        with self._lock:
+            if not self._pendientes:
+                return
+            tags, self._pendientes = self._pendientes, set()
+        t0 = time.perf_counter()
+        try:
+            orden = sorted(tags)
+            equipos = {_tag(r).upper(): r for r in self.cargar_equipos(orden)}
+            historial = self.cargar_historial(orden)
+        except Exception:
+            with self._lock:
+                self._pendientes |= tags
+            raise
+        with self._lock:
+            for t in tags:
+                if t in equipos:
+                    self._poner_equipo(equipos[t])
+                else:
+                    self._quitar_equipo(t)
+                self._quitar_historial(t)
+            for row in historial:
+                self._poner_historial(row)
+            self._stats["updates"] += len(tags)
+            self._stats["last_update_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+
+    def ensure_fresh(self):
+        # serializado: varias primeras lecturas a la vez hacen una sola carga
+        with self._refresco:
+            if not self.built:
+                self.rebuild()
+            else:
+                self._aplicar_pendientes()
+
+    # ---------- lectura ----------
+
+    def _orden(self, k, cual):
+        """Lista ordenada de la persona (equipos por tag, historial del más reciente) y sus claves de orden."""
+        cache = self._ordenados.setdefault(k, {})
+        if cual not in cache:
+            if cual == "equipos":
+                lista = sorted(self._actuales.get(k, {}).values(), key=lambda e: e["tag"].upper())
+            else:
+                lista = sorted(self._historial.get(k, {}).values(), key=lambda h: h["tag"].upper())
+                lista.sort(key=lambda h: _orden_fecha(h["ultimo"]), reverse=True)
+            cache[cual] = (lista, [_clave(cual, x) for x in lista])
+        return cache[cual]
+
+    def _pagina(self, nombre, cual, despues=None, limite=50):
+        desde = _desde_cursor(cual, despues) if despues else None
+        self.ensure_fresh()
+        k = clave_persona(nombre)
+        with self._lock:
+            self._stats["reads"] += 1
+            persona = self._personas.get(k)
+            if persona is None:
+                return None
+            lista, claves = self._orden(k, cual)
+            inicio = 0
+            if desde is not None:
+                # primer renglón que va después del cursor (búsqueda binaria)
+                lo, hi = 0, len(claves)
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if _va_antes(cual, desde, claves[mid]):
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                inicio = lo
+            filas = lista[inicio:inicio + limite]
+            siguiente = _cursor(cual, filas[-1]) if inicio + limite < len(lista) and filas else None
+            return {"persona": dict(persona), cual: [dict(f) for f in filas],
+                    "total": len(lista), "next": siguiente}
+
+    def equipos(self, nombre, despues=None, limite=50):
+        """
+        Página de los equipos que `nombre` tiene hoy, por tag; `despues` es el
+        cursor "next" de la página anterior (el tag donde terminó). None si la
+        persona no aparece.
+        """
+        return self._pagina(nombre, "equipos", despues, limite)
+
+    def historial(self, nombre, despues=None, limite=50):
+        """
+        Página del resumen de historial de `nombre` (un renglón por equipo, el
+        más reciente primero); `despues` es el cursor "next" ('último|tag').
+        """
+        return self._pagina(nombre, "historial", despues, limite)
+
+    def checklist(self, nombre):
+        """
+        Checklist de salida: todos los equipos que `nombre` tiene que
+        devolver con sus accesorios y los totales. None si no aparece.
+        """
+        self.ensure_fresh()
+        k = clave_persona(nombre)
+        with self._lock:
+            self._stats["reads"] += 1
+            persona = self._personas.get(k)
+            if persona is None:
+                return None
+            lista, _ = self._orden(k, "equipos")
+            accesorios = dict.fromkeys(ACCESORIOS, 0)
+            for e in lista:
+                for a in e["accesorios"]:
+                    accesorios[a] += 1
+            return {
+                "persona": dict(persona),
+                "equipos": [dict(e) for e in lista],
+                "total_equipos": len(lista),
+                "accesorios": {a: n for a, n in accesorios.items() if n},
+                "con_historial": len(self._historial.get(k, ())),
+                "por_devolver": bool(lista),
+                "generado": time.time(),
+            }
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, built=self.built, last_build=self.last_build,
+                        personas=len(self._personas), con_equipos=len(self._actuales),
+                        equipos_asignados=len(self._asignado), pendientes=len(self._pendientes))
@@ -0,0 +1,233 @@
+"""
+Pool de conexiones ODBC reutilizables.
+
+Cada helper de db.py pedía su propia conexión (handshake Trusted_Connection
+completo) y la cerraba al terminar. El pool mantiene entre `minsize` y
+`maxsize` conexiones abiertas, las valida al sacarlas (health check) y
+descarta las que llevan demasiado tiempo ociosas.
+
+El pool no sabe nada de pyodbc: recibe una función `connect()` que devuelve
+una conexión DB-API, así que se puede probar con un driver de reemplazo
+(ver fakedb.py).
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """No se obtuvo conexión del pool dentro del tiempo de espera."""
+
+
+class ConnectionPool:
+    def __init__(self, connect, minsize=1, maxsize=10, idle_timeout=300.0,
+                 checkout_timeout=30.0, health_query="SELECT 1", health_interval=30.0):
+        if minsize < 0 or maxsize < 1 or minsize > maxsize:
+            raise ValueError("Se requiere 0 <= minsize <= maxsize y maxsize >= 1")
+        self._connect = connect
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_query = health_query
+        self.health_interval = health_interval
+
+        self._lock = threading.Condition(threading.Lock())
+        self._idle = deque()          # (conn, ultimo_uso)
+        self._size = 0                # conexiones vivas (ociosas + prestadas)
+        self._closed = False
+        self._stats = {
+            "created": 0,
+            "closed": 0,
+            "checkouts": 0,
+            "reused": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "health_failures": 0,
+            "evicted_idle": 0,
+            "discarded": 0,
+        }
+
+    # ---------- ciclo de vida ----------
+
+    def _open(self):
+        conn = self._connect()
+        with self._lock:
+            self._stats["created"] += 1
+        return conn
+
+    def _discard(self, conn, motivo="discarded"):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._stats["closed"] += 1
+            if motivo:
+                self._stats[motivo] += 1
+            self._lock.notify()
+
+    def _healthy(self, conn, ultimo_uso):
+        # Solo validamos si la conexión estuvo ociosa un rato; una recién
+        # devuelta se asume sana para no pagar un round-trip extra.
+        if not self.health_query or time.monotonic() - ultimo_uso < self.health_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute(self.health_query)
+            cur.fetchall()
+            cur.close()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle_locked(self):
+        """Cierra conexiones ociosas vencidas, respetando minsize. Requiere el lock."""
+        if not self.idle_timeout:
+            return []
+        ahora = time.monotonic()
+        vencidas = []
+        # Las más antiguas están a la izquierda
+        while self._idle and self._size - len(vencidas) > self.minsize:
+            conn, ultimo_uso = self._idle[0]
+            if ahora - ultimo_uso < self.idle_timeout:
+                break
+            self._idle.popleft()
+            vencidas.append(conn)
+        return vencidas
+
+    def acquire(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        limite = time.monotonic() + timeout
+        while True:
+            item = None
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("El pool está cerrado")
+                vencidas = self._evict_idle_locked()
+                while not self._idle and self._size >= self.maxsize:
+                    self._stats["waits"] += 1
+                    restante = limite - time.monotonic()
+                    if restante <= 0 or not self._lock.wait(restante):
+                        if not self._idle and self._size >= self.maxsize:
+                            self._stats["timeouts"] += 1
+                            raise PoolTimeout(f"Sin conexiones libres tras {timeout:.1f}s")
+                if self._idle:
+                    # LIFO: la conexión usada más recientemente está caliente
+                    item = self._idle.pop()
+                else:
+                    self._size += 1
+                self._stats["checkouts"] += 1
+
+            for conn in vencidas:
+                self._discard(conn, "evicted_idle")
+
+            if item is None:
+                try:
+                    return self._open()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+
+            conn, ultimo_uso = item
+            if self._healthy(conn, ultimo_uso):
+                with self._lock:
+                    self._stats["reused"] += 1
+                return conn
+            with self._lock:
+                self._stats["health_failures"] += 1
+            self._discard(conn, None)
+
+    def release(self, conn, broken=False):
+        if not broken:
+            try:
+                # Nunca devolvemos al pool una transacción a medias
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            self._discard(conn)
+            return
+        with self._lock:
+            if self._closed:
+                cerrar = True
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._lock.notify()
+                cerrar = False
+        if cerrar:
+            self._discard(conn, None)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = _is_connection_error(conn)
+            raise
+        finally:
+            # también con GeneratorExit (un generador que la tenía se cerró antes
+            # de terminar): la conexión vuelve al pool con rollback
+            self.release(conn, broken=broken)
+
+    # ---------- mantenimiento ----------
+
+    def fill(self):
+        """Abre conexiones hasta llegar a minsize (precalentado)."""
+        nuevas = []
+        with self._lock:
+            faltan = max(0, self.minsize - self._size)
+            self._size += faltan
+        try:
+            for _ in range(faltan):
+                nuevas.append(self._open())
+        finally:
+            with self._lock:
+                self._size -= faltan - len(nuevas)
+                ahora = time.monotonic()
+                for c in nuevas:
+                    self._idle.appendleft((c, ahora))
+                self._lock.notify_all()
+
+    def evict_idle(self):
+        with self._lock:
+            vencidas = self._evict_idle_locked()
+        for conn in vencidas:
+            self._discard(conn, "evicted_idle")
+        return len(vencidas)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            ociosas = [c for c, _ in self._idle]
+            self._idle.clear()
+        for conn in ociosas:
+            self._discard(conn, None)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "minsize": self.minsize,
+                "maxsize": self.maxsize,
+            })
+        return data
+
+
+def _is_connection_error(conn):
+    """True si la conexión quedó inutilizable tras una excepción."""
+    try:
+        cur = conn.cursor()
+        cur.close()
+        return False
+    except Exception:
+        return True
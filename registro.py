@@ -0,0 +1,167 @@
+"""
+Logging de la aplicación: niveles, una línea JSON por evento y muestreo del
+nivel DEBUG.
+
+Antes había `print` en caminos calientes (historial_por_equipo, el
+autollenado volcaba las primeras 30 filas del Excel y cada búsqueda de
+etiqueta, el 404); bajo carga todos los hilos se turnaban el lock de stdout.
+Ahora cada módulo usa `logging.getLogger(__name__)` y aquí se configura un
+único handler:
+
+  - LOG_LEVEL (INFO por defecto): con INFO las llamadas a log.debug() se
+    descartan en `isEnabledFor` sin formatear nada. Para volcados caros
+    (recorrer la hoja, armar un dict) se pregunta antes debug_activo(log).
+  - LOG_DEBUG_SAMPLE: con LOG_LEVEL=DEBUG, fracción de peticiones cuyas
+    líneas DEBUG se emiten (la decisión es por petición, así una petición
+    muestreada sale completa). Fuera de una petición no se muestrea.
+  - LOG_JSON: una línea JSON por evento, con request_id, método, ruta (la
+    regla de Flask, p. ej. /device/<tag>) y, en la línea de acceso, status y
+    duration_ms. Los campos pasados en `extra=` también salen en el JSON.
+
+El request_id se toma del encabezado X-Request-ID si viene (proxy) o se
+genera, y se devuelve en la respuesta.
+"""
+import contextvars
+import datetime as _dt
+import json
+import logging
+import random
+import sys
+import time
+import traceback
+import uuid
+
+# {request_id, method, route, path, debug} de la petición en curso
+_contexto = contextvars.ContextVar("registro_contexto", default=None)
+
+# Atributos propios de LogRecord: lo demás vino en `extra=` y va al JSON
+_ESTANDAR = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_CONTEXTO = ("request_id", "method", "route", "path")
+
+
+def contexto():
+    """Contexto de la petición en curso ({} fuera de una petición)."""
+    return _contexto.get() or {}
+
+
+def debug_activo(logger):
+    """¿Vale la pena armar una línea DEBUG para `logger` en esta petición?"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    ctx = _contexto.get()
+    return ctx is None or ctx["debug"]
+
+
+class ContextoFilter(logging.Filter):
+    """Agrega el contexto de la petición al registro y aplica el muestreo de DEBUG."""
+
+    def filter(self, record):
+        ctx = _contexto.get()
+        if ctx is None:
+            return True
+        if record.levelno <= logging.DEBUG and not ctx["debug"]:
+            return False
+        for k in _CONTEXTO:
+            if not hasattr(record, k):
+                setattr(record, k, ctx[k])
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": _dt.datetime.fromtimestamp(record.created, _dt.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in record.__dict__.items():
+            if k not in _ESTANDAR and not k.startswith("_"):
+                data[k] = v
+        if record.exc_info:
+            data["exc"] = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextoFormatter(logging.Formatter):
+    """Para desarrollo: texto legible con el request_id si lo hay."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s%(rid)s: %(message)s")
+
+    def format(self, record):
+        rid = getattr(record, "request_id", None)
+        record.rid = f" [{rid}]" if rid else ""
+        return super().format(record)
+
+
+def configurar(level="INFO", json_lines=True, stream=None):
+    """
+    Handler de registro en el logger raíz. Se puede llamar más de una vez:
+    reemplaza el que haya puesto una llamada anterior, pero no toca los
+    handlers de otros (el servidor WSGI, pytest...).
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_lines else TextoFormatter())
+    handler.addFilter(ContextoFilter())
+    handler._registro = True
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        if getattr(h, "_registro", False):
+            root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    return handler
+
+
+def configurado():
+    """¿Ya hay un handler de configurar() en el logger raíz?"""
+    return any(getattr(h, "_registro", False) for h in logging.getLogger().handlers)
+
+
+def instalar(app, debug_sample=1.0, access_log=True):
+    """
+    Hooks de Flask: abre el contexto de cada petición, escribe la línea de
+    acceso (INFO, logger 'acceso') y devuelve X-Request-ID.
+    """
+    from flask import request
+    from flask.logging import default_handler
+
+    # app.logger pasa a salir por el handler raíz
+    app.logger.removeHandler(default_handler)
+    acceso = logging.getLogger("acceso")
+
+    @app.before_request
+    def _abrir_contexto():
+        rid = (request.headers.get("X-Request-ID") or "").strip()[:64] or uuid.uuid4().hex[:16]
+        ctx = {
+            "request_id": rid,
+            "method": request.method,
+            "route": request.url_rule.rule if request.url_rule else None,
+            "path": request.path,
+            "debug": debug_sample >= 1.0 or random.random() < debug_sample,
+            "t0": time.perf_counter(),
+        }
+        request.environ["registro.token"] = _contexto.set(ctx)
+
+    @app.after_request
+    def _linea_acceso(response):
+        ctx = _contexto.get()
+        if ctx is not None:
+            response.headers["X-Request-ID"] = ctx["request_id"]
+            if access_log and acceso.isEnabledFor(logging.INFO):
+                acceso.info("%s %s %s", ctx["method"], ctx["path"], response.status_code,
+                            extra={"status": response.status_code,
+                                   "duration_ms": round((time.perf_counter() - ctx["t0"]) * 1000, 2)})
+        return response
+
+    @app.teardown_request
+    def _cerrar_contexto(_exc):
+        token = request.environ.pop("registro.token", None)
+        if token is not None:
+            try:
+                _contexto.reset(token)
+            except ValueError:   # el teardown corrió en otro contexto
+                _contexto.set(None)
+
+    return app
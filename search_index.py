@@ -0,0 +1,282 @@
+"""
+Índice de búsqueda en memoria para el buscador y el typeahead.
+
+Los buscadores del listado hacían `e.Tag LIKE '%x%'` / `pa.Nombre LIKE '%x%'`:
+con comodín al inicio SQL Server recorre la tabla entera, y "Jose" no
+encontraba a "José". Aquí indexamos por trigramas, ya sin tildes y en
+minúscula, los campos Tag, Marca, Modelo, Serial, Ubicación y persona asignada
+de cada equipo, más los nombres de ti.Persona.
+
+Los trigramas se sacan por palabra con relleno (como pg_trgm: "  jo", " jos",
+...), así que una consulta corta también encuentra prefijos. Una coincidencia
+necesita al menos la mitad de los trigramas de la consulta; los candidatos
+salen solo de los trigramas más raros (si un documento comparte la mitad de
+los trigramas, comparte al menos uno de los más raros) y los muy frecuentes
+se tratan como palabras vacías. Luego se ordenan por similitud ponderada por
+campo, con bonificación si la consulta aparece tal cual o como prefijo.
+
+La carga inicial es una consulta a la base (`cargar_equipos`,
+`cargar_personas`). Después, los helpers de escritura de db.py avisan qué
+tag cambió (db.al_escribir) y el índice solo lo marca como pendiente; los
+pendientes se releen en un solo lote antes de la siguiente búsqueda.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+# Campo -> peso en el ranking
+CAMPOS = {
+    "tag": 3.0,
+    "serial": 2.0,
+    "personaasignada": 2.0,
+    "modelo": 1.0,
+    "marca": 1.0,
+    "ubicacion": 1.0,
+}
+
+MIN_SIMILITUD = 0.5
+
+# Un trigrama en más de esta fracción de los documentos no genera candidatos
+FRECUENTE = 0.2
+FRECUENTE_MIN = 500
+
+
+def fold(text):
+    """Minúscula y sin tildes: 'José Peña' -> 'jose pena'."""
+    if not text:
+        return ""
+    s = unicodedata.normalize("NFKD", str(text))
+    return "".join(ch for ch in s if not unicodedata.combining(ch)).lower().strip()
+
+
+def trigramas(folded):
+    out = set()
+    for palabra in folded.split():
+        p = f"  {palabra} "
+        out.update(p[i:i + 3] for i in range(len(p) - 2))
+    return out
+
+
+class SearchIndex:
+    def __init__(self, cargar_equipos, cargar_personas=None):
+        self.cargar_equipos = cargar_equipos      # tags | None -> [fila]
+        self.cargar_personas = cargar_personas    # () -> [fila]
+        self._lock = threading.RLock()
+        self._refresco = threading.RLock()   # una carga (completa o de pendientes) a la vez
+        self._docs = {}       # clave ("e:TAG" | "p:nombre plegado") -> documento
+        self._grams = {}      # trigrama -> set(claves)
+        self._doc_grams = {}  # clave -> set(trigramas)
+        self._pendientes = set()
+        self.built = False
+        self.last_build = None
+        self._stats = {"searches": 0, "updates": 0, "last_ms": None}
+
+    # ---------- mantenimiento ----------
+
+    def _quitar(self, clave):
+        for g in self._doc_grams.pop(clave, ()):
+            ids = self._grams.get(g)
+            if ids is not None:
+                ids.discard(clave)
+                if not ids:
+                    del self._grams[g]
+        self._docs.pop(clave, None)
+
+    def _poner(self, clave, doc):
+        self._quitar(clave)
+        grams = set()
+        for campo in doc["campos"]:
+            grams |= trigramas(doc["folded"][campo])
+        self._docs[clave] = doc
+        self._doc_grams[clave] = grams
+        for g in grams:
+            self._grams.setdefault(g, set()).add(clave)
+
+    @staticmethod
+    def _doc_equipo(row):
+        campos = {c: (row.get(c) or "").strip() for c in CAMPOS if (row.get(c) or "").strip()}
+        return {
+            "tipo": "equipo",
+            "tag": (row.get("tag") or "").strip(),
+            "estado": row.get("estado") or "ACTIVO",
+            "campos": campos,
+            "folded": {c: fold(v) for c, v in campos.items()},
+        }
+
+    @staticmethod
+    def _doc_persona(nombre, area=None, cargo=None):
+        return {
+            "tipo": "persona",
+            "nombre": nombre,
+            "area": area,
+            "cargo": cargo,
+            "campos": {"nombre": nombre},
+            "folded": {"nombre": fold(nombre)},
+        }
+
+    def _poner_equipo(self, row):
+        doc = self._doc_equipo(row)
+        if not doc["tag"]:
+            return
+        self._poner("e:" + doc["tag"].upper(), doc)
+        nombre = doc["campos"].get("personaasignada")
+        # Personas creadas al vuelo por _resolver_persona entran con su primer equipo
+        if nombre and "p:" + fold(nombre) not in self._docs:
+            self._poner("p:" + fold(nombre), self._doc_persona(nombre))
+
+    def rebuild(self):
+        """Carga todo desde la base."""
+        with self._refresco:
+            # lo marcado antes de la carga ya está en lo que se lee; lo que
+            # llegue durante la carga queda pendiente para la próxima lectura
+            with self._lock:
+                previos, self._pendientes = self._pendientes, set()
+            try:
+                equipos = self.cargar_equipos(None)
+                personas = self.cargar_personas() if self.cargar_personas else []
+            except Exception:
+                with self._lock:
+                    self._pendientes |= previos
+                raise
+            with self._lock:
+                self._docs, self._grams, self._doc_grams = {}, {}, {}
+                for p in personas:
+                    nombre = (p.get("nombre") or "").strip()
+                    if nombre:
+                        self._poner("p:" + fold(nombre), self._doc_persona(nombre, p.get("area"), p.get("cargo")))
+                for row in equipos:
+                    self._poner_equipo(row)
+                self.built = True
+                self.last_build = time.time()
+
+    def marcar(self, tag, *_grupos):
+        """Oyente de db.al_escribir: el tag se relee antes de la próxima búsqueda."""
+        if tag:
+            with self._lock:
+                self._pendientes.add(tag.strip().upper())
+
+    def _aplicar_pendientes(self):
+        with self._lock:
+            if not self._pendientes:
+                return
+            tags, self._pendientes = self._pendientes, set()
+        try:
+            filas = {(r.get("tag") or "").strip().upper(): r for r in self.cargar_equipos(sorted(tags))}
+        except Exception:
+            with self._lock:
+                self._pendientes |= tags
+            raise
+        with self._lock:
+            for t in tags:
+                if t in filas:
+                    self._poner_equipo(filas[t])
+                else:
+                    self._quitar("e:" + t)
+            self._stats["updates"] += len(tags)
+
+    def ensure_fresh(self):
+        # serializado: varias primeras lecturas a la vez hacen una sola carga
+        with self._refresco:
+            if not self.built:
+                self.rebuild()
+            else:
+                self._aplicar_pendientes()
+
+    # ---------- búsqueda ----------
+
+    def _candidatos(self, qgrams, necesarios):
+        """{clave: trigramas en común} para las claves con al menos `necesarios`."""
+        listas = sorted((self._grams[g] for g in qgrams if g in self._grams), key=len)
+        if len(listas) < necesarios:
+            return {}
+        # Trigramas presentes en gran parte del índice ("act", "000", "  l" de
+        # "lenovo"...) casi no discriminan: no generan candidatos, solo suman
+        tope = max(FRECUENTE_MIN, int(len(self._docs) * FRECUENTE))
+        raras = [ids for ids in listas if len(ids) <= tope]
+        frecuentes = listas[len(raras):]
+        if not raras:
+            todos = frecuentes[0].intersection(*frecuentes[1:])
+            return dict.fromkeys(todos, len(frecuentes))
+        # Quien comparte `necesarios` trigramas comparte alguno de los n-necesarios+1 más raros
+        corte = max(1, min(len(raras), len(listas) - necesarios + 1))
+        cuenta = Counter()
+        for ids in raras[:corte]:
+            cuenta.update(ids)
+        claves = cuenta.keys()
+        for ids in listas[corte:]:
+            cuenta.update(ids & claves)   # intersección en C, no un `in` por candidato
+        return {k: n for k, n in cuenta.items() if n >= necesarios}
+
+    @staticmethod
+    def _mejores(cands, cuantos):
+        """Las `cuantos` claves con más trigramas en común (empates por clave)."""
+        if len(set(cands.values())) <= 1:
+            return heapq.nsmallest(cuantos, cands)
+        por_n = {}
+        for k, n in cands.items():
+            por_n.setdefault(n, []).append(k)
+        out = []
+        for n in sorted(por_n, reverse=True):
+            falta = cuantos - len(out)
+            grupo = por_n[n]
+            out += sorted(grupo) if len(grupo) <= falta else heapq.nsmallest(falta, grupo)
+            if len(out) >= cuantos:
+                break
+        return out
+
+    def search(self, q, limit=10, tipo=None):
+        """
+        [{tipo, tag|nombre, campo, texto, score}] ordenado por relevancia.
+        `tipo` = 'equipo' | 'persona' filtra el tipo de documento.
+        """
+        t0 = time.perf_counter()
+        self.ensure_fresh()
+        fq = fold(q)
+        qgrams = trigramas(fq)
+        if not qgrams:
+            return []
+        necesarios = max(1, int(len(qgrams) * MIN_SIMILITUD + 0.999))
+        pref = {"equipo": "e", "persona": "p"}.get(tipo)
+
+        with self._lock:
+            cands = self._candidatos(qgrams, necesarios)
+            if pref:
+                cands = {k: n for k, n in cands.items() if k[0] == pref}
+            # Solo se puntúan en detalle los mejores por número de trigramas
+            resultados = []
+            for clave in self._mejores(cands, max(limit * 5, 30)):
+                doc = self._docs[clave]
+                best = None
+                for campo, texto in doc["folded"].items():
+                    sim = len(qgrams & trigramas(texto)) / len(qgrams)
+                    if fq in texto:
+                        sim += 1.0 if texto.startswith(fq) else 0.5
+                    score = sim * CAMPOS.get(campo, 2.0)
+                    if best is None or score > best[0]:
+                        best = (score, campo)
+                if best is None:
+                    continue
+                item = {"tipo": doc["tipo"], "campo": best[1], "texto": doc["campos"][best[1]],
+                        "score": round(best[0], 3)}
+                if doc["tipo"] == "equipo":
+                    item.update(tag=doc["tag"], estado=doc["estado"],
+                                persona=doc["campos"].get("personaasignada"),
+                                modelo=doc["campos"].get("modelo"))
+                else:
+                    item.update(nombre=doc["nombre"], area=doc["area"], cargo=doc["cargo"])
+                resultados.append(item)
+
+        resultados.sort(key=lambda r: (-r["score"], r.get("tag") or r.get("nombre") or ""))
+        with self._lock:
+            self._stats["searches"] += 1
+            self._stats["last_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        return resultados[:limit]
+
+    def stats(self):
+        with self._lock:
+            equipos = sum(1 for k in self._docs if k[0] == "e")
+            return dict(self._stats, built=self.built, last_build=self.last_build,
+                        equipos=equipos, personas=len(self._docs) - equipos,
+                        trigramas=len(self._grams), pendientes=len(self._pendientes))
@@ -0,0 +1,347 @@
+"""
+Índice local de los archivos de la carpeta de red (SHARE_ROOT).
+
+Antes, cada vista de equipo recorría todo el share con os.walk y hacía
+getsize/getmtime por coincidencia. Aquí guardamos nombre, ruta, tamaño,
+mtime y extensión de cada archivo en un SQLite local, y en memoria un índice
+de trigramas sobre el nombre para buscar por substring del tag sin tocar
+el share.
+
+Refresco incremental: por cada carpeta guardamos su mtime. El mtime de una
+carpeta cambia cuando se crea, borra o renombra algo dentro de ella, así que
+solo volvemos a listar las carpetas cuyo mtime cambió; para el resto basta un
+stat. (Una edición en sitio de un archivo no cambia el mtime de la carpeta;
+para eso está el rebuild completo.)
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def scan_dir(path, exts=None):
+    """
+    Lista una carpeta del share con una sola llamada a scandir.
+    Devuelve (mtime_carpeta, [subcarpetas], [archivos]) o None si no existe.
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+        subdirs, files = [], []
+        with os.scandir(path) as it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        subdirs.append(e.path)
+                        continue
+                    if not e.is_file():
+                        continue
+                    ext = os.path.splitext(e.name)[1].lstrip('.').lower()
+                    if exts and ext not in exts:
+                        continue
+                    st = e.stat()
+                except OSError:
+                    continue
+                files.append({
+                    "path": e.path,
+                    "dir": path,
+                    "name": e.name,
+                    "size": st.st_size,
+                    "mtime": st.st_mtime,
+                    "ext": ext,
+                })
+    except OSError:
+        return None
+    return mtime, subdirs, files
+
+
+class ShareNoDisponible(OSError):
+    """No se pudo leer la raíz del share: el refresco no toca el índice."""
+
+
+def _check_dir(d, previo, exts):
+    """Un stat si la carpeta no cambió; scandir completo si cambió o es nueva."""
+    try:
+        mtime = os.stat(d).st_mtime
+    except OSError:
+        return None
+    if previo is not None and previo[0] == mtime:
+        return mtime, None, None
+    return scan_dir(d, exts)
+
+
+def scan_changes(root, known, exts=None, executor=None, full=False):
+    """
+    Recorre el árbol nivel por nivel. Las carpetas cuyo mtime coincide con
+    `known` ({carpeta: (mtime, padre)}) no se listan: sus subcarpetas son las
+    que ya conocíamos. Con `full` se re-listan todas. Con `executor` cada
+    nivel se revisa en paralelo.
+    Devuelve ({carpeta: (mtime, padre, [archivos])} re-listadas, set(vistas)).
+
+    Una carpeta que no responde (corte del share, permisos) cuenta como vista
+    junto con todo lo que ya conocíamos debajo de ella: se conserva tal cual
+    y se vuelve a revisar en el próximo barrido. Una carpeta borrada de
+    verdad no llega aquí, porque su padre cambió de mtime y al re-listarlo ya
+    no aparece. Si la raíz no responde se levanta ShareNoDisponible.
+    """
+    hijos = {}
+    for p, (_, parent) in known.items():
+        hijos.setdefault(parent, []).append(p)
+
+    def conservar(d):
+        pila = [d]
+        while pila:
+            x = pila.pop()
+            if x not in vistos:
+                vistos.add(x)
+                pila.extend(hijos.get(x, ()))
+
+    mapper = executor.map if executor is not None else map
+    changed, vistos = {}, set()
+    nivel = [(root, None)]
+    while nivel:
+        resultados = mapper(lambda item: _check_dir(item[0], None if full else known.get(item[0]), exts), nivel)
+        siguiente = []
+        for (d, parent), res in zip(nivel, resultados):
+            if res is None:
+                if parent is None:
+                    raise ShareNoDisponible(f"No se pudo leer {root!r}")
+                conservar(d)
+                continue
+            vistos.add(d)
+            mtime, subdirs, files = res
+            if subdirs is None:
+                siguiente.extend((h, d) for h in hijos.get(d, ()))
+            else:
+                changed[d] = (mtime, parent, files)
+                siguiente.extend((s, d) for s in subdirs)
+        nivel = siguiente
+    return changed, vistos
+
+
+class ShareIndex:
+    def __init__(self, root, db_path, exts=None):
+        self.root = root
+        self.db_path = db_path
+        self.exts = {e.lower() for e in exts} if exts else None
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._files = {}      # id -> entrada
+        self._by_path = {}    # ruta -> id
+        self._by_dir = {}     # carpeta -> set(ids)
+        self._dirs = {}       # carpeta -> (mtime, padre)
+        self._grams = {}      # trigrama -> set(ids)
+        self._next_id = 1
+        self.last_refresh = None
+
+    # ---------- persistencia ----------
+
+    def _db(self):
+        d = os.path.dirname(self.db_path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS dirs(
+                path   TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime  REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files(
+                path  TEXT PRIMARY KEY,
+                dir   TEXT NOT NULL,
+                name  TEXT NOT NULL,
+                size  INTEGER,
+                mtime REAL,
+                ext   TEXT
+            );
+            CREATE INDEX IF NOT EXISTS ix_files_dir ON files(dir);
+        """)
+        return conn
+
+    def load(self):
+        """Carga el índice persistido a memoria (sin tocar el share)."""
+        with self._lock:
+            conn = self._db()
+            try:
+                self._reset_memory()
+                for path, parent, mtime in conn.execute("SELECT path, parent, mtime FROM dirs"):
+                    self._dirs[path] = (mtime, parent)
+                for path, d, name, size, mtime, ext in conn.execute(
+                        "SELECT path, dir, name, size, mtime, ext FROM files"):
+                    self._add_mem({"path": path, "dir": d, "name": name,
+                                   "size": size, "mtime": mtime, "ext": ext})
+            finally:
+                conn.close()
+            self._loaded = True
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    @property
+    def built(self):
+        self.ensure_loaded()
+        return self.root in self._dirs
+
+    # ---------- memoria ----------
+
+    def _reset_memory(self):
+        self._files.clear()
+        self._by_path.clear()
+        self._by_dir.clear()
+        self._dirs.clear()
+        self._grams.clear()
+
+    def _add_mem(self, f):
+        fid = self._next_id
+        self._next_id += 1
+        f["lname"] = f["name"].lower()
+        self._files[fid] = f
+        self._by_path[f["path"]] = fid
+        self._by_dir.setdefault(f["dir"], set()).add(fid)
+        for g in _trigrams(f["lname"]):
+            self._grams.setdefault(g, set()).add(fid)
+
+    def _drop_mem_dir(self, d):
+        for fid in self._by_dir.pop(d, ()):
+            f = self._files.pop(fid)
+            self._by_path.pop(f["path"], None)
+            for g in _trigrams(f["lname"]):
+                s = self._grams.get(g)
+                if s is not None:
+                    s.discard(fid)
+                    if not s:
+                        del self._grams[g]
+
+    # ---------- actualización ----------
+
+    def apply(self, changed, removed=()):
+        """
+        Aplica un delta al índice (memoria + disco).
+          changed: {carpeta: (mtime, padre, [archivos])} carpetas re-listadas
+          removed: carpetas que ya no existen (se borran con sus archivos)
+        Devuelve cuántos archivos se agregaron, borraron o modificaron.
+        """
+        delta = {"added": 0, "deleted": 0, "modified": 0}
+        with self._lock:
+            self.ensure_loaded()
+            conn = self._db()
+            try:
+                with conn:
+                    for d in removed:
+                        conn.execute("DELETE FROM dirs WHERE path = ?", (d,))
+                        conn.execute("DELETE FROM files WHERE dir = ?", (d,))
+                        self._dirs.pop(d, None)
+                        delta["deleted"] += len(self._by_dir.get(d, ()))
+                        self._drop_mem_dir(d)
+                    for d, (mtime, parent, files) in changed.items():
+                        previos = {self._files[fid]["path"]: self._files[fid]
+                                   for fid in self._by_dir.get(d, ())}
+                        for f in files:
+                            p = previos.pop(f["path"], None)
+                            if p is None:
+                                delta["added"] += 1
+                            elif (p["size"], p["mtime"]) != (f["size"], f["mtime"]):
+                                delta["modified"] += 1
+                        delta["deleted"] += len(previos)
+                        conn.execute("INSERT OR REPLACE INTO dirs(path, parent, mtime) VALUES (?, ?, ?)",
+                                     (d, parent, mtime))
+                        conn.execute("DELETE FROM files WHERE dir = ?", (d,))
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO files(path, dir, name, size, mtime, ext) VALUES (?, ?, ?, ?, ?, ?)",
+                            [(f["path"], d, f["name"], f["size"], f["mtime"], f["ext"]) for f in files])
+                        self._dirs[d] = (mtime, parent)
+                        self._drop_mem_dir(d)
+                        for f in files:
+                            self._add_mem(dict(f, dir=d))
+            finally:
+                conn.close()
+            self.last_refresh = time.time()
+        return delta
+
+    def known_dirs(self):
+        """Copia de {carpeta: (mtime, padre)} para comparar contra el share."""
+        with self._lock:
+            self.ensure_loaded()
+            return dict(self._dirs)
+
+    def refresh(self, full=False, executor=None):
+        """
+        Recorre el share comparando el mtime de cada carpeta con el guardado y
+        re-lista solo las que cambiaron. Con full=True re-lista todo.
+        `executor` (ThreadPoolExecutor) permite revisar las carpetas de cada
+        nivel en paralelo.
+        Devuelve {"dirs", "changed", "removed", "files", "files_scanned",
+                  "added", "deleted", "modified", "seconds"}.
+        Si la raíz no responde levanta ShareNoDisponible sin tocar el índice.
+        """
+        t0 = time.perf_counter()
+        known = self.known_dirs()
+        changed, vistos = scan_changes(self.root, known, self.exts, executor, full=full)
+        removed = [p for p in known if p not in vistos]
+        delta = self.apply(changed, removed)
+        with self._lock:
+            total = len(self._files)
+        return dict(
+            delta,
+            dirs=len(vistos),
+            changed=len(changed),
+            removed=len(removed),
+            files=total,
+            files_scanned=sum(len(files) for _, _, files in changed.values()),
+            seconds=round(time.perf_counter() - t0, 3),
+        )
+
+    def rebuild(self):
+        return self.refresh(full=True)
+
+    # ---------- consulta ----------
+
+    def search(self, needle):
+        """Archivos cuyo nombre contiene `needle` (sin distinguir mayúsculas). Solo memoria."""
+        n = (needle or '').lower()
+        if not n:
+            return []
+        with self._lock:
+            self.ensure_loaded()
+            if len(n) < 3:
+                candidatos = self._files.keys()
+            else:
+                sets = []
+                for g in _trigrams(n):
+                    s = self._grams.get(g)
+                    if not s:
+                        return []
+                    sets.append(s)
+                sets.sort(key=len)
+                candidatos = set(sets[0]).intersection(*sets[1:])
+            return [dict(self._files[fid]) for fid in candidatos if n in self._files[fid]["lname"]]
+
+    def get(self, path):
+        """Entrada del índice para `path` (tamaño y mtime del último barrido), o None. Solo memoria."""
+        with self._lock:
+            self.ensure_loaded()
+            fid = self._by_path.get(path)
+            return dict(self._files[fid]) if fid is not None else None
+
+    def files(self, ext=None):
+        """Todas las entradas del índice (opcionalmente de una extensión)."""
+        ext = ext.lower().lstrip('.') if ext else None
+        with self._lock:
+            self.ensure_loaded()
+            return [dict(f) for f in self._files.values() if ext is None or f["ext"] == ext]
+
+    def stats(self):
+        with self._lock:
+            self.ensure_loaded()
+            return {
+                "root": self.root,
+                "dirs": len(self._dirs),
+                "files": len(self._files),
+                "trigrams": len(self._grams),
+                "last_refresh": self.last_refresh,
+            }
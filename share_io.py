@@ -0,0 +1,298 @@
+"""
+I/O contra la carpeta de red (SHARE_ROOT) fuera del hilo de la petición.
+
+Un servidor de archivos lento dejaba colgado el worker que atendía la
+petición en un os.path.isfile / getsize / send_file, y con unos pocos así se
+paraba toda la aplicación. Aquí cada operación corre en un pool de hilos
+acotado y la petición espera como máximo `timeout` segundos:
+
+  - si vence el plazo se levanta ShareTimeout (el hilo del pool sigue
+    bloqueado en el share, pero la petición ya respondió);
+  - tras `threshold` fallos seguidos se abre el circuito y durante
+    `reset_timeout` segundos todo falla de inmediato con ShareUnavailable, sin
+    encolar más trabajo contra un share que no responde; pasado ese tiempo se
+    deja pasar una operación de prueba (half-open);
+  - si ya hay demasiadas operaciones en vuelo (el pool está ocupado por
+    llamadas colgadas) también se rechaza de inmediato.
+
+"No existe" (FileNotFoundError y similares) es una respuesta normal del
+share y no cuenta como fallo. `stat_many` hace stat de muchas rutas en
+paralelo con un único plazo para todo el lote.
+
+El acceso real al sistema de archivos pasa por `fs` (por defecto os.stat y
+open), así se puede probar con un doble lento (fakeshare.SlowFS). Cada
+operación, con su espera y resultado, se mide en metricas.py.
+"""
+import os
+import stat as stat_mod
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+from metricas import medir_share
+
+
+class ShareIOError(OSError):
+    pass
+
+
+class ShareTimeout(ShareIOError):
+    pass
+
+
+class ShareUnavailable(ShareIOError):
+    pass
+
+
+# Respuestas normales del share: no abren el circuito
+_NO_EXISTE = (FileNotFoundError, NotADirectoryError, IsADirectoryError)
+
+
+class LocalFS:
+    """Acceso directo (el de producción)."""
+    stat = staticmethod(os.stat)
+    open = staticmethod(open)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_desde = None
+        self._probando = False
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._abierto_desde is None:
+            return "closed"
+        if time.monotonic() - self._abierto_desde >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            st = self._state()
+            if st == "closed":
+                return True
+            if st == "half_open" and not self._probando:
+                self._probando = True   # una sola operación de prueba
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._fallos = 0
+            self._abierto_desde = None
+            self._probando = False
+
+    def soltar(self):
+        """
+        La operación permitida terminó sin decir nada de la salud del share
+        (p.ej. una ruta inválida: ValueError por un byte nulo). Si era la
+        prueba de half_open, queda libre para la siguiente.
+        """
+        with self._lock:
+            self._probando = False
+
+    def failure(self):
+        with self._lock:
+            self._fallos += 1
+            if self._probando or self._fallos >= self.threshold:
+                if self._abierto_desde is None or self._probando:
+                    self.opened += 1
+                self._abierto_desde = time.monotonic()
+                self._probando = False
+
+
+class ShareIO:
+    def __init__(self, workers=16, timeout=5.0, max_pending=None, breaker=None, fs=None, logger=None):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending if max_pending is not None else workers * 4
+        self.breaker = breaker or CircuitBreaker()
+        self.fs = fs or LocalFS()
+        self.logger = logger
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="share-io")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"calls": 0, "ok": 0, "not_found": 0, "errors": 0,
+                       "timeouts": 0, "rejected": 0, "batches": 0, "batch_paths": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _done(self, _fut):
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, fn, *args):
+        """Encola `fn(*args)` en el pool, o rechaza si el circuito está abierto o el pool saturado."""
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise ShareUnavailable("La carpeta de red no responde (circuito abierto).")
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                saturado = True
+            else:
+                self._pending += 1
+                self._stats["calls"] += 1
+                saturado = False
+        if saturado:
+            self.breaker.failure()
+            raise ShareUnavailable("La carpeta de red no responde (demasiadas operaciones en curso).")
+        try:
+            fut = self._executor.submit(fn, *args)
+        except BaseException:
+            self._done(None)
+            self.breaker.soltar()
+            raise
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _resolve(self, fut, what, timeout):
+        """Espera el resultado y actualiza contadores y circuito."""
+        try:
+            res = fut.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            self._count("timeouts")
+            self.breaker.failure()
+            if self.logger:
+                self.logger.warning("share_io: %s superó %.1fs", what, self.timeout if timeout is None else timeout)
+            raise ShareTimeout(f"La carpeta de red no respondió a tiempo ({what}).")
+        except _NO_EXISTE:
+            self._count("not_found")
+            self.breaker.success()
+            raise
+        except OSError:
+            self._count("errors")
+            self.breaker.failure()
+            raise
+        except BaseException:
+            self._count("errors")
+            self.breaker.soltar()
+            raise
+        self._count("ok")
+        self.breaker.success()
+        return res
+
+    def call(self, fn, *args, timeout=None):
+        """Ejecuta `fn(*args)` (I/O contra el share) en el pool con plazo."""
+        what = getattr(fn, "__name__", "call")
+        with medir_share(what):
+            return self._resolve(self._submit(fn, *args), what, timeout)
+
+    # ---------- operaciones ----------
+
+    def stat(self, path, timeout=None):
+        """os.stat_result de `path`, o None si no existe."""
+        try:
+            with medir_share("stat"):
+                return self._resolve(self._submit(self.fs.stat, path), f"stat {path}", timeout)
+        except _NO_EXISTE:
+            return None
+
+    def isfile(self, path, timeout=None):
+        st = self.stat(path, timeout=timeout)
+        return st is not None and stat_mod.S_ISREG(st.st_mode)
+
+    def isdir(self, path, timeout=None):
+        st = self.stat(path, timeout=timeout)
+        return st is not None and stat_mod.S_ISDIR(st.st_mode)
+
+    def open(self, path, mode="rb", timeout=None):
+        """Abre `path` en el pool (el open es lo que se cuelga contra un SMB lento)."""
+        with medir_share("open"):
+            fut = self._submit(self.fs.open, path, mode)
+            try:
+                return self._resolve(fut, f"open {path}", timeout)
+            except ShareTimeout:
+                # Si el open termina después del plazo, nadie va a cerrar ese archivo
+                fut.add_done_callback(lambda f: f.exception() is None and f.result().close())
+                raise
+
+    def stat_many(self, paths, timeout=None):
+        """
+        stat en paralelo de `paths` con un único plazo para todo el lote.
+        Devuelve {ruta: os.stat_result | None} con None si no existe; las
+        rutas que fallaron o no respondieron a tiempo no aparecen (no se sabe
+        nada de ellas). Con el circuito abierto levanta ShareUnavailable.
+        """
+        paths = list(dict.fromkeys(paths))
+        if not paths:
+            return {}
+        with medir_share("stat_many"):
+            return self._stat_many(paths, timeout)
+
+    def _stat_many(self, paths, timeout):
+        self._count("batches")
+        self._count("batch_paths", len(paths))
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise ShareUnavailable("La carpeta de red no responde (circuito abierto).")
+        vence = time.monotonic() + (self.timeout if timeout is None else timeout)
+        cola = list(reversed(paths))
+        futs, out, fallos = {}, {}, 0
+        while True:
+            # Se encola a medida que se liberan lugares, sin pasar de max_pending
+            while cola:
+                with self._lock:
+                    if self._pending >= self.max_pending:
+                        break
+                    self._pending += 1
+                    self._stats["calls"] += 1
+                p = cola.pop()
+                fut = self._executor.submit(self.fs.stat, p)
+                fut.add_done_callback(self._done)
+                futs[fut] = p
+            restante = vence - time.monotonic()
+            if not futs or restante <= 0:
+                break
+            hechos, _ = wait(futs, timeout=restante, return_when=FIRST_COMPLETED)
+            for fut in hechos:
+                p = futs.pop(fut)
+                try:
+                    out[p] = fut.result()
+                    self._count("ok")
+                except _NO_EXISTE:
+                    out[p] = None
+                    self._count("not_found")
+                except Exception:
+                    # OSError del share o una ruta inválida (ValueError): no se sabe nada de ella
+                    self._count("errors")
+                    fallos += 1
+            if not cola and not futs:
+                break
+        sin_respuesta = len(futs) + len(cola)
+        if sin_respuesta:
+            self._count("timeouts", sin_respuesta)
+            fallos += sin_respuesta
+        # El lote cuenta como un solo éxito o fallo para el circuito
+        if fallos:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+        return out
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats, pending=self._pending)
+        data.update({
+            "workers": self.workers,
+            "timeout": self.timeout,
+            "max_pending": self.max_pending,
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+        })
+        return data
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
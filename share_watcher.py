@@ -0,0 +1,108 @@
+"""
+Hilo en segundo plano que mantiene caliente el índice del share.
+
+Cada `interval` segundos revisa SHARE_ROOT nivel por nivel con un pool de
+hilos (scandir en paralelo sobre las subcarpetas, como máximo `workers` a la
+vez) y empuja al ShareIndex solo las carpetas que cambiaron. Así
+_scan_files_for_tag y device_link siempre leen un índice al día sin hacer
+I/O contra el share en la petición.
+
+El barrido incremental no ve una edición en sitio (no cambia el mtime de la
+carpeta), y el tamaño/mtime del índice versionan el ETag de la página de
+equipo y la URL de la vista previa. Por eso cada `full_every` barridos se
+hace uno completo que re-lista todas las carpetas (0 lo desactiva).
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ShareWatcher:
+    def __init__(self, index, interval=300.0, workers=8, full_every=12, logger=None):
+        self.index = index
+        self.interval = interval
+        self.workers = workers
+        self.full_every = full_every
+        self.logger = logger
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "runs": 0,
+            "full_runs": 0,
+            "errors": 0,
+            "last_error": None,
+            "last_started": None,
+            "last_duration": None,
+            "files_seen": None,
+            "files_scanned": None,
+            "dirs_seen": None,
+            "dirs_changed": None,
+            "delta": None,
+            "delta_total": 0,
+        }
+
+    def run_once(self, full=None):
+        """
+        Un barrido de todo el share. Incremental, salvo cada `full_every`
+        barridos (o con full=True). Devuelve el resultado de ShareIndex.refresh.
+        """
+        if full is None:
+            with self._lock:
+                n = self._stats["runs"] + self._stats["errors"] + 1
+            full = bool(self.full_every) and n % self.full_every == 0
+        inicio = time.time()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="share-scan") as ex:
+            res = self.index.refresh(full=full, executor=ex)
+        delta = res["added"] + res["deleted"] + res["modified"]
+        with self._lock:
+            self._stats["delta_total"] += delta
+            self._stats.update({
+                "runs": self._stats["runs"] + 1,
+                "full_runs": self._stats["full_runs"] + int(full),
+                "last_started": inicio,
+                "last_duration": res["seconds"],
+                "files_seen": res["files"],
+                "files_scanned": res["files_scanned"],
+                "dirs_seen": res["dirs"],
+                "dirs_changed": res["changed"] + res["removed"],
+                "delta": delta,
+            })
+        return res
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                with self._lock:
+                    self._stats["errors"] += 1
+                    self._stats["last_error"] = repr(e)
+                if self.logger:
+                    self.logger.exception("Fallo el barrido del share")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="share-watcher", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+        data.update({"running": self.running, "interval": self.interval, "workers": self.workers,
+                     "full_every": self.full_every})
+        return data
@@ -0,0 +1,403 @@
+"""
+Subida de archivos principales: recepción a un staging local y copia al
+share (UPLOAD_ROOT) en segundo plano.
+
+Antes la subida medía el tamaño haciendo seek sobre el stream y luego
+escribía directo al share dentro de la petición: un share lento dejaba la
+petición colgada, y un corte a medio escribir dejaba un archivo truncado
+vinculado como principal. Ahora:
+
+  1. recepción: el cuerpo se lee de a `bloque` bytes hacia un archivo en
+     `staging` (disco local), calculando el SHA-256 y cortando apenas se pasa
+     del límite. Nada se guarda entero en memoria.
+  2. traslado: un pool propio copia el archivo a `destino` como temporal,
+     hace fsync, compara el tamaño y recién entonces lo renombra al nombre
+     final. Si el share falla se reintenta con espera creciente.
+  3. vínculo: `al_terminar(tag, ruta, nombre)` (archivo_principal_set) se
+     llama solo con el archivo ya completo en el share.
+
+Subidas reanudables para escaneos grandes: `iniciar` reserva un id y cada
+`anexar(id, offset, stream)` agrega un tramo; si el offset no coincide con
+lo recibido (se cortó la conexión a la mitad) se levanta OffsetIncorrecto
+con el offset real y el cliente reenvía desde ahí.
+
+Deduplicación: el nombre final lleva el hash (`<tag>-<sha256[:12]>.<ext>`),
+así un archivo del share nunca se sobreescribe, y si el mismo contenido ya
+se subió antes (para este u otro equipo) se vincula ese archivo sin volver a
+copiarlo.
+
+El estado vive en un SQLite local: al reiniciar, `reanudar()` vuelve a
+encolar los traslados que quedaron pendientes y borra las subidas
+abandonadas.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from share_io import LocalFS
+
+log = logging.getLogger(__name__)
+
+_BLOQUE = 64 * 1024
+
+
+class SubidaError(Exception):
+    """Subida rechazada (tamaño, id desconocido, estado...)."""
+
+
+class DemasiadoGrande(SubidaError):
+    pass
+
+
+class SubidaDesconocida(SubidaError):
+    pass
+
+
+class OffsetIncorrecto(SubidaError):
+    def __init__(self, offset):
+        super().__init__(f"offset esperado: {offset}")
+        self.offset = offset
+
+
+def _limite(n):
+    """Texto del límite de tamaño: en MB, o en bytes si no llega a 1 MB."""
+    return f"Máximo {n // (1024 * 1024)}MB por archivo." if n >= 1024 * 1024 else f"Máximo {n} bytes por archivo."
+
+
+class Subidas:
+    def __init__(self, staging, destino, db_path, fs=None, al_terminar=None, max_bytes=200 * 1024 * 1024,
+                 workers=1, reintentos=5, espera=2.0, abandonadas_h=24):
+        self.staging = staging
+        self.destino = destino
+        self.db_path = db_path
+        self.fs = fs or LocalFS()
+        self.al_terminar = al_terminar
+        self.max_bytes = max_bytes
+        self.reintentos = reintentos
+        self.espera = espera
+        self.abandonadas_h = abandonadas_h
+        self._lock = threading.Lock()
+        self._ready = False
+        self._por_id = {}        # id -> Lock (un tramo a la vez por subida)
+        self._hashes = {}        # id -> (sha256 parcial, bytes hasheados)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="subidas")
+        self._stats = {"started": 0, "received_bytes": 0, "rejected": 0, "moved": 0, "moved_bytes": 0,
+                       "deduplicated": 0, "retries": 0, "failed": 0, "rehashed": 0, "expired": 0}
+        os.makedirs(staging, exist_ok=True)
+
+    # ---------- persistencia ----------
+
+    def _db(self):
+        if not self._ready:
+            d = os.path.dirname(self.db_path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        if not self._ready:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS subidas(
+                    id          TEXT PRIMARY KEY,
+                    tag         TEXT NOT NULL,
+                    nombre      TEXT NOT NULL,
+                    size        INTEGER,
+                    estado      TEXT NOT NULL,
+                    sha256      TEXT,
+                    ruta        TEXT,
+                    intentos    INTEGER NOT NULL DEFAULT 0,
+                    error       TEXT,
+                    creada      REAL NOT NULL,
+                    actualizada REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_subidas_estado ON subidas(estado);
+                CREATE TABLE IF NOT EXISTS contenidos(
+                    sha256 TEXT PRIMARY KEY,
+                    ruta   TEXT NOT NULL,
+                    size   INTEGER NOT NULL
+                );
+            """)
+            self._ready = True
+        return conn
+
+    def _fila(self, id_):
+        conn = self._db()
+        try:
+            row = conn.execute("SELECT id, tag, nombre, size, estado, sha256, ruta, intentos, error "
+                               "FROM subidas WHERE id = ?", (id_,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        claves = ("id", "tag", "nombre", "size", "estado", "sha256", "ruta", "intentos", "error")
+        return dict(zip(claves, row))
+
+    def _actualizar(self, id_, **campos):
+        campos["actualizada"] = time.time()
+        conn = self._db()
+        try:
+            with conn:
+                conn.execute(f"UPDATE subidas SET {', '.join(f'{k} = ?' for k in campos)} WHERE id = ?",
+                             (*campos.values(), id_))
+        finally:
+            conn.close()
+
+    def _parcial(self, id_):
+        return os.path.join(self.staging, f"{id_}.part")
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    # ---------- recepción ----------
+
+    def iniciar(self, tag, nombre, size=None, max_bytes=None):
+        """Reserva una subida de `size` bytes (None si no se sabe). Devuelve el estado."""
+        limite = self.max_bytes if max_bytes is None else max_bytes
+        if size is not None and size > limite:
+            self._count("rejected")
+            raise DemasiadoGrande(_limite(limite))
+        id_ = uuid.uuid4().hex
+        ahora = time.time()
+        conn = self._db()
+        try:
+            with conn:
+                conn.execute("INSERT INTO subidas(id, tag, nombre, size, estado, creada, actualizada) "
+                             "VALUES (?, ?, ?, ?, 'recibiendo', ?, ?)", (id_, tag, nombre, size, ahora, ahora))
+        finally:
+            conn.close()
+        open(self._parcial(id_), "wb").close()
+        with self._lock:
+            self._hashes[id_] = (hashlib.sha256(), 0)
+            self._stats["started"] += 1
+        return self.estado(id_)
+
+    def _lock_de(self, id_):
+        with self._lock:
+            return self._por_id.setdefault(id_, threading.Lock())
+
+    def anexar(self, id_, offset, stream, max_bytes=None):
+        """
+        Agrega al archivo de `id_` lo que venga en `stream`, que empieza en
+        `offset`. Si con esto llega al tamaño declarado la subida se cierra y
+        se encola el traslado. Devuelve el estado.
+        """
+        with self._lock_de(id_):
+            fila = self._fila(id_)
+            if fila is None:
+                raise SubidaDesconocida("Subida desconocida.")
+            if fila["estado"] != "recibiendo":
+                raise SubidaError(f"La subida ya está {fila['estado']}.")
+            parcial = self._parcial(id_)
+            actual = os.path.getsize(parcial)
+            if offset != actual:
+                raise OffsetIncorrecto(actual)
+            limite = fila["size"] if fila["size"] is not None else (
+                self.max_bytes if max_bytes is None else max_bytes)
+            with self._lock:
+                h, hasheados = self._hashes.get(id_, (None, None))
+            # sobre una copia: si el tramo se rechaza o se corta, el hash
+            # guardado sigue siendo el de los `actual` bytes del archivo (sin
+            # hash, p. ej. tras un reinicio, se recalcula al cerrar)
+            h = h.copy() if h is not None and hasheados == actual else None
+            n = 0
+            with open(parcial, "ab") as f:
+                for bloque in iter(lambda: stream.read(_BLOQUE), b""):
+                    n += len(bloque)
+                    if actual + n > limite:
+                        f.truncate(actual)
+                        self._count("rejected")
+                        raise DemasiadoGrande(_limite(limite))
+                    f.write(bloque)
+                    if h is not None:
+                        h.update(bloque)
+            with self._lock:
+                self._stats["received_bytes"] += n
+                if h is not None:
+                    self._hashes[id_] = (h, actual + n)
+            if fila["size"] is not None and actual + n == fila["size"]:
+                self._cerrar(id_, fila)
+        return self.estado(id_)
+
+    def subir(self, tag, nombre, stream, max_bytes=None):
+        """Subida de una sola vez (formulario): recibe todo `stream` y encola el traslado."""
+        id_ = self.iniciar(tag, nombre, max_bytes=max_bytes)["id"]
+        try:
+            self.anexar(id_, 0, stream, max_bytes=max_bytes)
+        except SubidaError:
+            self._descartar(id_)
+            raise
+        with self._lock_de(id_):
+            self._cerrar(id_, self._fila(id_))
+        return self.estado(id_)
+
+    def _cerrar(self, id_, fila):
+        parcial = self._parcial(id_)
+        with self._lock:
+            h, hasheados = self._hashes.pop(id_, (None, None))
+        size = os.path.getsize(parcial)
+        if h is None or hasheados != size:
+            self._count("rehashed")
+            h = hashlib.sha256()
+            with open(parcial, "rb") as f:
+                for bloque in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(bloque)
+        self._actualizar(id_, estado="pendiente", size=size, sha256=h.hexdigest())
+        self._executor.submit(self._trasladar, id_)
+
+    def _descartar(self, id_):
+        with self._lock:
+            self._hashes.pop(id_, None)
+            self._por_id.pop(id_, None)
+        conn = self._db()
+        try:
+            with conn:
+                conn.execute("DELETE FROM subidas WHERE id = ?", (id_,))
+        finally:
+            conn.close()
+        try:
+            os.remove(self._parcial(id_))
+        except OSError:
+            pass
+
+    # ---------- traslado al share ----------
+
+    def _nombre_final(self, fila):
+        ext = os.path.splitext(fila["nombre"])[1].lower()
+        return f"{fila['tag']}-{fila['sha256'][:12]}{ext}"
+
+    def _existente(self, sha, size):
+        """Ruta en el share de un contenido ya subido (mismo hash), si sigue ahí."""
+        conn = self._db()
+        try:
+            row = conn.execute("SELECT ruta, size FROM contenidos WHERE sha256 = ?", (sha,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or row[1] != size:
+            return None
+        try:
+            st = self.fs.stat(row[0])
+        except FileNotFoundError:
+            return None
+        return row[0] if st.st_size == size else None
+
+    def _copiar(self, origen, final, size):
+        """Copia a un temporal junto al destino, fsync, verifica y renombra: nunca queda un archivo a medias."""
+        tmp = f"{final}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(origen, "rb") as src, self.fs.open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+                dst.flush()
+                os.fsync(dst.fileno())
+            if self.fs.stat(tmp).st_size != size:
+                raise OSError(f"copia incompleta de {origen!r}")
+            os.replace(tmp, final)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _trasladar(self, id_):
+        fila = self._fila(id_)
+        if fila is None or fila["estado"] != "pendiente":
+            return
+        parcial = self._parcial(id_)
+        try:
+            ruta = self._existente(fila["sha256"], fila["size"])
+            if ruta:
+                self._count("deduplicated")
+            else:
+                ruta = os.path.join(self.destino, self._nombre_final(fila))
+                os.makedirs(self.destino, exist_ok=True)
+                self._copiar(parcial, ruta, fila["size"])
+                conn = self._db()
+                try:
+                    with conn:
+                        conn.execute("INSERT OR REPLACE INTO contenidos(sha256, ruta, size) VALUES (?, ?, ?)",
+                                     (fila["sha256"], ruta, fila["size"]))
+                finally:
+                    conn.close()
+                with self._lock:
+                    self._stats["moved"] += 1
+                    self._stats["moved_bytes"] += fila["size"]
+            if self.al_terminar:
+                self.al_terminar(fila["tag"], ruta, fila["nombre"])
+        except Exception as e:
+            intentos = fila["intentos"] + 1
+            if intentos > self.reintentos:
+                self._count("failed")
+                log.error("subidas: no se pudo copiar %s (%s) al share tras %d intentos",
+                          id_, fila["nombre"], intentos, exc_info=True)
+                self._actualizar(id_, estado="error", intentos=intentos, error=str(e)[:500])
+                return
+            # sin bloquear el pool: se vuelve a encolar después de la espera
+            espera = self.espera * 2 ** (intentos - 1)
+            self._count("retries")
+            log.warning("subidas: fallo copiando %s al share (%s); reintento %d en %.0fs",
+                        id_, e, intentos, espera)
+            self._actualizar(id_, intentos=intentos, error=str(e)[:500])
+            t = threading.Timer(espera, self._executor.submit, (self._trasladar, id_))
+            t.daemon = True
+            t.start()
+            return
+        self._actualizar(id_, estado="listo", ruta=ruta, error=None)
+        with self._lock:
+            self._por_id.pop(id_, None)
+        try:
+            os.remove(parcial)
+        except OSError:
+            pass
+
+    # ---------- consulta y mantenimiento ----------
+
+    def estado(self, id_):
+        """{id, tag, nombre, size, offset, estado, ruta, intentos, error} o None."""
+        fila = self._fila(id_)
+        if fila is None:
+            return None
+        try:
+            fila["offset"] = os.path.getsize(self._parcial(id_))
+        except OSError:
+            fila["offset"] = fila["size"] if fila["estado"] == "listo" else 0
+        return fila
+
+    def reanudar(self):
+        """
+        Al arrancar: vuelve a encolar los traslados pendientes y borra las
+        subidas sin terminar de más de `abandonadas_h` horas.
+        """
+        limite = time.time() - self.abandonadas_h * 3600
+        conn = self._db()
+        try:
+            pendientes = [r[0] for r in conn.execute("SELECT id FROM subidas WHERE estado = 'pendiente'")]
+            viejas = [r[0] for r in conn.execute(
+                "SELECT id FROM subidas WHERE estado = 'recibiendo' AND actualizada < ?", (limite,))]
+        finally:
+            conn.close()
+        for id_ in viejas:
+            self._descartar(id_)
+        self._count("expired", len(viejas))
+        for id_ in pendientes:
+            self._executor.submit(self._trasladar, id_)
+        return {"requeued": len(pendientes), "expired": len(viejas)}
+
+    def stats(self):
+        conn = self._db()
+        try:
+            por_estado = dict(conn.execute("SELECT estado, COUNT(*) FROM subidas GROUP BY estado").fetchall())
+            contenidos = conn.execute("SELECT COUNT(*) FROM contenidos").fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            data = dict(self._stats)
+        data.update({"by_state": por_estado, "contents": contenidos, "max_bytes": self.max_bytes})
+        return data
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,8 @@
+"""
+Las pruebas usan los dobles del repo (fakedb, fakeshare) en vez de SQL
+Server y la carpeta de red: corren sin ODBC ni share.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+import fakeshare
+from autofill_cache import AutofillCache
+from share_io import CircuitBreaker, ShareIO, ShareTimeout
+
+
+@pytest.fixture
+def hoja(tmp_path):
+    p = tmp_path / "Entrega ACT-1.xlsx"
+    p.write_bytes(b"x" * 1000)
+    return str(p)
+
+
+def test_hit_por_stat_y_por_hash(tmp_path, hoja):
+    cache = AutofillCache(str(tmp_path / "c.sqlite3"), use_hash=True)
+    llamadas = []
+    extraer = lambda p: llamadas.append(p) or {"tag": "ACT-1"}
+    assert cache.get_or_extract(hoja, extraer) == ({"tag": "ACT-1"}, False)
+    assert cache.get_or_extract(hoja, extraer) == ({"tag": "ACT-1"}, True)
+    os.utime(hoja, (1, 1))   # mismo contenido, otro mtime: lo encuentra por hash
+    assert cache.get_or_extract(hoja, extraer) == ({"tag": "ACT-1"}, True)
+    assert len(llamadas) == 1
+    assert cache.stats()["hash_hits"] == 1
+
+
+def test_hash_con_share_colgado_corta_por_plazo(tmp_path, hoja):
+    fs = fakeshare.SlowFS(hang_paths=("Entrega",))
+    sio = ShareIO(workers=2, timeout=0.1, fs=fs, breaker=CircuitBreaker(5, 30))
+    try:
+        cache = AutofillCache(str(tmp_path / "c.sqlite3"), use_hash=True, share_io=sio)
+        with pytest.raises(ShareTimeout):
+            cache.get_or_extract(hoja, lambda p: {}, st=os.stat(hoja))
+    finally:
+        fs.recover()
+        sio.close()
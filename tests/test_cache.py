@@ -0,0 +1,31 @@
+from cache import Cache, LocalBackend
+
+
+def test_contadores_de_generacion_acotados():
+    b = LocalBackend(max_groups=8)
+    for i in range(100):
+        b.bump(("equipo", i))
+    assert len(b._gens) == 8
+    assert b.info()["groups"] == 8
+
+
+def test_expulsar_un_grupo_no_revive_entradas_viejas():
+    c = Cache(LocalBackend(max_groups=2), ttl=0)
+    assert c.get_or_load("a", (), lambda: "viejo") == "viejo"
+    c.invalidate("a")
+    for g in ("b", "c", "d"):          # empuja "a" fuera del LRU de grupos
+        c.invalidate(g)
+    assert "a" not in c.backend._gens
+    assert c.get_or_load("a", (), lambda: "nuevo") == "nuevo"
+
+
+def test_generacion_nunca_retrocede():
+    b = LocalBackend(max_groups=1)
+    vistos = {}
+    for i in range(50):
+        g = ("x", i % 3)
+        gen = b.generation(g)
+        assert gen >= vistos.get(g, 0)
+        vistos[g] = gen
+        b.bump(g)
+        assert b.generation(g) > gen
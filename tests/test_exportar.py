@@ -0,0 +1,45 @@
+import exportar
+
+COLUMNAS = [("tag", "Tag"), ("modelo", "Modelo")]
+
+
+class Filas:
+    """Generador de filas que registra si lo cerraron (como el de db._iterar)."""
+
+    def __init__(self, n):
+        self.cerrado = False
+        self._gen = ({"tag": f"ACT-{i}", "modelo": "T14"} for i in range(n))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._gen)
+
+    def close(self):
+        self.cerrado = True
+        self._gen.close()
+
+
+def test_csv_completo_cierra_las_filas():
+    filas = Filas(450)
+    texto = "".join(exportar.csv_stream(filas, COLUMNAS))
+    assert texto.startswith("\ufeffTag,Modelo")
+    assert texto.count("\n") == 451
+    assert filas.cerrado
+
+
+def test_csv_cliente_desconectado_cierra_las_filas():
+    filas = Filas(1000)
+    cuerpo = exportar.csv_stream(filas, COLUMNAS, por_bloque=10)
+    next(cuerpo)
+    cuerpo.close()   # lo que hace el servidor WSGI al cortarse la conexión
+    assert filas.cerrado
+
+
+def test_xlsx_cortado_en_el_limite_cierra_las_filas(monkeypatch):
+    monkeypatch.setattr(exportar, "MAX_FILAS_XLSX", 5)
+    filas = Filas(100)
+    datos = b"".join(exportar.xlsx_stream(filas, COLUMNAS))
+    assert datos[:2] == b"PK"
+    assert filas.cerrado
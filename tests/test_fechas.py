@@ -0,0 +1,28 @@
+import datetime as dt
+
+import pytest
+
+from fechas import parse_fecha
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("2024-05-01", dt.datetime(2024, 5, 1)),
+    ("2024-05-01T10:30", dt.datetime(2024, 5, 1, 10, 30)),
+    ("2024-05-01 10:30:15.250", dt.datetime(2024, 5, 1, 10, 30, 15, 250000)),
+    ("2024-5-1", dt.datetime(2024, 5, 1)),
+    ("2024-05-1", dt.datetime(2024, 5, 1)),
+    ("2024-05-01 9:30", dt.datetime(2024, 5, 1, 9, 30)),
+    ("2024-5-1T9:30:05", dt.datetime(2024, 5, 1, 9, 30, 5)),
+    ("01/05/2024", dt.datetime(2024, 5, 1)),
+    ("1.5.2024 10:30", dt.datetime(2024, 5, 1, 10, 30)),
+    (45413, dt.datetime(2024, 5, 1)),
+    (45413.5, dt.datetime(2024, 5, 1, 12)),
+    (dt.date(2024, 5, 1), dt.datetime(2024, 5, 1)),
+])
+def test_formatos_aceptados(valor, esperado):
+    assert parse_fecha(valor) == esperado
+
+
+@pytest.mark.parametrize("valor", ["", "  ", None, "2024", "20240115", "45413", "2024-13-01", "2024-5-", "ayer", True])
+def test_no_reconocidos(valor):
+    assert parse_fecha(valor) is None
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+import fakedb
+from pool import ConnectionPool, PoolTimeout
+
+
+@pytest.fixture
+def pool():
+    p = ConnectionPool(lambda: fakedb.connect(), minsize=0, maxsize=2, checkout_timeout=0.2)
+    yield p
+    p.close()
+
+
+def test_reutiliza_conexiones(pool):
+    for _ in range(5):
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            assert cur.fetchall()[0][0] == 1
+    st = pool.stats()
+    assert st["created"] == 1
+    assert st["reused"] == 4
+    assert st["in_use"] == 0
+
+
+def test_agotado_da_timeout_y_se_recupera(pool):
+    a = pool.acquire()
+    b = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.05)
+    pool.release(a)
+    with pool.connection():
+        pass
+    pool.release(b)
+    assert pool.stats()["in_use"] == 0
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_espera_hasta_que_se_libera(pool):
+    a = pool.acquire()
+    b = pool.acquire()
+    threading.Timer(0.05, pool.release, (a,)).start()
+    c = pool.acquire(timeout=1)
+    pool.release(b)
+    pool.release(c)
+    assert pool.stats()["in_use"] == 0
+
+
+def test_generador_cerrado_antes_de_tiempo_devuelve_la_conexion(pool):
+    def filas():
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1 UNION ALL SELECT 2")
+            yield from cur.fetchall()
+
+    for _ in range(3):   # más que maxsize: sin la devolución, el tercero se queda sin conexión
+        g = filas()
+        next(g)
+        g.close()
+    assert pool.stats()["in_use"] == 0
+    with pool.connection():
+        pass
+
+
+def test_excepcion_de_la_app_no_descarta_la_conexion(pool):
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError("x")
+    st = pool.stats()
+    assert st["in_use"] == 0 and st["discarded"] == 0 and st["idle"] == 1
+
+
+def test_conexion_rota_se_descarta(pool):
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.close()
+            raise RuntimeError("se cayó la red")
+    st = pool.stats()
+    assert st["in_use"] == 0 and st["discarded"] == 1 and st["size"] == 0
@@ -0,0 +1,32 @@
+import io
+import json
+import logging
+
+import pytest
+
+import registro
+
+
+@pytest.fixture
+def raiz():
+    root = logging.getLogger()
+    antes, nivel = list(root.handlers), root.level
+    yield root
+    for h in list(root.handlers):
+        if h not in antes:
+            root.removeHandler(h)
+    root.setLevel(nivel)
+
+
+def test_configurar_respeta_handlers_ajenos(raiz):
+    ajeno = logging.StreamHandler(io.StringIO())
+    raiz.addHandler(ajeno)
+    registro.configurar("INFO", stream=io.StringIO())
+    buf = io.StringIO()
+    registro.configurar("INFO", stream=buf)   # reemplaza solo el suyo
+    assert ajeno in raiz.handlers
+    assert sum(getattr(h, "_registro", False) for h in raiz.handlers) == 1
+    assert registro.configurado()
+    logging.getLogger("prueba").info("hola")
+    linea = json.loads(buf.getvalue().splitlines()[-1])
+    assert linea["logger"] == "prueba" and linea["msg"] == "hola"
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from share_index import ShareIndex, ShareNoDisponible
+from share_watcher import ShareWatcher
+
+
+@pytest.fixture
+def arbol(tmp_path):
+    root = tmp_path / "share"
+    (root / "2024" / "enero").mkdir(parents=True)
+    (root / "2024" / "febrero").mkdir()
+    (root / "ACT-0001 acta.pdf").write_bytes(b"a")
+    (root / "2024" / "enero" / "ACT-0002 entrega.xlsx").write_bytes(b"bb")
+    (root / "2024" / "febrero" / "ACT-0003 foto.jpg").write_bytes(b"ccc")
+    (root / "2024" / "febrero" / "notas.txt").write_bytes(b"x")
+    return root
+
+
+def _indice(root, tmp_path):
+    return ShareIndex(str(root), str(tmp_path / "idx" / "share.sqlite3"), exts={"pdf", "xlsx", "jpg"})
+
+
+def _nombres(ix, texto):
+    return sorted(f["name"] for f in ix.search(texto))
+
+
+def test_rebuild_y_busqueda(arbol, tmp_path):
+    ix = _indice(arbol, tmp_path)
+    res = ix.rebuild()
+    assert res["files"] == 3 and res["dirs"] == 4
+    assert _nombres(ix, "act-000") == ["ACT-0001 acta.pdf", "ACT-0002 entrega.xlsx", "ACT-0003 foto.jpg"]
+    assert _nombres(ix, "ENTREGA") == ["ACT-0002 entrega.xlsx"]
+    assert ix.search("notas") == []
+
+
+def test_refresh_incremental_relista_solo_lo_cambiado(arbol, tmp_path):
+    ix = _indice(arbol, tmp_path)
+    ix.rebuild()
+    (arbol / "2024" / "enero" / "ACT-0004 nueva.pdf").write_bytes(b"n")
+    os.remove(arbol / "ACT-0001 acta.pdf")
+    res = ix.refresh()
+    assert (res["added"], res["deleted"]) == (1, 1)
+    assert res["changed"] == 2   # la raíz y enero; 2024 y febrero solo con stat
+    assert _nombres(ix, "act-000") == ["ACT-0002 entrega.xlsx", "ACT-0003 foto.jpg", "ACT-0004 nueva.pdf"]
+
+
+def test_persiste_entre_instancias(arbol, tmp_path):
+    _indice(arbol, tmp_path).rebuild()
+    ix = _indice(arbol, tmp_path)
+    assert ix.built
+    assert _nombres(ix, "foto") == ["ACT-0003 foto.jpg"]
+
+
+def test_share_caido_no_borra_el_indice(arbol, tmp_path):
+    ix = _indice(arbol, tmp_path)
+    ix.rebuild()
+    os.rename(arbol, str(arbol) + ".off")
+    with pytest.raises(ShareNoDisponible):
+        ix.refresh()
+    with pytest.raises(ShareNoDisponible):
+        ix.rebuild()
+    assert len(ix.files()) == 3
+    assert _indice(arbol, tmp_path).built
+
+
+def test_carpeta_que_no_responde_se_conserva(arbol, tmp_path, monkeypatch):
+    ix = _indice(arbol, tmp_path)
+    ix.rebuild()
+    import share_index
+    caida = str(arbol / "2024")
+    original = share_index._check_dir
+    monkeypatch.setattr(share_index, "_check_dir",
+                        lambda d, previo, exts: None if d == caida else original(d, previo, exts))
+    for full in (False, True):
+        res = ix.refresh(full=full)
+        assert res["removed"] == 0 and res["files"] == 3
+
+
+def test_watcher_hace_un_barrido_completo_periodico(arbol, tmp_path):
+    ix = _indice(arbol, tmp_path)
+    ix.rebuild()
+    w = ShareWatcher(ix, full_every=3)
+    hoja = arbol / "2024" / "enero" / "ACT-0002 entrega.xlsx"
+    st = os.stat(hoja)
+    hoja.write_bytes(b"editada en sitio")   # reescribir no cambia el mtime de la carpeta
+    os.utime(hoja, (st.st_atime + 10, st.st_mtime + 10))
+    w.run_once()
+    w.run_once()
+    assert ix.search("entrega")[0]["size"] == 2    # el incremental no ve la edición
+    w.run_once()                                    # tercero: completo
+    assert ix.search("entrega")[0]["size"] == len(b"editada en sitio")
+    assert w.stats()["full_runs"] == 1
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+import fakeshare
+from share_io import CircuitBreaker, ShareIO, ShareTimeout, ShareUnavailable
+
+
+@pytest.fixture
+def archivo(tmp_path):
+    p = tmp_path / "ACT-1.pdf"
+    p.write_bytes(b"x" * 10)
+    return str(p)
+
+
+def _io(fs, threshold=2, reset=0.1, timeout=0.1):
+    return ShareIO(workers=4, timeout=timeout, fs=fs, breaker=CircuitBreaker(threshold, reset))
+
+
+def test_share_lento_responde_dentro_del_plazo(archivo):
+    sio = _io(fakeshare.SlowFS(latency=0.02))
+    try:
+        assert sio.stat(archivo).st_size == 10
+        assert sio.stat(archivo + ".no") is None
+        assert sio.stats()["circuit"] == "closed"
+    finally:
+        sio.close()
+
+
+def test_share_colgado_da_timeout_y_abre_el_circuito(archivo):
+    fs = fakeshare.SlowFS()
+    sio = _io(fs)
+    try:
+        fs.hang()
+        t0 = time.monotonic()
+        for _ in range(2):
+            with pytest.raises(ShareTimeout):
+                sio.stat(archivo)
+        assert time.monotonic() - t0 < 1
+        # circuito abierto: se rechaza sin esperar
+        with pytest.raises(ShareUnavailable):
+            sio.stat(archivo)
+        fs.recover()
+        time.sleep(0.15)
+        assert sio.stat(archivo).st_size == 10   # prueba de half_open
+        assert sio.stats()["circuit"] == "closed"
+    finally:
+        fs.recover()
+        sio.close()
+
+
+def test_ruta_invalida_en_half_open_no_traba_el_circuito(archivo):
+    fs = fakeshare.SlowFS()
+    sio = _io(fs)
+    try:
+        fs.hang()
+        for _ in range(2):
+            with pytest.raises(ShareTimeout):
+                sio.stat(archivo)
+        fs.recover()
+        time.sleep(0.15)
+        with pytest.raises(ValueError):
+            sio.isfile("ruta\x00pegada")   # la prueba de half_open falla por la ruta
+        assert sio.stat(archivo).st_size == 10
+        assert sio.stats()["circuit"] == "closed"
+    finally:
+        fs.recover()
+        sio.close()
+
+
+def test_stat_many_con_una_ruta_colgada(tmp_path, archivo):
+    fs = fakeshare.SlowFS(hang_paths=("colgada",))
+    sio = _io(fs, threshold=5)
+    try:
+        res = sio.stat_many([archivo, str(tmp_path / "colgada.pdf"), str(tmp_path / "no.pdf"), "mal\x00"])
+        assert res[archivo].st_size == 10
+        assert res[str(tmp_path / "no.pdf")] is None
+        assert str(tmp_path / "colgada.pdf") not in res and "mal\x00" not in res
+        st = sio.stats()
+        assert st["timeouts"] == 1 and st["errors"] == 1
+    finally:
+        fs.recover()
+        sio.close()